@@ -1,29 +1,31 @@
 import os
-import json
 import time
-import tempfile
-import numpy as np
+from contextlib import contextmanager
 import easyocr
-from PIL import Image, ImageEnhance, ImageFilter
+from easyocr.utils import reformat_input
 import torch
-import cv2
+from engine_cache import EngineCache, EngineWarming, warmup_image
+from image_pipeline import prepare_frame
+from metrics import NULL_TIMER
+from ocr_profiles import profile_settings, resolve_profile
+from text_lines import default_rec_batch_size
 
-# Global variables to manage OCR engine
-OCR_ENGINE = None
-CURRENT_LANG = None
+EASYOCR_ENGINE_MB = 1200  # Memory estimate per engine when psutil is not available
+DEFAULT_LANG = 'english'  # Language the server preloads unless told otherwise
 
-def initialize_ocr_engine(lang='english'):
+PROGRESSIVE_LINES = True  # process_image can hand out lines per recognition batch (on_lines)
+
+def resolve_engine_config(lang='english', profile=None):
     """
-    Initialize or reinitialize the OCR engine with the specified language.
+    Map a language and tuning profile to the reader they need.
     
     Args:
         lang (str): Language to use for OCR (default: 'english')
+        profile (str): Tuning profile name, None for the default profile
     
     Returns:
-        EasyOCR Reader: Initialized OCR engine
+        tuple: (EasyOCR language codes tuple, profile name), the engine cache key
     """
-    global OCR_ENGINE, CURRENT_LANG
-
     # Map language codes to EasyOCR language codes
     lang_map = {
         'japan': 'ja',
@@ -60,226 +62,219 @@ def initialize_ocr_engine(lang='english'):
     # Use mapped language or default to input if not in map
     easy_lang = lang_map.get(lang, lang)
 
-    # Only reinitialize if language has changed
-    if OCR_ENGINE is None or CURRENT_LANG != lang:
-        # Giải phóng tài nguyên của engine cũ nếu có
-        if OCR_ENGINE is not None and torch.cuda.is_available():
-            # Giải phóng bộ nhớ GPU
-            torch.cuda.empty_cache()
-            print("Released GPU resources from previous OCR engine")
-        # Check for GPU availability using PyTorch
-        if torch.cuda.is_available():
-            device_name = torch.cuda.get_device_name(0)
-            print(f"GPU is available: {device_name}. Using GPU for OCR.")
-            usegpu = True;
-        else:
-            print("GPU is not available. EasyOCR will use CPU.")
-            usegpu = False;
-
-        print(f"Initializing EasyOCR engine with language: {easy_lang}...")
-        start_time = time.time()
-
-        # For Japanese, we also add English as a secondary language
-        languages = [easy_lang]
-        if easy_lang == 'ja':
-            languages.append('en')
+    # For Japanese, we also add English as a secondary language
+    languages = [easy_lang]
+    if easy_lang == 'ja':
+        languages.append('en')
+    return (tuple(languages), resolve_profile(profile))
 
-        OCR_ENGINE = easyocr.Reader(languages, gpu=usegpu)
-        CURRENT_LANG = lang
-        initialization_time = time.time() - start_time
-        print(f"EasyOCR initialization completed in {initialization_time:.2f} seconds")
-        flag_file = os.path.join(tempfile.gettempdir(), "easyocr_ready.txt")
-        with open(flag_file, "w") as f:
-            f.write("READY")
-        print("Ready flag created!")
+def create_ocr_engine(config):
+    """
+    Build an EasyOCR reader for a set of EasyOCR language codes and a tuning profile.
+    
+    Args:
+        config (tuple): Value returned by resolve_engine_config
+    
+    Returns:
+        EasyOCR Reader: Initialized OCR engine
+    """
+    languages, profile = config
+    settings = profile_settings(profile, "easyocr")
+    
+    # Torch thread pools are process-wide, so the last reader built sets them for all
+    if "intra_op_threads" in settings:
+        torch.set_num_threads(settings["intra_op_threads"])
+    if "inter_op_threads" in settings:
+        try:
+            torch.set_num_interop_threads(settings["inter_op_threads"])
+        except RuntimeError as e:
+            # Only possible before torch has run anything in parallel
+            print(f"Cannot change torch inter-op threads: {e}")
+    
+    # Check for GPU availability using PyTorch; there is no DirectML backend, "dml" behaves like "auto"
+    if settings.get("provider") == "cpu":
+        print("Profile selects the CPU. EasyOCR will use CPU.")
+        usegpu = False;
+    elif torch.cuda.is_available():
+        device_name = torch.cuda.get_device_name(0)
+        print(f"GPU is available: {device_name}. Using GPU for OCR.")
+        usegpu = True;
     else:
-        print(f"Using existing EasyOCR engine with language: {easy_lang}")
+        print("GPU is not available. EasyOCR will use CPU.")
+        usegpu = False;
 
-    return OCR_ENGINE
+    return easyocr.Reader(list(languages), gpu=usegpu)
 
-def release_gpu_resources():
+def warmup_ocr_engine(engine):
     """
-    Release GPU resources by emptying the cache.
-    This function should be called when the OCR engine is no longer needed to free up GPU memory.
-    Note: This function is only applicable if the OCR engine is using a GPU.
+    Run one dummy inference so the first real request does not pay for lazy initialization.
+    
+    Args:
+        engine: Engine returned by create_ocr_engine
     """
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
+    engine.readtext(warmup_image(), detail=1)
 
-def preprocess_image_hdr(image, mode='auto'):
+# Initialized engines by model configuration, shared by every OCR worker thread
+ENGINE_CACHE = EngineCache("easyocr", create_ocr_engine, EASYOCR_ENGINE_MB, warmup_ocr_engine)
+
+def readtext_options(profile=None, gpu=False):
     """
-    Enhanced preprocessing for HDR tone-mapped images from GDI capture.
-    Uses CLAHE and bilateral filtering.
+    Keyword arguments for detect and recognize under a profile, and the lowest recognition score to keep.
+    
+    EasyOCR always limits the long side of the image, so det_limit_type does not apply.
+    readtext recognizes one line at a time unless told otherwise; without a rec_batch_size
+    in the profile the batch is sized for the device the reader runs on.
     
     Args:
-        image (PIL.Image): Input image
-        mode (str): 'auto', 'basic', or 'enhanced'
+        profile (str): Tuning profile name, None for the default profile
+        gpu (bool): Whether the reader runs on a GPU
     
     Returns:
-        PIL.Image: Preprocessed image
+        tuple: (detect keyword arguments, recognize keyword arguments, minimum score or None)
     """
-    # Convert PIL to numpy
-    img_np = np.array(image)
+    settings = profile_settings(profile, "easyocr")
+    detect_options = {}
+    recognize_options = {"batch_size": settings.get("rec_batch_size", default_rec_batch_size(gpu))}
+    if "det_limit_side_len" in settings:
+        detect_options["canvas_size"] = settings["det_limit_side_len"]
+    if settings.get("use_angle_cls"):
+        # EasyOCR has no angle classifier, it recognizes each box rotated as well and keeps the better reading
+        recognize_options["rotation_info"] = [180]
+    return detect_options, recognize_options, settings.get("text_score")
+
+def detect_and_recognize(ocr_engine, image, profile=None, timer=NULL_TIMER, on_lines=None):
+    """
+    Detect the text lines of a frame, then recognize the crops of all of them in batches.
     
-    # Convert to grayscale
-    if len(img_np.shape) == 3:
-        gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_np
+    This is what readtext does, split so the timer reports detection and recognition on
+    their own and recognition runs in batches (see readtext_options).
     
-    # Auto-detect if enhanced processing needed
-    if mode == 'auto':
-        mean_brightness = np.mean(gray)
-        std_brightness = np.std(gray)
-        
-        if std_brightness < 40 or mean_brightness > 200 or mean_brightness < 55:
-            mode = 'enhanced'
-            print(f"Auto-detected HDR artifacts (mean={mean_brightness:.1f}, std={std_brightness:.1f})")
-    
-    # Enhanced mode for HDR
-    if mode == 'enhanced':
-        # CLAHE for tone-mapped images
-        clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-        
-        # Bilateral filter (reduce noise, keep edges)
-        denoised = cv2.bilateralFilter(enhanced, 5, 50, 50)
-        
-        # Sharpen
-        kernel = np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])
-        sharpened = cv2.filter2D(denoised, -1, kernel=kernel)
-        
-        result = Image.fromarray(sharpened)
-        print("Applied CLAHE + bilateral filter + sharpening")
-    else:
-        # Basic preprocessing
-        result = image.convert('L')
-        enhancer = ImageEnhance.Contrast(result)
-        result = enhancer.enhance(2.0)
-        result = result.filter(ImageFilter.MedianFilter(size=3))
+    With on_lines, the boxes are recognized one batch per recognize call instead, and
+    on_lines gets the kept detections of each batch as soon as it is done.
     
-    return result.convert('RGB')
-
-def preprocess_image(image):
-    return preprocess_image_hdr(image, mode='auto')
+    Args:
+        ocr_engine (easyocr.Reader): Engine returned by create_ocr_engine
+        image (np.ndarray): RGB or grayscale frame
+        profile (str): Tuning profile name, None for the default profile
+        timer (StageTimer): Receives the detect and recognize stage laps
+        on_lines (callable): Gets the detections of each recognition batch, as they are returned.
+    
+    Returns:
+        list: [box, text, confidence] detections, as readtext returns them with detail=1
+    """
+    detect_options, recognize_options, min_score = readtext_options(profile, str(ocr_engine.device) != 'cpu')
+    img, img_cv_grey = reformat_input(image)
+    horizontal_list, free_list = ocr_engine.detect(img, reformat=False, **detect_options)
+    horizontal_list, free_list = horizontal_list[0], free_list[0]
+    timer.lap("detect")
+    # One recognize call for every box, or one per batch when each batch goes out on its own
+    if on_lines is None:
+        batches = [(horizontal_list, free_list)]
+    else:
+        step = max(1, recognize_options["batch_size"])
+        batches = [(horizontal_list[i:i + step], []) for i in range(0, len(horizontal_list), step)]
+        batches += [([], free_list[i:i + step]) for i in range(0, len(free_list), step)]
+    result = []
+    for horizontal, free in batches:
+        detections = ocr_engine.recognize(img_cv_grey, horizontal, free, detail=1, reformat=False, **recognize_options)
+        if min_score is not None:
+            detections = [detection for detection in detections if detection[2] >= min_score]
+        if on_lines is not None and detections:
+            on_lines(detections)
+        result.extend(detections)
+    timer.lap("recognize")
+    return result
 
-def upscale_image(image, min_width=1024, min_height=768):
+def initialize_ocr_engine(lang='english', profile=None):
     """
-    Upscale the image if its dimensions are below a specified threshold.
+    Return the OCR engine for the specified language, initializing it on this thread if needed.
     
     Args:
-        image (PIL.Image): Input image.
-        min_width (int): Minimum desired width.
-        min_height (int): Minimum desired height.
+        lang (str): Language to use for OCR (default: 'english')
+        profile (str): Tuning profile name, None for the default profile
     
     Returns:
-        tuple: (PIL.Image, float) Upscaled image if necessary, else original image, and the scale factor.
+        EasyOCR Reader: Initialized OCR engine
     """
-    width, height = image.size
-    scale = 1.0
-    if width < min_width or height < min_height:
-        scale = max(min_width / width, min_height / height)
-        new_size = (int(width * scale), int(height * scale))
-        print(f"Upscaling image from ({width}, {height}) to {new_size}")
-        # Use LANCZOS instead of ANTIALIAS which is deprecated in newer PIL
-        image = image.resize(new_size, Image.LANCZOS)
-    return image, scale
+    return ENGINE_CACHE.get(resolve_engine_config(lang, profile)).engine
 
-# Initialize with default language at module load time
-initialize_ocr_engine('english')
+@contextmanager
+def lease_ocr_engine(lang, wait=False, profile=None):
+    """
+    Hold the OCR engine for one inference.
+    
+    Inference is serialized per engine; engines for other languages, loading, preprocessing
+    and result conversion still run in parallel.
+    
+    Args:
+        lang (str): Language the engine must be initialized with
+        wait (bool): Initialize a missing engine on this thread instead of raising EngineWarming
+        profile (str): Tuning profile the engine must be built with, None for the default profile
+    
+    Yields:
+        The initialized OCR engine
+    """
+    with ENGINE_CACHE.lease(resolve_engine_config(lang, profile), wait) as engine:
+        yield engine
+
+def release_gpu_resources():
+    """
+    Release GPU resources by emptying the cache.
+    This function should be called when the OCR engine is no longer needed to free up GPU memory.
+    Note: This function is only applicable if the OCR engine is using a GPU.
+    """
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
-def process_image(image_path, lang='english', preprocess_images=True, upscale_if_needed=False, char_level="True"):
+def process_image(image_path, lang='english', preprocess_images=True, upscale_if_needed=False, char_level="True", timer=NULL_TIMER,
+                  profile=None, preprocess_session=None, on_lines=None):
     """
     Process an image using EasyOCR and return the OCR results.
     
     Args:
-        image_path (str): Path to the image to process.
+        image_path (str or np.ndarray): Path to the image to process, or an in-memory frame (see image_pipeline.read_frame).
         lang (str): Language to use for OCR (default: 'japan').
         font_path (str): Path to font file for drawing OCR results.
         preprocess_images (bool): Flag to determine whether to preprocess the image.
         upscale_if_needed (bool): Flag to determine whether to upscale the image if it's low resolution.
         char_level (bool): If True, split text into characters with their estimated positions.
+        timer (StageTimer): Receives the preprocess, inference and postprocess stage laps.
+        profile (str): Tuning profile name (see ocr_profiles.json), None for the default profile.
+        preprocess_session (str): Client stream whose preprocessing mode to use (see image_pipeline.PreprocessController), None to choose it for this frame alone.
+        on_lines (callable): Gets the line-level detections of each recognition batch as soon as it is recognized.
     
     Returns:
         dict: JSON-serializable dictionary with OCR results.
     """
     # Check if image exists
-    if not os.path.exists(image_path):
+    if isinstance(image_path, str) and not os.path.exists(image_path):
         return {"error": f"Image file not found: {image_path}"}
 
     try:
         # Start timing the OCR process
         start_time = time.time()
         
-        # Open the image using PIL
-        image = Image.open(image_path)
+        # Answer right away while the engine for this language is still warming up
+        ENGINE_CACHE.ensure(resolve_engine_config(lang, profile))
         
-        # Store original size for coordinate scaling later
-        # original_width, original_height = image.size
+        # Load, preprocess and upscale as requested; EasyOCR takes RGB arrays
+        img_array, scale = prepare_frame(image_path, preprocess_images, upscale_if_needed, 'RGB',
+                                         session=preprocess_session, timer=timer)
+        timer.lap("preprocess")
         
-        # Preprocess image if the flag is set
-        if preprocess_images:
-            print("Preprocessing image...")
-            image = preprocess_image(image)
+        batch_lines = None if on_lines is None else lambda detections: on_lines(convert_result(detections, scale, "False"))
         
-        # Upscale image if the flag is set, and get the scale factor
-        scale = 1.0
-        if upscale_if_needed:
-            print("Checking if upscaling is needed...")
-            image, scale = upscale_image(image)
-        
-        # Ensure OCR engine is initialized with the correct language
-        ocr_engine = initialize_ocr_engine(lang)
-        
-        # Use the initialized OCR engine
-        img_array = np.array(image)
-        # For character-level detail, we use EasyOCR's detail parameter
-        result = ocr_engine.readtext(img_array, detail=1)  # detail=1 ensures we get full detection data
+        # Use the OCR engine, initialized with the correct language
+        with lease_ocr_engine(lang, profile=profile) as ocr_engine:
+            result = detect_and_recognize(ocr_engine, img_array, profile, timer, batch_lines)
         
         # Calculate processing time
         processing_time = time.time() - start_time
         
         # Prepare the results
-        ocr_results = []
-        if result and len(result) > 0:
-            for detection in result:
-                # EasyOCR format: [[[x1,y1],[x2,y2],[x3,y3],[x4,y4]], text, confidence]
-                # or in some versions: [[x1,y1,x2,y2,x3,y3,x4,y4], text, confidence]
-                
-                # Convert box format if needed
-                box = detection[0]
-                if isinstance(box[0], (int, float)):
-                    # Convert flat format to nested format
-                    box = [
-                        [box[0], box[1]],
-                        [box[2], box[3]],
-                        [box[4], box[5]],
-                        [box[6], box[7]]
-                    ]
-                
-                # Convert coordinates back to the original image scale if upscaled
-                if scale != 1.0:
-                    box = [[coord / scale for coord in point] for point in box]
-                
-                # Convert all NumPy types to native Python types for JSON serialization
-                box_native = [[float(coord) for coord in point] for point in box]
-                
-                text = detection[1]
-                confidence = float(detection[2])
-                
-                if char_level == 'True' and len(text) > 1:
-                    # Estimate character positions - EasyOCR doesn't natively provide char-level boxes
-                    char_results = split_into_characters(text, box_native, confidence)
-                    ocr_results.extend(char_results)
-                else:
-                    # Keep the original word-level detection
-                    ocr_results.append({
-                        "rect": box_native,
-                        "text": text,
-                        "confidence": confidence,
-                        "is_character": False
-                    })
+        ocr_results = convert_result(result, scale, char_level)
         release_gpu_resources()
+        timer.lap("postprocess")
         return {
             "status": "success",
             "results": ocr_results,
@@ -287,6 +282,11 @@ def process_image(image_path, lang='english', preprocess_images=True, upscale_if
             "char_level": char_level
         }
     
+    except EngineWarming as e:
+        return {
+            "status": "warming",
+            "message": str(e)
+        }
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -295,6 +295,58 @@ def process_image(image_path, lang='english', preprocess_images=True, upscale_if
             "message": str(e)
         }
 
+def convert_result(result, scale=1.0, char_level="True"):
+    """
+    Convert EasyOCR detections to the server's result entries.
+    
+    Args:
+        result (list): [box, text, confidence] detections from detect_and_recognize.
+        scale (float): Upscaling applied to the frame, undone on the boxes.
+        char_level (str): 'True' to split the text into characters with estimated positions.
+    
+    Returns:
+        list: JSON-serializable result dictionaries.
+    """
+    ocr_results = []
+    for detection in result:
+        # EasyOCR format: [[[x1,y1],[x2,y2],[x3,y3],[x4,y4]], text, confidence]
+        # or in some versions: [[x1,y1,x2,y2,x3,y3,x4,y4], text, confidence]
+        
+        # Convert box format if needed
+        box = detection[0]
+        if isinstance(box[0], (int, float)):
+            # Convert flat format to nested format
+            box = [
+                [box[0], box[1]],
+                [box[2], box[3]],
+                [box[4], box[5]],
+                [box[6], box[7]]
+            ]
+        
+        # Convert coordinates back to the original image scale if upscaled
+        if scale != 1.0:
+            box = [[coord / scale for coord in point] for point in box]
+        
+        # Convert all NumPy types to native Python types for JSON serialization
+        box_native = [[float(coord) for coord in point] for point in box]
+        
+        text = detection[1]
+        confidence = float(detection[2])
+        
+        if char_level == 'True' and len(text) > 1:
+            # Estimate character positions - EasyOCR doesn't natively provide char-level boxes
+            char_results = split_into_characters(text, box_native, confidence)
+            ocr_results.extend(char_results)
+        else:
+            # Keep the original word-level detection
+            ocr_results.append({
+                "rect": box_native,
+                "text": text,
+                "confidence": confidence,
+                "is_character": False
+            })
+    return ocr_results
+
 def split_into_characters(text, box, confidence, max_chars=500):
     """
     Split a text string into individual characters with estimated bounding boxes.
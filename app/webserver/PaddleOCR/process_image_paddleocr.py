@@ -1,29 +1,29 @@
 import os
-import json
 import time
-import numpy as np
-import tempfile
-import cv2
-from PIL import Image, ImageEnhance, ImageFilter
+from contextlib import contextmanager
+import paddle
 from paddleocr import PaddleOCR
+from engine_cache import EngineCache, EngineWarming, warmup_image
+from image_pipeline import prepare_frame
+from metrics import NULL_TIMER
+from ocr_profiles import profile_settings, resolve_profile
+from text_lines import default_rec_batch_size
 # import torch
 
-# Global variables to manage OCR engine
-OCR_ENGINE = None
-CURRENT_LANG = None
+PADDLEOCR_ENGINE_MB = 600  # Memory estimate per engine when psutil is not available
+DEFAULT_LANG = 'en'  # Language the server preloads unless told otherwise
 
-def initialize_ocr_engine(lang='en'):
+def resolve_engine_config(lang='en', profile=None):
     """
-    Initialize or reinitialize the OCR engine with the specified language.
+    Map a language and tuning profile to the engine they need.
     
     Args:
         lang (str): Language to use for OCR (default: 'en')
+        profile (str): Tuning profile name, None for the default profile
     
     Returns:
-        PaddleOCR: Initialized OCR engine
+        tuple: (PaddleOCR language code, profile name), the engine cache key
     """
-    global OCR_ENGINE, CURRENT_LANG
-
     # Map language codes to PaddleOCR language codes
     lang_map = {
         'ja': 'japan',
@@ -58,168 +58,147 @@ def initialize_ocr_engine(lang='en'):
     }
 
     # Use mapped language or default to input if not in map
-    paddle_lang = lang_map.get(lang, lang)
-
-    # Only reinitialize if language has changed
-    if OCR_ENGINE is None or CURRENT_LANG != lang:
-        print(f"Initializing PaddleOCR engine with language: {paddle_lang}...")
-        start_time = time.time()
-
-        # Initialize PaddleOCR with the specified language and new parameters
-        OCR_ENGINE = PaddleOCR(
-            use_doc_orientation_classify=False,
-            use_doc_unwarping=False,
-            use_textline_orientation=False,
-            lang=paddle_lang
-        )
-        CURRENT_LANG = lang
-        initialization_time = time.time() - start_time
-        print(f"PaddleOCR initialization completed in {initialization_time:.2f} seconds")
-        flag_file = os.path.join(tempfile.gettempdir(), "paddleocr_ready.txt")
-        with open(flag_file, "w") as f:
-            f.write("READY")
-        print("Ready flag created!")
-    else:
-        print(f"Using existing PaddleOCR engine with language: {paddle_lang}")
+    return (lang_map.get(lang, lang), resolve_profile(profile))
 
-    return OCR_ENGINE
-
-def release_gpu_resources():
-    # if torch.cuda.is_available():
-    #     torch.cuda.empty_cache()
-    print("Released GPU resources after OCR processing")
+# PaddleOCR arguments set from the profile settings of the same meaning
+PROFILE_ARGUMENTS = {
+    "intra_op_threads": "cpu_threads",
+    "det_limit_type": "text_det_limit_type",
+    "det_limit_side_len": "text_det_limit_side_len",
+    "det_box_thresh": "text_det_box_thresh",
+    "text_score": "text_rec_score_thresh",
+    "rec_batch_size": "text_recognition_batch_size",
+    "use_angle_cls": "use_textline_orientation"
+}
+# Languages PaddleOCR gives the PP-OCRv5 server models by default; a "mobile" profile swaps in the mobile ones
+SERVER_MODEL_LANGS = ('ch', 'chinese_cht', 'en', 'japan')
 
-def preprocess_image_hdr(image, mode='auto'):
+def create_ocr_engine(config):
     """
-    Enhanced preprocessing for HDR tone-mapped images from GDI capture.
-    Uses CLAHE and bilateral filtering.
+    Build a PaddleOCR engine for a PaddleOCR language code and tuning profile.
     
     Args:
-        image (PIL.Image): Input image
-        mode (str): 'auto', 'basic', or 'enhanced'
+        config (tuple): Value returned by resolve_engine_config
     
     Returns:
-        PIL.Image: Preprocessed image
+        PaddleOCR: Initialized OCR engine
     """
-    # Convert PIL to numpy
-    img_np = np.array(image)
-    
-    # Convert to grayscale
-    if len(img_np.shape) == 3:
-        gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
+    paddle_lang, profile = config
+    settings = profile_settings(profile, "paddleocr")
+    arguments = {argument: settings[setting] for setting, argument in PROFILE_ARGUMENTS.items() if setting in settings}
+    arguments.setdefault("use_textline_orientation", False)
+    # Paddle has no DirectML backend, "dml" leaves the device choice to Paddle like "auto"
+    provider = settings.get("provider", "auto")
+    if provider == "cpu":
+        arguments["device"] = "cpu"
+    elif provider == "cuda":
+        arguments["device"] = "gpu:0"
+    # The pipeline recognizes the crops of every detected line together, one line per batch unless told otherwise
+    gpu = provider == "cuda" or (provider != "cpu" and paddle.device.is_compiled_with_cuda())
+    arguments.setdefault("text_recognition_batch_size", default_rec_batch_size(gpu))
+    # Naming the models makes PaddleOCR ignore lang, so only swap them where the pair is known
+    if settings.get("model_type") == "mobile" and paddle_lang in SERVER_MODEL_LANGS:
+        arguments["text_detection_model_name"] = "PP-OCRv5_mobile_det"
+        arguments["text_recognition_model_name"] = "PP-OCRv5_mobile_rec"
     else:
-        gray = img_np
+        arguments["lang"] = paddle_lang
     
-    # Auto-detect if enhanced processing needed
-    if mode == 'auto':
-        mean_brightness = np.mean(gray)
-        std_brightness = np.std(gray)
-        
-        if std_brightness < 40 or mean_brightness > 200 or mean_brightness < 55:
-            mode = 'enhanced'
-            print(f"Auto-detected HDR artifacts (mean={mean_brightness:.1f}, std={std_brightness:.1f})")
-    
-    # Enhanced mode for HDR
-    if mode == 'enhanced':
-        # CLAHE for tone-mapped images
-        clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-        
-        # Bilateral filter (reduce noise, keep edges)
-        denoised = cv2.bilateralFilter(enhanced, 5, 50, 50)
-        
-        # Sharpen
-        kernel = np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])
-        sharpened = cv2.filter2D(denoised, -1, kernel=kernel)
-        
-        result = Image.fromarray(sharpened)
-        print("Applied CLAHE + bilateral filter + sharpening")
-    else:
-        # Basic preprocessing
-        result = image.convert('L')
-        enhancer = ImageEnhance.Contrast(result)
-        result = enhancer.enhance(2.0)
-        result = result.filter(ImageFilter.MedianFilter(size=3))
+    # Initialize PaddleOCR with the specified language and new parameters
+    return PaddleOCR(
+        use_doc_orientation_classify=False,
+        use_doc_unwarping=False,
+        **arguments
+    )
+
+def warmup_ocr_engine(engine):
+    """
+    Run one dummy inference so the first real request does not pay for lazy initialization.
     
-    return result.convert('RGB')
+    Args:
+        engine: Engine returned by create_ocr_engine
+    """
+    engine.predict(warmup_image())
 
-def preprocess_image(image):
-    return preprocess_image_hdr(image, mode='auto')
+# Initialized engines by model configuration, shared by every OCR worker thread
+ENGINE_CACHE = EngineCache("paddleocr", create_ocr_engine, PADDLEOCR_ENGINE_MB, warmup_ocr_engine)
 
-def upscale_image(image, min_width=1024, min_height=768):
+def initialize_ocr_engine(lang='en', profile=None):
     """
-    Upscale the image if its dimensions are below a specified threshold.
+    Return the OCR engine for the specified language, initializing it on this thread if needed.
     
     Args:
-        image (PIL.Image): Input image.
-        min_width (int): Minimum desired width.
-        min_height (int): Minimum desired height.
+        lang (str): Language to use for OCR (default: 'en')
+        profile (str): Tuning profile name, None for the default profile
     
     Returns:
-        tuple: (PIL.Image, float) Upscaled image if necessary, else original image, and the scale factor.
+        PaddleOCR: Initialized OCR engine
     """
-    width, height = image.size
-    scale = 1.0
-    if width < min_width or height < min_height:
-        scale = max(min_width / width, min_height / height)
-        new_size = (int(width * scale), int(height * scale))
-        print(f"Upscaling image from ({width}, {height}) to {new_size}")
-        # Use LANCZOS instead of ANTIALIAS which is deprecated in newer PIL
-        image = image.resize(new_size, Image.LANCZOS)
-    return image, scale
+    return ENGINE_CACHE.get(resolve_engine_config(lang, profile)).engine
 
-# Initialize with default language at module load time
-initialize_ocr_engine('en')
+@contextmanager
+def lease_ocr_engine(lang, wait=False, profile=None):
+    """
+    Hold the OCR engine for one inference.
+    
+    Inference is serialized per engine; engines for other languages, loading, preprocessing
+    and result conversion still run in parallel.
+    
+    Args:
+        lang (str): Language the engine must be initialized with
+        wait (bool): Initialize a missing engine on this thread instead of raising EngineWarming
+        profile (str): Tuning profile the engine must be built with, None for the default profile
+    
+    Yields:
+        The initialized OCR engine
+    """
+    with ENGINE_CACHE.lease(resolve_engine_config(lang, profile), wait) as engine:
+        yield engine
 
-def process_image(image_path, lang='en', preprocess_images=True, upscale_if_needed=False, char_level="True"):
+def release_gpu_resources():
+    # if torch.cuda.is_available():
+    #     torch.cuda.empty_cache()
+    print("Released GPU resources after OCR processing")
+
+def process_image(image_path, lang='en', preprocess_images=True, upscale_if_needed=False, char_level="True", timer=NULL_TIMER,
+                  profile=None, preprocess_session=None):
     """
     Process an image using PaddleOCR and return the OCR results.
     
     Args:
-        image_path (str): Path to the image to process.
+        image_path (str or np.ndarray): Path to the image to process, or an in-memory frame (see image_pipeline.read_frame).
         lang (str): Language to use for OCR (default: 'en').
         preprocess_images (bool): Flag to determine whether to preprocess the image.
         upscale_if_needed (bool): Flag to determine whether to upscale the image if it's low resolution.
         char_level (bool): If True, split text into characters with their estimated positions.
+        timer (StageTimer): Receives the preprocess, inference and postprocess stage laps.
+        profile (str): Tuning profile name (see ocr_profiles.json), None for the default profile.
+        preprocess_session (str): Client stream whose preprocessing mode to use (see image_pipeline.PreprocessController), None to choose it for this frame alone.
     
     Returns:
         dict: JSON-serializable dictionary with OCR results.
     """
     # Check if image exists
-    if not os.path.exists(image_path):
+    if isinstance(image_path, str) and not os.path.exists(image_path):
         return {"error": f"Image file not found: {image_path}"}
 
     try:
         # Start timing the OCR process
         start_time = time.time()
         
-        # Open the image using PIL
-        image = Image.open(image_path)
-        
-        # Preprocess image if the flag is set
-        if preprocess_images:
-            print("Preprocessing image...")
-            image = preprocess_image(image)
+        # Answer right away while the engine for this language is still warming up
+        ENGINE_CACHE.ensure(resolve_engine_config(lang, profile))
         
-        # Upscale image if the flag is set, and get the scale factor
-        scale = 1.0
-        if upscale_if_needed:
-            print("Checking if upscaling is needed...")
-            image, scale = upscale_image(image)
+        # Load, preprocess and upscale as requested; PaddleOCR takes BGR arrays as they are
+        engine_input, scale = prepare_frame(image_path, preprocess_images, upscale_if_needed, 'BGR',
+                                             session=preprocess_session, timer=timer)
         
-        # Ensure OCR engine is initialized with the correct language
-        ocr_engine = initialize_ocr_engine(lang)
+        timer.lap("preprocess")
         
-        # Save the image temporarily if it's been modified
-        temp_image_path = image_path
-        if preprocess_images or (upscale_if_needed and scale != 1.0):
-            temp_image_path = f"{os.path.splitext(image_path)[0]}_temp.png"
-            image.save(temp_image_path)
-            print(f"Saved preprocessed image to {temp_image_path}")
-        
-        # Use the initialized OCR engine
-        result = ocr_engine.predict(temp_image_path)
-        print(f"OCR results received. Processing...")
+        # Use the OCR engine, initialized with the correct language
+        with lease_ocr_engine(lang, profile=profile) as ocr_engine:
+            result = ocr_engine.predict(engine_input)
+        timer.lap("inference")
+        print("OCR results received. Processing...")
         
         # Debug output to understand the result structure
         print(f"Result type: {type(result)}")
@@ -231,11 +210,6 @@ def process_image(image_path, lang='en', preprocess_images=True, upscale_if_need
                 if isinstance(result[0], dict):
                     print(f"Dictionary keys: {result[0].keys()}")
         
-        # Remove temporary file if created
-        if temp_image_path != image_path and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
-            print(f"Removed temporary file: {temp_image_path}")
-        
         # Calculate processing time
         processing_time = time.time() - start_time
         
@@ -517,6 +491,7 @@ def process_image(image_path, lang='en', preprocess_images=True, upscale_if_need
             import traceback
             traceback.print_exc()
         
+        timer.lap("postprocess")
         return {
             "status": "success",
             "results": ocr_results,
@@ -524,6 +499,11 @@ def process_image(image_path, lang='en', preprocess_images=True, upscale_if_need
             "char_level": char_level
         }
     
+    except EngineWarming as e:
+        return {
+            "status": "warming",
+            "message": str(e)
+        }
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -1,29 +1,49 @@
 import os
-import json
+import importlib.metadata
 import time
-import numpy as np
-import tempfile
-import cv2
-from PIL import Image, ImageEnhance, ImageFilter
+from collections import namedtuple
+from contextlib import contextmanager
 from rapidocr import RapidOCR, OCRVersion, ModelType, LangDet, LangRec, EngineType
+from engine_cache import EngineCache, EngineWarming, warmup_image
+from image_pipeline import prepare_frame
+from metrics import NULL_TIMER
+from ocr_profiles import profile_settings, resolve_profile
+from text_lines import LineCache, crop_text_lines, default_rec_batch_size
 # import torch
 
-# Global variables to manage OCR engine
-OCR_ENGINE = None
-CURRENT_LANG = None
+try:
+    from rapidocr.ch_ppocr_rec import TextRecInput
+except ImportError:
+    TextRecInput = None  # Older RapidOCR, recognition stays inside the engine call
 
-def initialize_ocr_engine(lang='en'):
+try:
+    RAPIDOCR_VERSION = importlib.metadata.version("rapidocr")
+except importlib.metadata.PackageNotFoundError:
+    RAPIDOCR_VERSION = "unknown"
+
+RAPIDOCR_ENGINE_MB = 150  # Memory estimate per engine when psutil is not available
+DEFAULT_LANG = 'en'  # Language the server preloads unless told otherwise
+DEFAULT_TEXT_SCORE = 0.5  # Lines recognized with a lower score are dropped, as RapidOCR does by default
+
+PROGRESSIVE_LINES = TextRecInput is not None  # process_image can hand out lines per recognition batch (on_lines)
+
+# Lines of a frame after detection and batched recognition, read like a RapidOCR result
+RecognizedLines = namedtuple('RecognizedLines', ['boxes', 'txts', 'scores'])
+
+def resolve_engine_config(lang='en', profile=None):
     """
-    Initialize or reinitialize the OCR engine with the specified language.
+    Map a language and tuning profile to the engine they need.
+    
+    Languages that share a model (en, fr, de, ... all use LATIN) share one cached engine
+    per profile.
     
     Args:
         lang (str): Language to use for OCR (default: 'en')
+        profile (str): Tuning profile name, None for the default profile
     
     Returns:
-        RapidOCR: Initialized OCR engine
+        tuple: (recognition model language type 'LATIN' or 'CH', profile name)
     """
-    global OCR_ENGINE, CURRENT_LANG
-
     # Note: RapidOCR might handle languages differently than PaddleOCR
 
     # Map language codes to PaddleOCR language codes
@@ -61,420 +81,575 @@ def initialize_ocr_engine(lang='en'):
 
     # Use mapped language or default to input if not in map
     rapid_lang = lang_map.get(lang, lang)
-    if rapid_lang == "LATIN":
-        lang_ocr = LangRec.LATIN
-    else:
-        lang_ocr = LangRec.CH
+    return ("LATIN" if rapid_lang == "LATIN" else "CH", resolve_profile(profile))
+
+# RapidOCR parameters set from the profile settings of the same meaning
+PROFILE_PARAMS = {
+    "intra_op_threads": "EngineConfig.onnxruntime.intra_op_num_threads",
+    "inter_op_threads": "EngineConfig.onnxruntime.inter_op_num_threads",
+    "det_limit_type": "Det.limit_type",
+    "det_limit_side_len": "Det.limit_side_len",
+    "det_box_thresh": "Det.box_thresh",
+    "text_score": "Global.text_score",
+    "rec_batch_size": "Rec.rec_batch_num",
+    "use_angle_cls": "Global.use_cls"
+}
+
+def create_ocr_engine(config):
+    """
+    Build a RapidOCR engine for a recognition model language type and tuning profile.
     
+    Args:
+        config (tuple): Value returned by resolve_engine_config
     
-    # Only reinitialize if language has changed or engine is not initialized
-    if OCR_ENGINE is None or CURRENT_LANG != lang:
-        print(f"Initializing RapidOCR engine with language: {lang}...")
-        start_time = time.time()
-
-        # Initialize RapidOCR
-        # Note: RapidOCR may have different initialization parameters
-        # Adjust as needed based on RapidOCR documentation
-        OCR_ENGINE = RapidOCR(params={"EngineConfig.onnxruntime.use_dml": True,
-                              "Global.text_score": 0.7,
-                              "Global.return_word_box": False,
-                              "Det.ocr_version": OCRVersion.PPOCRV4,
-                              "Rec.ocr_version": OCRVersion.PPOCRV5,
-                              "Det.lang_type": LangDet.EN,
-                              "Rec.lang_type": lang_ocr,
-                              "Det.engine_type": EngineType.ONNXRUNTIME,
-                              "Rec.engine_type": EngineType.ONNXRUNTIME,
-                              "Det.model_type": ModelType.MOBILE,
-                              "Rec.model_type": ModelType.MOBILE})
-        CURRENT_LANG = lang
-        
-        initialization_time = time.time() - start_time
-        print(f"RapidOCR initialization completed in {initialization_time:.2f} seconds")
-        flag_file = os.path.join(tempfile.gettempdir(), "rapidocr_ready.txt")
-        with open(flag_file, "w") as f:
-            f.write("READY")
-        print("Ready flag created!")
-    else:
-        print(f"Using existing RapidOCR engine with language: {lang}")
+    Returns:
+        RapidOCR: Initialized OCR engine
+    """
+    lang_type, profile = config
+    settings = profile_settings(profile, "rapidocr")
+    lang_ocr = LangRec.LATIN if lang_type == "LATIN" else LangRec.CH
+    provider = settings.get("provider", "auto")
+    # Only the Chinese detector and recognizer come as server models; the Chinese detector finds Latin text too
+    server = settings.get("model_type") == "server"
+    
+    params = {"EngineConfig.onnxruntime.use_dml": provider in ("auto", "dml"),
+              "EngineConfig.onnxruntime.use_cuda": provider == "cuda",
+              "Global.return_word_box": False,
+              "Det.ocr_version": OCRVersion.PPOCRV4,
+              "Rec.ocr_version": OCRVersion.PPOCRV5,
+              "Det.lang_type": LangDet.CH if server else LangDet.EN,
+              "Rec.lang_type": lang_ocr,
+              "Det.engine_type": EngineType.ONNXRUNTIME,
+              "Rec.engine_type": EngineType.ONNXRUNTIME,
+              "Det.model_type": ModelType.SERVER if server else ModelType.MOBILE,
+              "Rec.model_type": ModelType.SERVER if server and lang_type == "CH" else ModelType.MOBILE}
+    params.update({param: settings[setting] for setting, param in PROFILE_PARAMS.items() if setting in settings})
+    params.setdefault("Rec.rec_batch_num", default_rec_batch_size(provider != "cpu"))
+    return RapidOCR(params=params)
 
-    return OCR_ENGINE
+def inference_options(profile=None):
+    """
+    Keyword arguments for each engine call under a profile.
+    
+    RapidOCR resets the text score and box threshold on every call (to 0.5 unless given),
+    so setting them in the engine parameters alone has no effect.
+    """
+    settings = profile_settings(profile, "rapidocr")
+    options = {}
+    if "text_score" in settings:
+        options["text_score"] = settings["text_score"]
+    if "det_box_thresh" in settings:
+        options["box_thresh"] = settings["det_box_thresh"]
+    return options
 
-def release_gpu_resources():
-    # if torch.cuda.is_available():
-    #     torch.cuda.empty_cache()
-    print("Released GPU resources after OCR processing")
+def configured_stages(ocr_engine):
+    """
+    (use_det, use_cls, use_rec) as the engine was built.
+    
+    RapidOCR.__call__ keeps the stage flags of each call on the engine, so after a
+    detection-only call its use_cls attribute says False whatever the configuration is.
+    """
+    config = ocr_engine.cfg.Global
+    return config.use_det, config.use_cls, config.use_rec
 
-def preprocess_image_hdr(image, mode='auto'):
+def detect_and_recognize(ocr_engine, image, profile=None, timer=NULL_TIMER, model=None):
     """
-    Enhanced preprocessing for HDR tone-mapped images from GDI capture.
-    Uses CLAHE and bilateral filtering.
+    Detect the text lines of a frame, then recognize the crops of all of them in batches.
+    
+    Running the stages separately lets the timer report detection and recognition on their
+    own; recognition takes every line of the frame at once and works through them
+    Rec.rec_batch_num at a time (the profile's rec_batch_size). Without the stage API of
+    RapidOCR 3 the whole pipeline runs in one call, timed as "inference".
     
     Args:
-        image (PIL.Image): Input image
-        mode (str): 'auto', 'basic', or 'enhanced'
+        ocr_engine (RapidOCR): Engine returned by create_ocr_engine
+        image (np.ndarray): BGR frame
+        profile (str): Tuning profile name, None for the default profile
+        timer (StageTimer): Receives the detect and recognize stage laps
+        model: Engine configuration (see resolve_engine_config) to key LINE_CACHE entries
+            with, None to recognize every line
     
     Returns:
-        PIL.Image: Preprocessed image
+        RecognizedLines or RapidOCR output: boxes, txts and scores of the kept lines
     """
-    # Convert PIL to numpy
-    img_np = np.array(image)
+    return detect_and_recognize_batch(ocr_engine, [image], profile, [timer], model)[0]
+
+def detect_and_recognize_batch(ocr_engine, images, profile=None, timers=None, model=None, on_lines=None):
+    """
+    detect_and_recognize for several frames, recognizing the lines of all of them in one call.
     
-    # Convert to grayscale
-    if len(img_np.shape) == 3:
-        gray = cv2.cvtColor(img_np, cv2.COLOR_RGB2GRAY)
-    else:
-        gray = img_np
+    Detection runs frame by frame since frames differ in size; the line crops are all the same
+    height once the recognizer resizes them, so they batch across frames. Crops LINE_CACHE
+    has seen before keep their text and score, only the others go to the recognizer.
     
-    # Auto-detect if enhanced processing needed
-    if mode == 'auto':
-        mean_brightness = np.mean(gray)
-        std_brightness = np.std(gray)
-        
-        if std_brightness < 40 or mean_brightness > 200 or mean_brightness < 55:
-            mode = 'enhanced'
-            print(f"Auto-detected HDR artifacts (mean={mean_brightness:.1f}, std={std_brightness:.1f})")
-    
-    # Enhanced mode for HDR
-    if mode == 'enhanced':
-        # CLAHE for tone-mapped images
-        clahe = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8))
-        enhanced = clahe.apply(gray)
-        
-        # Bilateral filter (reduce noise, keep edges)
-        denoised = cv2.bilateralFilter(enhanced, 5, 50, 50)
-        
-        # Sharpen
-        kernel = np.array([[-1,-1,-1], [-1, 9,-1], [-1,-1,-1]])
-        sharpened = cv2.filter2D(denoised, -1, kernel=kernel)
-        
-        result = Image.fromarray(sharpened)
-        print("Applied CLAHE + bilateral filter + sharpening")
+    With on_lines, the lines are recognized one Rec.rec_batch_num batch per call instead, and
+    on_lines(frame index, RecognizedLines) gets the kept lines of each batch as soon as it is
+    done, after the lines LINE_CACHE already knew. Without the stage API it is never called.
+    
+    Returns:
+        list: One detect_and_recognize result per frame, in order.
+    """
+    timers = timers or [NULL_TIMER] * len(images)
+    options = inference_options(profile)
+    if TextRecInput is None or not hasattr(ocr_engine, "text_rec"):
+        results = []
+        for image, timer in zip(images, timers):
+            results.append(ocr_engine(image, **options))
+            timer.lap("inference")
+        return results
+    
+    use_det, use_cls, use_rec = configured_stages(ocr_engine)
+    frame_boxes = []
+    try:
+        for image, timer in zip(images, timers):
+            detection = ocr_engine(image, use_det=True, use_cls=False, use_rec=False, **options)
+            frame_boxes.append([] if detection.boxes is None else list(detection.boxes))
+            timer.lap("detect")
+    finally:
+        # Give the next plain engine call (warmup, older code paths) the configured stages back
+        ocr_engine.use_det, ocr_engine.use_cls, ocr_engine.use_rec = use_det, use_cls, use_rec
+    
+    crops = [crop for image, boxes in zip(images, frame_boxes) for crop in crop_text_lines(image, boxes)]
+    if model is not None:
+        keys, found = LINE_CACHE.lookup(model, crops)
     else:
-        # Basic preprocessing
-        result = image.convert('L')
-        enhancer = ImageEnhance.Contrast(result)
-        result = enhancer.enhance(2.0)
-        result = result.filter(ImageFilter.MedianFilter(size=3))
+        keys, found = [None] * len(crops), [None] * len(crops)
+    texts = [entry[0] if entry is not None else None for entry in found]
+    scores = [entry[1] if entry is not None else None for entry in found]
+    missing = [i for i, entry in enumerate(found) if entry is None]
+    min_score = options.get("text_score", DEFAULT_TEXT_SCORE)
+    
+    owners = [frame for frame, boxes in enumerate(frame_boxes) for _ in boxes]
+    all_boxes = [box for boxes in frame_boxes for box in boxes]
+    def report(indices):
+        """Hand the kept lines among the given crops to on_lines, frame by frame."""
+        by_frame = {}
+        for i in indices:
+            if texts[i] and scores[i] >= min_score:
+                by_frame.setdefault(owners[i], []).append((all_boxes[i], texts[i], scores[i]))
+        for frame, kept in by_frame.items():
+            on_lines(frame, RecognizedLines(*(list(column) for column in zip(*kept))))
+    
+    if on_lines is not None:
+        report([i for i, entry in enumerate(found) if entry is not None])
+    # One recognizer call for every line, or one per batch when each batch goes out on its own
+    step = ocr_engine.text_rec.rec_batch_num if on_lines is not None else len(missing)
+    for start in range(0, len(missing), max(1, step)):
+        chunk = missing[start:start + step]
+        unknown = [crops[i] for i in chunk]
+        if use_cls:
+            unknown = ocr_engine.text_cls(unknown).img_list
+        recognition = ocr_engine.text_rec(TextRecInput(img=unknown, return_word_box=False))
+        for i, text, score in zip(chunk, recognition.txts, recognition.scores):
+            texts[i], scores[i] = text, float(score)
+        LINE_CACHE.store([keys[i] for i in chunk], [texts[i] for i in chunk], [scores[i] for i in chunk])
+        if on_lines is not None:
+            report(chunk)
+    for timer in timers:
+        timer.lap("recognize")
+    
+    results = []
+    offset = 0
+    for boxes in frame_boxes:
+        kept = [
+            (box, text, score)
+            for box, text, score in zip(boxes, texts[offset:offset + len(boxes)], scores[offset:offset + len(boxes)])
+            if text and score >= min_score
+        ]
+        offset += len(boxes)
+        results.append(RecognizedLines(*(list(column) for column in zip(*kept))) if kept else RecognizedLines([], [], []))
+    return results
+
+def warmup_ocr_engine(engine):
+    """
+    Run one dummy inference so the first real request does not pay for lazy initialization.
     
-    return result.convert('RGB')
+    Args:
+        engine: Engine returned by create_ocr_engine
+    """
+    engine(warmup_image())
 
-def preprocess_image(image):
-    return preprocess_image_hdr(image, mode='auto')
+# Initialized engines by model configuration, shared by every OCR worker thread
+ENGINE_CACHE = EngineCache("rapidocr", create_ocr_engine, RAPIDOCR_ENGINE_MB, warmup_ocr_engine)
 
-def upscale_image(image, min_width=1024, min_height=768):
+# Text of the line crops recognized lately, shared by every engine of this module. Keys in
+# the on-disk store carry the RapidOCR version, since another version may read lines differently.
+LINE_CACHE = LineCache(f"rapidocr-{RAPIDOCR_VERSION}")
+
+def initialize_ocr_engine(lang='en', profile=None):
     """
-    Upscale the image if its dimensions are below a specified threshold.
+    Return the OCR engine for the specified language, initializing it on this thread if needed.
     
     Args:
-        image (PIL.Image): Input image.
-        min_width (int): Minimum desired width.
-        min_height (int): Minimum desired height.
+        lang (str): Language to use for OCR (default: 'en')
+        profile (str): Tuning profile name, None for the default profile
     
     Returns:
-        tuple: (PIL.Image, float) Upscaled image if necessary, else original image, and the scale factor.
+        RapidOCR: Initialized OCR engine
+    """
+    return ENGINE_CACHE.get(resolve_engine_config(lang, profile)).engine
+
+@contextmanager
+def lease_ocr_engine(lang, wait=False, profile=None):
     """
-    width, height = image.size
-    scale = 1.0
-    if width < min_width or height < min_height:
-        scale = max(min_width / width, min_height / height)
-        new_size = (int(width * scale), int(height * scale))
-        print(f"Upscaling image from ({width}, {height}) to {new_size}")
-        # Use LANCZOS instead of ANTIALIAS which is deprecated in newer PIL
-        image = image.resize(new_size, Image.LANCZOS)
-    return image, scale
+    Hold the OCR engine for one inference.
+    
+    Inference is serialized per engine; engines for other languages, loading, preprocessing
+    and result conversion still run in parallel.
+    
+    Args:
+        lang (str): Language the engine must be initialized with
+        wait (bool): Initialize a missing engine on this thread instead of raising EngineWarming
+        profile (str): Tuning profile the engine must be built with, None for the default profile
+    
+    Yields:
+        The initialized OCR engine
+    """
+    with ENGINE_CACHE.lease(resolve_engine_config(lang, profile), wait) as engine:
+        yield engine
 
-# Initialize with default language at module load time
-initialize_ocr_engine('en')
+def release_gpu_resources():
+    # if torch.cuda.is_available():
+    #     torch.cuda.empty_cache()
+    print("Released GPU resources after OCR processing")
 
-def process_image(image_path, lang='en', preprocess_images=True, upscale_if_needed=False, char_level="True"):
+def process_image(image_path, lang='en', preprocess_images=True, upscale_if_needed=False, char_level="True", timer=NULL_TIMER,
+                  profile=None, preprocess_session=None, on_lines=None):
     """
     Process an image using RapidOCR and return the OCR results.
     
     Args:
-        image_path (str): Path to the image to process.
+        image_path (str or np.ndarray): Path to the image to process, or an in-memory frame (see image_pipeline.read_frame).
         lang (str): Language to use for OCR (default: 'en').
         preprocess_images (bool): Flag to determine whether to preprocess the image.
         upscale_if_needed (bool): Flag to determine whether to upscale the image if it's low resolution.
         char_level (bool): If True, split text into characters with their estimated positions.
+        timer (StageTimer): Receives the preprocess, detect, recognize and postprocess stage laps.
+        profile (str): Tuning profile name (see ocr_profiles.json), None for the default profile.
+        preprocess_session (str): Client stream whose preprocessing mode to use (see image_pipeline.PreprocessController), None to choose it for this frame alone.
+        on_lines (callable): Gets the line-level detections of each recognition batch as soon as it is recognized.
     
     Returns:
         dict: JSON-serializable dictionary with OCR results.
     """
-    # Check if image exists
-    if not os.path.exists(image_path):
-        return {"error": f"Image file not found: {image_path}"}
+    frame_lines = None if on_lines is None else lambda _, detections: on_lines(detections)
+    return process_images([image_path], lang, preprocess_images, upscale_if_needed, char_level, [timer], profile,
+                          [preprocess_session], frame_lines)[0]
 
+def process_images(image_paths, lang='en', preprocess_images=True, upscale_if_needed=False, char_level="True", timers=None,
+                   profile=None, preprocess_sessions=None, on_lines=None):
+    """
+    Process several images with the same options under one engine lease.
+    
+    Each image is detected on its own, then the lines of all of them are recognized together,
+    so frames from different clients share recognition batches (see ocr_server's --batch-window).
+    
+    Args:
+        image_paths (list): Paths or in-memory frames, as for process_image.
+        timers (list): One StageTimer per image, None for no timing.
+        preprocess_sessions (list): preprocess_session of each image, None for none.
+        on_lines (callable): Called as on_lines(image index, detections) with the line-level
+            detections of each recognition batch as soon as it is recognized.
+        Other arguments as for process_image.
+    
+    Returns:
+        list: One result dictionary per image, in order.
+    """
+    timers = timers or [NULL_TIMER] * len(image_paths)
+    preprocess_sessions = preprocess_sessions or [None] * len(image_paths)
+    results = [None] * len(image_paths)
+    
+    # Start timing the OCR process
+    start_time = time.time()
     try:
-        # Start timing the OCR process
-        start_time = time.time()
-        
-        # Open the image using PIL
-        image = Image.open(image_path)
-        
-        # Preprocess image if the flag is set
-        if preprocess_images:
-            print("Preprocessing image...")
-            image = preprocess_image(image)
-        
-        # Upscale image if the flag is set, and get the scale factor
-        scale = 1.0
-        if upscale_if_needed:
-            print("Checking if upscaling is needed...")
-            image, scale = upscale_image(image)
-        
-        # Ensure OCR engine is initialized with the correct language
-        ocr_engine = initialize_ocr_engine(lang)
-        
-        # Save the image temporarily if it's been modified
-        temp_image_path = image_path
-        if preprocess_images or (upscale_if_needed and scale != 1.0):
-            temp_image_path = f"{os.path.splitext(image_path)[0]}_temp.png"
-            image.save(temp_image_path)
-            print(f"Saved preprocessed image to {temp_image_path}")
-        
-        # Use the initialized OCR engine
-        # RapidOCR can take a file path directly
-        result = ocr_engine(temp_image_path)
-        print(f"OCR results received. Processing...")
-        
+        # Answer right away while the engine for this language is still warming up
+        ENGINE_CACHE.ensure(resolve_engine_config(lang, profile))
+    except EngineWarming as e:
+        return [{"status": "warming", "message": str(e)} for _ in image_paths]
+    
+    frames = []  # (index, engine input, scale) of every image that loaded
+    for i, (image_path, timer, session) in enumerate(zip(image_paths, timers, preprocess_sessions)):
+        # Check if image exists
+        if isinstance(image_path, str) and not os.path.exists(image_path):
+            results[i] = {"error": f"Image file not found: {image_path}"}
+            continue
+        try:
+            # Frames of one batch are all prepared before the engine call, each in its own buffers
+            engine_input, scale = prepare_frame(image_path, preprocess_images, upscale_if_needed, 'BGR', slot=i,
+                                                session=session, timer=timer)
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            results[i] = {"status": "error", "message": str(e)}
+            continue
+        frames.append((i, engine_input, scale))
+        timer.lap("preprocess")
+    if not frames:
+        return results
+    
+    def frame_lines(position, lines):
+        index, _, scale = frames[position]
+        on_lines(index, convert_result(lines, scale, "False"))
+    
+    try:
+        # Use the OCR engine, initialized with the correct language
+        with lease_ocr_engine(lang, profile=profile) as ocr_engine:
+            recognized = detect_and_recognize_batch(
+                ocr_engine, [frame for _, frame, _ in frames], profile, [timers[i] for i, _, _ in frames],
+                resolve_engine_config(lang, profile), frame_lines if on_lines is not None else None
+            )
+    except EngineWarming as e:
+        for i, _, _ in frames:
+            results[i] = {"status": "warming", "message": str(e)}
+        return results
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        for i, _, _ in frames:
+            results[i] = {"status": "error", "message": str(e)}
+        return results
+    print(f"OCR results received for {len(frames)} image(s). Processing...")
+    
+    # Calculate processing time
+    processing_time = time.time() - start_time
+    
+    for (i, _, scale), result in zip(frames, recognized):
         # Debug output to understand the result structure
         print(f"Result type: {type(result)}")
+        results[i] = {
+            "status": "success",
+            "results": convert_result(result, scale, char_level),
+            "processing_time_seconds": float(processing_time),
+            "char_level": char_level
+        }
+        timers[i].lap("postprocess")
+    return results
+
+def convert_result(result, scale=1.0, char_level="True"):
+    """
+    Turn the lines the engine recognized into JSON-serializable detections.
+    
+    Args:
+        result: Value returned by detect_and_recognize.
+        scale (float): Factor the image was upscaled by; boxes are mapped back to the original size.
+        char_level (str): 'True' to split lines into characters with their estimated positions.
+    
+    Returns:
+        list: {"rect", "text", "confidence", "is_character"} detections.
+    """
+    ocr_results = []
+    
+    # Process the result based on RapidOCR's output format
+    try:
+        # Based on the example output, RapidOCR returns a named tuple with:
+        # boxes, txts, scores, word_results, elapse_list, elapse
         
-        # Remove temporary file if created
-        if temp_image_path != image_path and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
-            print(f"Removed temporary file: {temp_image_path}")
-        
-        # Calculate processing time
-        processing_time = time.time() - start_time
-        
-        # Prepare the results
-        ocr_results = []
-        
-        # Process the result based on RapidOCR's output format
-        try:
-            # Based on the example output, RapidOCR returns a named tuple with:
-            # boxes, txts, scores, word_results, elapse_list, elapse
+        # Check if result contains the expected attributes
+        if hasattr(result, 'boxes') and hasattr(result, 'txts') and hasattr(result, 'scores'):
+            boxes = result.boxes
+            texts = result.txts
+            scores = result.scores
             
-            # Check if result contains the expected attributes
-            if hasattr(result, 'boxes') and hasattr(result, 'txts') and hasattr(result, 'scores'):
-                boxes = result.boxes
-                texts = result.txts
-                scores = result.scores
-                
-                print(f"Found {len(texts)} text items")
-                
-                # Process each text detection
-                for i in range(len(texts)):
-                    if i < len(boxes) and i < len(scores):
-                        text = texts[i]
-                        box = boxes[i]
-                        confidence = float(scores[i]) if i < len(scores) else 0.0
-                        
-                        # Convert NumPy arrays to lists if needed
-                        if hasattr(box, 'tolist'):
-                            box = box.tolist()
-                        
-                        # Convert all coordinates to float for JSON serialization
-                        try:
-                            box_native = [[float(coord) for coord in point] for point in box]
-                        except Exception as e:
-                            print(f"Error converting box to box_native: {e}")
-                            print(f"Box: {box}")
-                            # Create a default box if conversion fails
-                            box_native = [[0, 0], [100, 0], [100, 30], [0, 30]]
-                        
-                        # Apply scaling if image was upscaled
-                        if scale != 1.0:
-                            box_native = [[coord / scale for coord in point] for point in box_native]
-                        
-                        if char_level == 'True' and len(text) > 1:
-                            # Estimate character positions
-                            char_results = split_into_characters(text, box_native, confidence)
-                            ocr_results.extend(char_results)
-                        else:
-                            # Keep the original word-level detection
-                            ocr_results.append({
-                                "rect": box_native,
-                                "text": text,
-                                "confidence": confidence,
-                                "is_character": False
-                            })
-            
-            # If result is a tuple or list with at least 3 elements (boxes, texts, scores)
-            elif isinstance(result, (tuple, list)) and len(result) >= 3:
-                boxes = result[0]
-                texts = result[1]
-                scores = result[2]
-                
-                print(f"Found {len(texts)} text items")
-                
-                # Process each text detection
-                for i in range(len(texts)):
-                    if i < len(boxes) and i < len(scores):
-                        text = texts[i]
-                        box = boxes[i]
-                        confidence = float(scores[i]) if i < len(scores) else 0.0
-                        
-                        # Convert NumPy arrays to lists if needed
-                        if hasattr(box, 'tolist'):
-                            box = box.tolist()
-                        
-                        # Convert all coordinates to float for JSON serialization
-                        try:
-                            box_native = [[float(coord) for coord in point] for point in box]
-                        except Exception as e:
-                            print(f"Error converting box to box_native: {e}")
-                            print(f"Box: {box}")
-                            # Create a default box if conversion fails
-                            box_native = [[0, 0], [100, 0], [100, 30], [0, 30]]
-                        
-                        # Apply scaling if image was upscaled
-                        if scale != 1.0:
-                            box_native = [[coord / scale for coord in point] for point in box_native]
-                        
-                        if char_level == 'True' and len(text) > 1:
-                            # Estimate character positions
-                            char_results = split_into_characters(text, box_native, confidence)
-                            ocr_results.extend(char_results)
-                        else:
-                            # Keep the original word-level detection
-                            ocr_results.append({
-                                "rect": box_native,
-                                "text": text,
-                                "confidence": confidence,
-                                "is_character": False
-                            })
+            print(f"Found {len(texts)} text items")
             
-            # If result is a list of detection results (each with box, text, score)
-            elif isinstance(result, list) and len(result) > 0 and isinstance(result[0], (list, tuple)) and len(result[0]) >= 2:
-                for detection in result:
+            # Process each text detection
+            for i in range(len(texts)):
+                if i < len(boxes) and i < len(scores):
+                    text = texts[i]
+                    box = boxes[i]
+                    confidence = float(scores[i]) if i < len(scores) else 0.0
+                    
+                    # Convert NumPy arrays to lists if needed
+                    if hasattr(box, 'tolist'):
+                        box = box.tolist()
+                    
+                    # Convert all coordinates to float for JSON serialization
                     try:
-                        # Each detection contains box and text with confidence
-                        # Format might be: [box, text, confidence] or [box, [text, confidence]]
-                        if len(detection) < 2:
-                            print(f"Warning: Detection doesn't have enough elements: {detection}")
-                            continue
-                            
-                        box = detection[0]
-                        
-                        # Handle different result formats
-                        if isinstance(detection[1], (list, tuple)) and len(detection[1]) >= 2:
-                            text = detection[1][0]
-                            confidence = float(detection[1][1])
-                        elif isinstance(detection[1], str):
-                            text = detection[1]
-                            confidence = float(detection[2]) if len(detection) > 2 else 0.0
-                        else:
-                            print(f"Warning: Unexpected result format: {detection}")
-                            continue
-                        
-                        # Convert coordinates back to the original image scale if upscaled
-                        if scale != 1.0:
-                            box = [[coord / scale for coord in point] for point in box]
-                        
-                        # Convert all NumPy types to native Python types for JSON serialization
                         box_native = [[float(coord) for coord in point] for point in box]
-                        
-                        if char_level == 'True' and len(text) > 1:
-                            # Estimate character positions
-                            char_results = split_into_characters(text, box_native, confidence)
-                            ocr_results.extend(char_results)
-                        else:
-                            # Keep the original word-level detection
-                            ocr_results.append({
-                                "rect": box_native,
-                                "text": text,
-                                "confidence": confidence,
-                                "is_character": False
-                            })
                     except Exception as e:
-                        print(f"Error processing detection: {e}")
-                        import traceback
-                        traceback.print_exc()
-                        continue
+                        print(f"Error converting box to box_native: {e}")
+                        print(f"Box: {box}")
+                        # Create a default box if conversion fails
+                        box_native = [[0, 0], [100, 0], [100, 30], [0, 30]]
+                    
+                    # Apply scaling if image was upscaled
+                    if scale != 1.0:
+                        box_native = [[coord / scale for coord in point] for point in box_native]
+                    
+                    if char_level == 'True' and len(text) > 1:
+                        # Estimate character positions
+                        char_results = split_into_characters(text, box_native, confidence)
+                        ocr_results.extend(char_results)
+                    else:
+                        # Keep the original word-level detection
+                        ocr_results.append({
+                            "rect": box_native,
+                            "text": text,
+                            "confidence": confidence,
+                            "is_character": False
+                        })
+        
+        # If result is a tuple or list with at least 3 elements (boxes, texts, scores)
+        elif isinstance(result, (tuple, list)) and len(result) >= 3:
+            boxes = result[0]
+            texts = result[1]
+            scores = result[2]
+            
+            print(f"Found {len(texts)} text items")
             
-            # If we still didn't process any results, log an error
-            if not ocr_results:
-                print("Warning: No OCR results were processed. Result format may not be supported.")
-                print(f"Result: {result}")
-                
-                # Try one more approach - directly access attributes if result is an object
+            # Process each text detection
+            for i in range(len(texts)):
+                if i < len(boxes) and i < len(scores):
+                    text = texts[i]
+                    box = boxes[i]
+                    confidence = float(scores[i]) if i < len(scores) else 0.0
+                    
+                    # Convert NumPy arrays to lists if needed
+                    if hasattr(box, 'tolist'):
+                        box = box.tolist()
+                    
+                    # Convert all coordinates to float for JSON serialization
+                    try:
+                        box_native = [[float(coord) for coord in point] for point in box]
+                    except Exception as e:
+                        print(f"Error converting box to box_native: {e}")
+                        print(f"Box: {box}")
+                        # Create a default box if conversion fails
+                        box_native = [[0, 0], [100, 0], [100, 30], [0, 30]]
+                    
+                    # Apply scaling if image was upscaled
+                    if scale != 1.0:
+                        box_native = [[coord / scale for coord in point] for point in box_native]
+                    
+                    if char_level == 'True' and len(text) > 1:
+                        # Estimate character positions
+                        char_results = split_into_characters(text, box_native, confidence)
+                        ocr_results.extend(char_results)
+                    else:
+                        # Keep the original word-level detection
+                        ocr_results.append({
+                            "rect": box_native,
+                            "text": text,
+                            "confidence": confidence,
+                            "is_character": False
+                        })
+        
+        # If result is a list of detection results (each with box, text, score)
+        elif isinstance(result, list) and len(result) > 0 and isinstance(result[0], (list, tuple)) and len(result[0]) >= 2:
+            for detection in result:
                 try:
-                    if hasattr(result, '__dict__'):
-                        result_dict = result.__dict__
-                        print(f"Result attributes: {result_dict.keys()}")
-                        
-                        # Look for common attribute names
-                        boxes_attr = next((attr for attr in ['boxes', 'box', 'bboxes', 'regions'] if attr in result_dict), None)
-                        texts_attr = next((attr for attr in ['txts', 'texts', 'text', 'words'] if attr in result_dict), None)
-                        scores_attr = next((attr for attr in ['scores', 'score', 'confidences', 'confidence'] if attr in result_dict), None)
+                    # Each detection contains box and text with confidence
+                    # Format might be: [box, text, confidence] or [box, [text, confidence]]
+                    if len(detection) < 2:
+                        print(f"Warning: Detection doesn't have enough elements: {detection}")
+                        continue
                         
-                        if boxes_attr and texts_attr:
-                            boxes = getattr(result, boxes_attr)
-                            texts = getattr(result, texts_attr)
-                            scores = getattr(result, scores_attr) if scores_attr else [0.0] * len(texts)
-                            
-                            print(f"Found {len(texts)} text items using attribute access")
-                            
-                            # Process each text detection
-                            for i in range(len(texts)):
-                                if i < len(boxes) and i < len(scores):
-                                    text = texts[i]
-                                    box = boxes[i]
-                                    confidence = float(scores[i]) if i < len(scores) else 0.0
-                                    
-                                    # Convert NumPy arrays to lists if needed
-                                    if hasattr(box, 'tolist'):
-                                        box = box.tolist()
-                                    
-                                    # Convert all coordinates to float for JSON serialization
-                                    try:
-                                        box_native = [[float(coord) for coord in point] for point in box]
-                                    except Exception as e:
-                                        print(f"Error converting box to box_native: {e}")
-                                        print(f"Box: {box}")
-                                        # Create a default box if conversion fails
-                                        box_native = [[0, 0], [100, 0], [100, 30], [0, 30]]
-                                    
-                                    # Apply scaling if image was upscaled
-                                    if scale != 1.0:
-                                        box_native = [[coord / scale for coord in point] for point in box_native]
-                                    
-                                    if char_level == 'True' and len(text) > 1:
-                                        # Estimate character positions
-                                        char_results = split_into_characters(text, box_native, confidence)
-                                        ocr_results.extend(char_results)
-                                    else:
-                                        # Keep the original word-level detection
-                                        ocr_results.append({
-                                            "rect": box_native,
-                                            "text": text,
-                                            "confidence": confidence,
-                                            "is_character": False
-                                        })
+                    box = detection[0]
+                    
+                    # Handle different result formats
+                    if isinstance(detection[1], (list, tuple)) and len(detection[1]) >= 2:
+                        text = detection[1][0]
+                        confidence = float(detection[1][1])
+                    elif isinstance(detection[1], str):
+                        text = detection[1]
+                        confidence = float(detection[2]) if len(detection) > 2 else 0.0
+                    else:
+                        print(f"Warning: Unexpected result format: {detection}")
+                        continue
+                    
+                    # Convert coordinates back to the original image scale if upscaled
+                    if scale != 1.0:
+                        box = [[coord / scale for coord in point] for point in box]
+                    
+                    # Convert all NumPy types to native Python types for JSON serialization
+                    box_native = [[float(coord) for coord in point] for point in box]
+                    
+                    if char_level == 'True' and len(text) > 1:
+                        # Estimate character positions
+                        char_results = split_into_characters(text, box_native, confidence)
+                        ocr_results.extend(char_results)
+                    else:
+                        # Keep the original word-level detection
+                        ocr_results.append({
+                            "rect": box_native,
+                            "text": text,
+                            "confidence": confidence,
+                            "is_character": False
+                        })
                 except Exception as e:
-                    print(f"Error trying to access result attributes: {e}")
-        
-        except Exception as e:
-            print(f"Error processing OCR results: {str(e)}")
-            import traceback
-            traceback.print_exc()
+                    print(f"Error processing detection: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    continue
         
-        return {
-            "status": "success",
-            "results": ocr_results,
-            "processing_time_seconds": float(processing_time),
-            "char_level": char_level
-        }
+        # If we still didn't process any results, log an error
+        if not ocr_results:
+            print("Warning: No OCR results were processed. Result format may not be supported.")
+            print(f"Result: {result}")
+            
+            # Try one more approach - directly access attributes if result is an object
+            try:
+                if hasattr(result, '__dict__'):
+                    result_dict = result.__dict__
+                    print(f"Result attributes: {result_dict.keys()}")
+                    
+                    # Look for common attribute names
+                    boxes_attr = next((attr for attr in ['boxes', 'box', 'bboxes', 'regions'] if attr in result_dict), None)
+                    texts_attr = next((attr for attr in ['txts', 'texts', 'text', 'words'] if attr in result_dict), None)
+                    scores_attr = next((attr for attr in ['scores', 'score', 'confidences', 'confidence'] if attr in result_dict), None)
+                    
+                    if boxes_attr and texts_attr:
+                        boxes = getattr(result, boxes_attr)
+                        texts = getattr(result, texts_attr)
+                        scores = getattr(result, scores_attr) if scores_attr else [0.0] * len(texts)
+                        
+                        print(f"Found {len(texts)} text items using attribute access")
+                        
+                        # Process each text detection
+                        for i in range(len(texts)):
+                            if i < len(boxes) and i < len(scores):
+                                text = texts[i]
+                                box = boxes[i]
+                                confidence = float(scores[i]) if i < len(scores) else 0.0
+                                
+                                # Convert NumPy arrays to lists if needed
+                                if hasattr(box, 'tolist'):
+                                    box = box.tolist()
+                                
+                                # Convert all coordinates to float for JSON serialization
+                                try:
+                                    box_native = [[float(coord) for coord in point] for point in box]
+                                except Exception as e:
+                                    print(f"Error converting box to box_native: {e}")
+                                    print(f"Box: {box}")
+                                    # Create a default box if conversion fails
+                                    box_native = [[0, 0], [100, 0], [100, 30], [0, 30]]
+                                
+                                # Apply scaling if image was upscaled
+                                if scale != 1.0:
+                                    box_native = [[coord / scale for coord in point] for point in box_native]
+                                
+                                if char_level == 'True' and len(text) > 1:
+                                    # Estimate character positions
+                                    char_results = split_into_characters(text, box_native, confidence)
+                                    ocr_results.extend(char_results)
+                                else:
+                                    # Keep the original word-level detection
+                                    ocr_results.append({
+                                        "rect": box_native,
+                                        "text": text,
+                                        "confidence": confidence,
+                                        "is_character": False
+                                    })
+            except Exception as e:
+                print(f"Error trying to access result attributes: {e}")
     
     except Exception as e:
+        print(f"Error processing OCR results: {str(e)}")
         import traceback
         traceback.print_exc()
-        return {
-            "status": "error",
-            "message": str(e)
-        }
+    
+    return ocr_results
 
 def split_into_characters(text, box, confidence, max_chars=500):
     """
@@ -0,0 +1,90 @@
+"""
+Measure what cross-client micro-batching trades: added latency against throughput.
+
+--clients simulated clients each send a frame of their own, wait for the result and send
+the next one, through the server's real OcrScheduler and run_ocr_task. This is repeated for
+every batch window. The script reports frames per second, latency percentiles and the
+average batch size. A window of 0 is the unbatched baseline.
+
+Usage: python bench_batching.py [--engine rapidocr] [--clients 4] [--windows 0 5 10 15]
+       [--workers 2] [--lines 30] [--duration 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_server
+from metrics import StageTimer
+from result_codec import FORMAT_JSON
+from bench_profiles import percentile
+from bench_recognition import make_frame
+
+def batch_counters(engine):
+    counters = ocr_server.metrics.snapshot()["counters"]
+    label = f"engine={engine}"
+    return (counters.get("ocr_batches_total", {}).get(label, 0),
+            counters.get("ocr_batched_frames_total", {}).get(label, 0))
+
+async def client(index, frame, options, latencies, stop_at):
+    """Send frames back to back until stop_at, recording each round trip."""
+    batch_key = (options.engine, options.lang, 'False', 'False', None)
+    while time.perf_counter() < stop_at:
+        start = time.perf_counter()
+        future = ocr_server.ocr_scheduler.submit(
+            ("client", index), ocr_server.run_ocr_task, options.engine, frame, options.lang, 'False', 'False',
+            None, FORMAT_JSON, None, None, StageTimer(), False, None, batch_key=batch_key
+        )
+        await future
+        latencies.append(time.perf_counter() - start)
+
+async def run(window_ms, frames, options):
+    ocr_server.ocr_scheduler = ocr_server.OcrScheduler(
+        options.workers, 2 * options.clients, window_ms / 1000, options.max_batch, ocr_server.run_ocr_batch
+    )
+    batches_before, batched_before = batch_counters(options.engine)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        client(index, frame, options, latencies, start + options.duration) for index, frame in enumerate(frames)
+    ))
+    elapsed = time.perf_counter() - start
+    ocr_server.ocr_scheduler.stop()
+    batches_after, batched_after = batch_counters(options.engine)
+    batches = batches_after - batches_before
+    batched = batched_after - batched_before
+    # Jobs that ran alone are batches of one
+    mean_batch = len(latencies) / (batches + len(latencies) - batched)
+    return len(latencies) / elapsed, latencies, mean_batch
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching latency/throughput benchmark")
+    parser.add_argument("--engine", default="rapidocr", choices=sorted(ocr_server.OCR_ENGINES))
+    parser.add_argument("--lang", default=None, help="Language (default: the engine's default language)")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 5, 10, 15], help="Batch windows in ms")
+    parser.add_argument("--workers", type=int, default=ocr_server.MAX_WORKERS)
+    parser.add_argument("--max-batch", type=int, default=ocr_server.MAX_BATCH)
+    parser.add_argument("--lines", type=int, default=30, help="Text lines per synthetic frame")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per window")
+    options = parser.parse_args()
+
+    # Each client sends the same frame over and over; recognize it every time
+    ocr_server.line_cache_entries = 0
+    module = ocr_server.load_engine(options.engine)
+    options.lang = options.lang or module.DEFAULT_LANG
+    module.initialize_ocr_engine(options.lang)
+    frames = [make_frame(options.lines, seed=index) for index in range(options.clients)]
+
+    print(f"{options.engine}, {options.clients} clients, {options.workers} workers, {options.lines} lines per frame")
+    print(f"  {'window ms':>9} {'frames/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'batch':>6}")
+    for window in options.windows:
+        throughput, latencies, mean_batch = asyncio.run(run(window, frames, options))
+        print(f"  {window:>9g} {throughput:>9.2f} {percentile(latencies, 0.5) * 1000:>9.1f}"
+              f" {percentile(latencies, 0.95) * 1000:>9.1f} {mean_batch:>6.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Show where zlib response compression pays off for a local and a LAN client.
+
+For char-level results of growing size, in both the JSON and the binary format, the
+benchmark measures compression and decompression time. It then compares the total
+time to deliver a response (compress + transfer + decompress) with sending the payload
+as is. Loopback throughput is measured over a real TCP connection. LAN links are
+modelled from their bandwidth.
+
+Usage: python bench_compression.py [--lan-mbit 1000 100 30] [--levels 1 6]
+"""
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_codec import COMPRESSION_THRESHOLD, encode_result
+from bench_result_codec import make_result
+
+# Kana and common kanji, like a dense visual-novel text box
+JAPANESE = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんアイウエオ日本語会話時間今何私"
+
+def measure(func, repeat):
+    """Average seconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+def loopback_bandwidth(size=64 * 1024 * 1024):
+    """Measure TCP loopback throughput in bytes per second."""
+    server = socket.create_server(('127.0.0.1', 0))
+    port = server.getsockname()[1]
+    data = b'\0' * (1024 * 1024)
+    
+    def sink():
+        connection, _ = server.accept()
+        with connection:
+            remaining = size
+            while remaining > 0:
+                remaining -= len(connection.recv(1024 * 1024))
+            connection.sendall(b'!')
+    
+    thread = threading.Thread(target=sink)
+    thread.start()
+    with socket.create_connection(('127.0.0.1', port)) as client:
+        start = time.perf_counter()
+        for _ in range(size // len(data)):
+            client.sendall(data)
+        client.recv(1)
+        elapsed = time.perf_counter() - start
+    thread.join()
+    server.close()
+    return size / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Response compression benchmark")
+    parser.add_argument("--detections", type=int, nargs="+", default=[50, 200, 800, 3000])
+    parser.add_argument("--lan-mbit", type=float, nargs="+", default=[1000, 100, 30])
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6])
+    parser.add_argument("--repeat", type=int, default=50)
+    options = parser.parse_args()
+    
+    links = [("loopback", loopback_bandwidth())]
+    links += [(f"{mbit:g} Mbit", mbit * 1e6 / 8) for mbit in options.lan_mbit]
+    print("Links: " + ", ".join(f"{name} {bandwidth / 1e6:.0f} MB/s" for name, bandwidth in links))
+    print(f"Default compression threshold: {COMPRESSION_THRESHOLD} bytes\n")
+    
+    header = f"{'payload':<16}{'bytes':>9}{'level':>6}{'ratio':>7}{'comp ms':>9}{'decomp ms':>10}"
+    header += "".join(f"{name:>14}" for name, _ in links)
+    print(header)
+    for detections in options.detections:
+        result = make_result(detections, JAPANESE)
+        payloads = [
+            ("json", json.dumps(result, ensure_ascii=False).encode('utf-8')),
+            ("binary", encode_result(result))
+        ]
+        for name, payload in payloads:
+            for level in options.levels:
+                compressed = zlib.compress(payload, level)
+                compress_time = measure(lambda: zlib.compress(payload, level), options.repeat)
+                decompress_time = measure(lambda: zlib.decompress(compressed), options.repeat)
+                row = f"{f'{name} x{detections}':<16}{len(payload):>9}{level:>6}{len(payload) / len(compressed):>7.1f}"
+                row += f"{compress_time * 1000:>9.3f}{decompress_time * 1000:>10.3f}"
+                # Time saved per response by compressing, negative when it costs more than it saves
+                for _, bandwidth in links:
+                    plain = len(payload) / bandwidth
+                    packed = compress_time + len(compressed) / bandwidth + decompress_time
+                    row += f"{(plain - packed) * 1000:>+12.2f}ms"
+                print(row)
+    print("\nLink columns: milliseconds saved per response by compressing (negative = slower).")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare full passes with incremental OCR on frames where only a dialogue box changes.
+
+The frames are a dense synthetic screen (see bench_recognition) with a dialogue box at the
+bottom whose text is replaced every frame, like a visual novel. Every frame is recognized
+with a full pass and through an IncrementalSession. The script reports the latency of both,
+how the session handled the frames, and how many detections differ between the two.
+
+Usage: python bench_incremental.py [--engine rapidocr] [--lines 40] [--frames 30] [--box-height 200]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import Counter
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import incremental_ocr
+from metrics import StageTimer
+from bench_profiles import load_module, percentile
+from bench_recognition import WORDS, make_frame
+from ocr_server import OCR_ENGINES
+
+def dialogue_frames(base, count, box_height, seed=0):
+    """Copies of base with a new line of dialogue in a box along the bottom of each."""
+    random.seed(seed)
+    height, width = base.shape[:2]
+    frames = []
+    for _ in range(count):
+        frame = base.copy()
+        cv2.rectangle(frame, (40, height - box_height - 20), (width - 40, height - 20), (30, 30, 60), -1)
+        text = " ".join(random.choice(WORDS) for _ in range(random.randint(3, 7)))
+        cv2.putText(frame, text, (80, height - box_height // 2 - 20), cv2.FONT_HERSHEY_SIMPLEX, 1.2,
+                    (240, 240, 240), 2, cv2.LINE_AA)
+        frames.append(frame)
+    return frames
+
+def texts(result):
+    return Counter(detection["text"] for detection in result["results"])
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental OCR benchmark")
+    parser.add_argument("--engine", default="rapidocr", choices=sorted(OCR_ENGINES))
+    parser.add_argument("--lang", default=None, help="Language (default: the engine's default language)")
+    parser.add_argument("--profile", default=None)
+    parser.add_argument("--lines", type=int, default=40, help="Text lines on the static part of the screen")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--box-height", type=int, default=200, help="Height of the dialogue box in pixels")
+    options = parser.parse_args()
+
+    module = load_module(options.engine)
+    lang = options.lang or module.DEFAULT_LANG
+    module.initialize_ocr_engine(lang, options.profile)
+    frames = dialogue_frames(make_frame(options.lines), options.frames, options.box_height)
+
+    def recognize(image):
+        result = module.process_image(image, lang=lang, preprocess_images=False, char_level='False',
+                                      profile=options.profile)
+        if result.get("status") != "success":
+            raise SystemExit(f"OCR failed: {result.get('message')}")
+        return result
+
+    session = incremental_ocr.IncrementalSession()
+    full_times, incremental_times, diff_times = [], [], []
+    modes = Counter()
+    mismatched = 0
+    for frame in frames:
+        start = time.perf_counter()
+        full = recognize(frame)
+        full_times.append(time.perf_counter() - start)
+
+        timer = StageTimer()
+        start = time.perf_counter()
+        result, mode = session.process(frame, (options.engine, lang), recognize, timer)
+        incremental_times.append(time.perf_counter() - start)
+        diff_times.append(timer.stages.get("diff", 0.0))
+        modes[mode] += 1
+        # Detections found by one pass and not the other
+        mismatched += sum(((texts(full) - texts(result)) + (texts(result) - texts(full))).values())
+
+    # The first frame is always a full pass, leave it out of the incremental numbers
+    steady = incremental_times[1:] or incremental_times
+    print(f"{options.engine}, lang {lang}, {options.lines} static lines, {options.frames} frames, "
+          f"{options.box_height} px dialogue box")
+    print(f"  full pass    p50 {percentile(full_times, 0.5) * 1000:8.1f} ms  p95 {percentile(full_times, 0.95) * 1000:8.1f} ms")
+    print(f"  incremental  p50 {percentile(steady, 0.5) * 1000:8.1f} ms  p95 {percentile(steady, 0.95) * 1000:8.1f} ms"
+          f"  (diff {percentile(diff_times, 0.5) * 1000:.2f} ms)")
+    print(f"  speedup {percentile(full_times, 0.5) / percentile(steady, 0.5):.1f}x, frames: "
+          + ", ".join(f"{count} {mode}" for mode, count in sorted(modes.items())))
+    print(f"  detections differing from the full passes: {mismatched}")
+
+if __name__ == "__main__":
+    main()
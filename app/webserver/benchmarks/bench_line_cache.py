@@ -0,0 +1,68 @@
+"""
+Measure what the line crop cache saves on frames where most lines stay the same.
+
+The frames are those of bench_incremental: a dense static screen with a dialogue box whose
+text changes every frame. Each frame gets a full pass, once with the engine module's
+LINE_CACHE off and once with it on. The script reports the recognize stage of both, the
+cache's hit rate and how many detections differ between the two runs.
+
+Usage: python bench_line_cache.py [--engine rapidocr] [--lines 40] [--frames 30]
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import StageTimer
+from text_lines import LINE_CACHE_SIZE
+from bench_profiles import load_module, percentile
+from bench_incremental import dialogue_frames
+from bench_recognition import make_frame
+from ocr_server import OCR_ENGINES
+
+def run(module, frames, lang, profile):
+    """Recognize every frame; returns the recognize stage times and the detected texts per frame."""
+    times, texts = [], []
+    for frame in frames:
+        timer = StageTimer()
+        result = module.process_image(frame, lang=lang, preprocess_images=False, char_level='False',
+                                      timer=timer, profile=profile)
+        if result.get("status") != "success":
+            raise SystemExit(f"OCR failed: {result.get('message')}")
+        times.append(timer.stages.get("recognize", timer.stages.get("inference", 0.0)))
+        texts.append(Counter(detection["text"] for detection in result["results"]))
+    return times, texts
+
+def main():
+    parser = argparse.ArgumentParser(description="Line crop cache benchmark")
+    parser.add_argument("--engine", default="rapidocr", choices=sorted(OCR_ENGINES))
+    parser.add_argument("--lang", default=None, help="Language (default: the engine's default language)")
+    parser.add_argument("--profile", default=None)
+    parser.add_argument("--lines", type=int, default=40, help="Text lines on the static part of the screen")
+    parser.add_argument("--frames", type=int, default=30)
+    options = parser.parse_args()
+
+    module = load_module(options.engine)
+    if not hasattr(module, "LINE_CACHE"):
+        raise SystemExit(f"{options.engine} recognizes inside its engine call and has no line cache")
+    lang = options.lang or module.DEFAULT_LANG
+    module.initialize_ocr_engine(lang, options.profile)
+    frames = dialogue_frames(make_frame(options.lines), options.frames, 200)
+
+    uncached, uncached_texts = run(module, frames, lang, options.profile)
+    module.LINE_CACHE.configure(LINE_CACHE_SIZE)
+    cached, cached_texts = run(module, frames, lang, options.profile)
+    status = module.LINE_CACHE.status()
+    differing = sum(sum(((a - b) + (b - a)).values()) for a, b in zip(uncached_texts, cached_texts))
+
+    # The first frame fills the cache, leave it out
+    cached = cached[1:] or cached
+    print(f"{options.engine}, lang {lang}, {options.lines} static lines, {options.frames} frames")
+    print(f"  recognize without cache  p50 {percentile(uncached, 0.5) * 1000:8.1f} ms")
+    print(f"  recognize with cache     p50 {percentile(cached, 0.5) * 1000:8.1f} ms  hit rate {status['hit_rate']:.1%}")
+    print(f"  detections differing: {differing}")
+
+if __name__ == "__main__":
+    main()
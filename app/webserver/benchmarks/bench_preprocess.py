@@ -0,0 +1,121 @@
+"""
+Compare frame preparation through image_pipeline with the PIL chain the engine modules used before.
+
+Both paths load a frame, optionally run the HDR preprocessing and upscale it, and hand back
+the BGR array an engine gets. The script reports the time per frame, the peak of memory
+allocated per frame in frames' worth of pixels (tracemalloc, which sees NumPy arrays and
+PIL images but not PIL's internal scratch buffers), and how many scratch buffers
+image_pipeline still creates per frame once it is warm.
+
+It then compares the cost of choosing the preprocessing mode: full-frame statistics on
+every frame, as before, against a PreprocessController that keeps its decision within a scene.
+
+Usage: python bench_preprocess.py [--frames 50] [--lines 40]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import cv2
+from PIL import Image, ImageEnhance, ImageFilter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import image_pipeline
+from bench_profiles import percentile
+from bench_recognition import make_frame
+
+def legacy_prepare(source, preprocess, upscale_if_needed):
+    """The PIL chain as process_image ran it before image_pipeline, for the comparison."""
+    image = Image.fromarray(source)
+    if preprocess:
+        gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
+        mean, std = np.mean(gray), np.std(gray)
+        if std < 40 or mean > 200 or mean < 55:
+            enhanced = cv2.createCLAHE(clipLimit=2.5, tileGridSize=(8, 8)).apply(gray)
+            denoised = cv2.bilateralFilter(enhanced, 5, 50, 50)
+            kernel = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+            image = Image.fromarray(cv2.filter2D(denoised, -1, kernel=kernel))
+        else:
+            image = ImageEnhance.Contrast(image.convert('L')).enhance(2.0).filter(ImageFilter.MedianFilter(size=3))
+        image = image.convert('RGB')
+    scale = 1.0
+    if upscale_if_needed:
+        width, height = image.size
+        if width < image_pipeline.MIN_WIDTH or height < image_pipeline.MIN_HEIGHT:
+            scale = max(image_pipeline.MIN_WIDTH / width, image_pipeline.MIN_HEIGHT / height)
+            image = image.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+    return cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2BGR), scale
+
+def pipeline_prepare(source, preprocess, upscale_if_needed):
+    return image_pipeline.prepare_frame(source, preprocess, upscale_if_needed, 'BGR')
+
+def measure(prepare, frame, preprocess, upscale_if_needed, count):
+    """Time per frame and the tracemalloc peak of one frame, after a warm-up frame."""
+    prepare(frame, preprocess, upscale_if_needed)
+    allocations = image_pipeline.BUFFERS.allocations
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        prepare(frame, preprocess, upscale_if_needed)
+        times.append(time.perf_counter() - start)
+    new_buffers = (image_pipeline.BUFFERS.allocations - allocations) / count
+
+    tracemalloc.start()
+    prepare(frame, preprocess, upscale_if_needed)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return times, peak, new_buffers
+
+def measure_decisions(gray, count):
+    """Per-frame cost of full-frame statistics and of PreprocessController.decide, and its decisions."""
+    full = []
+    for _ in range(count):
+        start = time.perf_counter()
+        np.mean(gray), np.std(gray)
+        full.append(time.perf_counter() - start)
+    controller = image_pipeline.PreprocessController()
+    controlled = []
+    for _ in range(count):
+        start = time.perf_counter()
+        controller.decide(gray)
+        controlled.append(time.perf_counter() - start)
+    return full, controlled, controller.decisions
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame preparation benchmark")
+    parser.add_argument("--frames", type=int, default=50, help="Timed frames per case")
+    parser.add_argument("--lines", type=int, default=40, help="Text lines on the synthetic screen")
+    options = parser.parse_args()
+
+    screen = make_frame(options.lines)
+    small = np.ascontiguousarray(screen[:600, :800])
+    cases = [
+        ("1920x1080 preprocess", screen, True, False),
+        ("800x600 upscale", small, False, True),
+        ("800x600 preprocess + upscale", small, True, True)
+    ]
+
+    print(f"{options.frames} frames per case; memory is the allocation peak of one frame in frame sizes")
+    print(f"  {'case':<30} {'path':<9} {'p50 ms':>8} {'peak':>7} {'new buffers':>12}")
+    # Both paths print what they detect and resize, once per frame
+    with open(os.devnull, "w") as devnull:
+        for name, frame, preprocess, upscale_if_needed in cases:
+            for path, prepare in (("PIL", legacy_prepare), ("pipeline", pipeline_prepare)):
+                with contextlib.redirect_stdout(devnull):
+                    times, peak, new_buffers = measure(prepare, frame, preprocess, upscale_if_needed, options.frames)
+                buffers = f"{new_buffers:.2f}" if prepare is pipeline_prepare else "-"
+                print(f"  {name:<30} {path:<9} {percentile(times, 0.5) * 1000:8.2f} {peak / frame.nbytes:6.2f}x "
+                      f"{buffers:>12}")
+
+        with contextlib.redirect_stdout(devnull):
+            full, controlled, decisions = measure_decisions(cv2.cvtColor(screen, cv2.COLOR_RGB2GRAY), options.frames)
+    print(f"Mode decision on 1920x1080, {options.frames} frames of one scene")
+    print(f"  full-frame statistics  p50 {percentile(full, 0.5) * 1000:8.3f} ms")
+    print(f"  controller             p50 {percentile(controlled, 0.5) * 1000:8.3f} ms  ({decisions} decisions)")
+
+if __name__ == "__main__":
+    main()
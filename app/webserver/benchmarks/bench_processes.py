@@ -0,0 +1,122 @@
+"""
+Measure OCR throughput with the engines in 1, 2, 4, ... worker processes.
+
+For every process count a ProcessWorkerPool is started and warmed up. Then the images are
+recognized --repeat times by twice as many client threads as processes, the same way the
+server's worker threads feed the pool. Frames go to the workers through shared memory. The
+script reports images per second, the speedup over the first process count and its
+per-process efficiency; it flattens out where memory bandwidth or the core count becomes the limit.
+
+Usage: python bench_processes.py IMAGE_OR_DIR... [--engine rapidocr] [--lang en]
+       [--processes 1 2 4 8] [--repeat 5] [--profile cpu_throughput]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_profiles
+from engine_cache import EngineWarming
+from ocr_process_pool import ProcessWorkerPool, worker_settings
+from ocr_server import OCR_ENGINES, WEBSERVER_DIR
+from bench_profiles import find_images, percentile
+
+WARMUP_TIMEOUT = 300  # Seconds to wait for every worker's model
+
+def load_frames(images):
+    """Decode the images once into RGB frames, like read_frame delivers them."""
+    frames = []
+    for path in images:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise SystemExit(f"Cannot read {path}")
+        frames.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return frames
+
+def warm_up(pool, options):
+    """
+    Send one job per worker at a time until a whole round succeeds.
+
+    Least-loaded dispatch puts concurrent jobs on different workers, so a successful round
+    means every worker has built and warmed up its model.
+    """
+    deadline = time.monotonic() + WARMUP_TIMEOUT
+
+    def attempt(_):
+        try:
+            return pool.process_image(options.engine, options.frames[0], **options.ocr).get("status")
+        except EngineWarming:
+            return "warming"
+
+    with ThreadPoolExecutor(pool.processes) as executor:
+        while True:
+            statuses = set(executor.map(attempt, range(pool.processes)))
+            if statuses == {"success"}:
+                return
+            if statuses - {"success", "warming"}:
+                raise SystemExit(f"OCR failed while warming up: {statuses}")
+            if time.monotonic() > deadline:
+                raise SystemExit("Workers did not warm up in time")
+            time.sleep(0.5)
+
+def run(processes, options):
+    # The images repeat, so the workers must not answer lines from their line caches
+    settings = worker_settings(OCR_ENGINES, WEBSERVER_DIR, {options.engine: [options.lang]}, 1, 0, 0)
+    pool = ProcessWorkerPool(processes, settings)
+    start = time.perf_counter()
+    pool.start()
+    warm_up(pool, options)
+    startup = time.perf_counter() - start
+
+    def recognize(frame):
+        call_start = time.perf_counter()
+        result = pool.process_image(options.engine, frame, **options.ocr)
+        if result.get("status") != "success":
+            raise RuntimeError(result.get("message"))
+        return time.perf_counter() - call_start
+
+    jobs = [frame for _ in range(options.repeat) for frame in options.frames]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(2 * processes) as executor:
+        latencies = list(executor.map(recognize, jobs))
+    elapsed = time.perf_counter() - start
+    pool.stop()
+    return startup, len(jobs) / elapsed, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR worker process scaling benchmark")
+    parser.add_argument("images", nargs="+", help="Image files or directories of images")
+    parser.add_argument("--engine", default="rapidocr", choices=sorted(OCR_ENGINES))
+    parser.add_argument("--lang", default="en")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--profile", default="cpu_throughput", help="Tuning profile; keep its threads per process low")
+    parser.add_argument("--profiles-file", default=ocr_profiles.PROFILES_PATH)
+    options = parser.parse_args()
+
+    ocr_profiles.configure(options.profiles_file)
+    images = find_images(options.images)
+    if not images:
+        parser.error("No images found")
+    options.frames = load_frames(images)
+    options.ocr = {
+        "lang": options.lang, "char_level": 'False', "preprocess_images": False,
+        "profile": ocr_profiles.resolve_profile(options.profile)
+    }
+
+    print(f"{options.engine}, {len(images)} images x {options.repeat}, profile {options.ocr['profile']}, {os.cpu_count()} CPUs")
+    print(f"  {'processes':>9} {'start s':>8} {'img/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'speedup':>8} {'per proc':>9}")
+    baseline = None
+    for processes in options.processes:
+        startup, throughput, latencies = run(processes, options)
+        baseline = baseline or (throughput, processes)
+        speedup = throughput / baseline[0]
+        print(f"  {processes:>9} {startup:8.1f} {throughput:8.2f} {percentile(latencies, 0.5) * 1000:9.1f}"
+              f" {percentile(latencies, 0.95) * 1000:9.1f} {speedup:7.2f}x {speedup * baseline[1] / processes:9.0%}")
+
+if __name__ == "__main__":
+    main()
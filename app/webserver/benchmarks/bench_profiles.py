@@ -0,0 +1,132 @@
+"""
+Compare engine tuning profiles on a local set of images.
+
+For every profile the engine is built and warmed up first, so its load time is reported on
+its own. Then every image is recognized --repeat times. The script reports latency, images
+per second, and how many of the first profile's lines each profile also found.
+
+Usage: python bench_profiles.py IMAGE_OR_DIR... [--engine rapidocr] [--lang en]
+       [--profiles default low_latency] [--repeat 3] [--threads 1] [--preprocess]
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_profiles
+from ocr_server import OCR_ENGINES, WEBSERVER_DIR
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.webp')
+
+def find_images(paths):
+    """Image files given directly or found in the given directories, in name order."""
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            images.extend(
+                os.path.join(path, name) for name in sorted(os.listdir(path))
+                if name.lower().endswith(IMAGE_EXTENSIONS)
+            )
+        else:
+            images.append(path)
+    return images
+
+def load_module(engine):
+    directory, module_name = OCR_ENGINES[engine]
+    sys.path.append(os.path.join(WEBSERVER_DIR, directory))
+    module = importlib.import_module(module_name)
+    # One engine at a time, so a profile never runs next to the previous one's models
+    module.ENGINE_CACHE.configure(max_engines=1)
+    if hasattr(module, "LINE_CACHE"):
+        # The benchmarks recognize the same images again and again, which would only measure cache hits
+        module.LINE_CACHE.configure(0)
+    return module
+
+def percentile(samples, quantile):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+def run_profile(module, profile, images, options):
+    """
+    Build the engine for a profile and time every image.
+
+    Returns:
+        dict: "build" seconds, per-call "latencies", wall "elapsed" seconds and the line texts found per image.
+    """
+    start = time.perf_counter()
+    module.initialize_ocr_engine(options.lang, profile)
+    build = time.perf_counter() - start
+
+    def recognize(path):
+        call_start = time.perf_counter()
+        result = module.process_image(
+            path, lang=options.lang, preprocess_images=options.preprocess, char_level='False', profile=profile
+        )
+        if result.get("status") != "success":
+            raise RuntimeError(f"{path}: {result.get('message') or result.get('error')}")
+        return time.perf_counter() - call_start, [item["text"] for item in result["results"]]
+
+    jobs = [path for _ in range(options.repeat) for path in images]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(options.threads) as pool:
+        outcomes = list(pool.map(recognize, jobs))
+    elapsed = time.perf_counter() - start
+    return {
+        "build": build,
+        "latencies": [latency for latency, _ in outcomes],
+        "elapsed": elapsed,
+        "texts": {path: texts for path, (_, texts) in zip(jobs, outcomes)}
+    }
+
+def agreement(baseline, texts):
+    """Share of the baseline's lines, over all images, that the other run found with the same text."""
+    total = found = 0
+    for path, expected in baseline.items():
+        remaining = list(texts.get(path, []))
+        for text in expected:
+            total += 1
+            if text in remaining:
+                remaining.remove(text)
+                found += 1
+    return found / total if total else 1.0
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR engine tuning profile benchmark")
+    parser.add_argument("images", nargs="+", help="Image files or directories of images")
+    parser.add_argument("--engine", default="rapidocr", choices=sorted(OCR_ENGINES))
+    parser.add_argument("--lang", default=None, help="Language (default: the engine's default language)")
+    parser.add_argument("--profiles", nargs="+", default=None, help="Profiles to compare (default: all)")
+    parser.add_argument("--profiles-file", default=ocr_profiles.PROFILES_PATH)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1, help="Images recognized concurrently")
+    parser.add_argument("--preprocess", action="store_true", help="Run the HDR preprocessing like hdr_support=True")
+    options = parser.parse_args()
+
+    ocr_profiles.configure(options.profiles_file)
+    profiles = options.profiles or sorted(ocr_profiles.profiles(), key=lambda name: name != ocr_profiles.default_profile())
+    for profile in profiles:
+        ocr_profiles.resolve_profile(profile)
+    images = find_images(options.images)
+    if not images:
+        parser.error("No images found")
+    module = load_module(options.engine)
+    options.lang = options.lang or module.DEFAULT_LANG
+
+    print(f"{options.engine}, {len(images)} images x {options.repeat}, {options.threads} threads, lang {options.lang}")
+    print(f"  {'profile':<16} {'build s':>8} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'img/s':>8} {'lines':>6} {'agree':>6}")
+    baseline = None
+    for profile in profiles:
+        run = run_profile(module, profile, images, options)
+        latencies = run["latencies"]
+        baseline = baseline or run["texts"]
+        lines = sum(len(texts) for texts in run["texts"].values())
+        print(f"  {profile:<16} {run['build']:8.2f} {sum(latencies) / len(latencies) * 1000:9.1f}"
+              f" {percentile(latencies, 0.5) * 1000:9.1f} {percentile(latencies, 0.95) * 1000:9.1f}"
+              f" {len(latencies) / run['elapsed']:8.2f} {lines:6d} {agreement(baseline, run['texts']):6.0%}")
+
+if __name__ == "__main__":
+    main()
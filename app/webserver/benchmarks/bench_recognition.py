@@ -0,0 +1,84 @@
+"""
+Time detection and batched recognition on dense synthetic frames.
+
+Each frame is a 1920x1080 screen with --lines lines of text in a few columns, like a
+settings menu or an inventory. For every recognition batch size an engine is built with
+that rec_batch_size on top of --profile, and the frame is recognized --repeat times. The
+script reports the detect and recognize stages separately, as the timings of a response do.
+
+Usage: python bench_recognition.py [--engine rapidocr] [--lines 20 50 100] [--batch-sizes 1 8 32]
+"""
+import argparse
+import os
+import random
+import sys
+import numpy as np
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ocr_profiles
+from metrics import StageTimer
+from bench_profiles import load_module, percentile
+from ocr_server import OCR_ENGINES
+
+WORDS = ["Attack", "Defense", "Inventory", "Quest", "Options", "Sound", "Volume", "Level", "Gold", "Potion",
+         "Return", "Save", "Load", "Equipment", "Skill", "Magic", "Status", "Party", "Map", "Settings"]
+
+def make_frame(lines, seed=0):
+    """RGB 1920x1080 frame with the given number of short text lines in four columns."""
+    random.seed(seed)
+    frame = np.full((1080, 1920, 3), 245, dtype=np.uint8)
+    rows = -(-lines // 4)
+    line_height = min(60, 1000 // max(rows, 1))
+    for i in range(lines):
+        column, row = divmod(i, rows)
+        text = " ".join(random.choice(WORDS) for _ in range(random.randint(1, 3))) + f" {random.randint(1, 999)}"
+        origin = (30 + column * 470, 40 + row * line_height + line_height // 2)
+        cv2.putText(frame, text, origin, cv2.FONT_HERSHEY_SIMPLEX, min(0.9, line_height / 45), (20, 20, 20), 2, cv2.LINE_AA)
+    return frame
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection and batched recognition benchmark")
+    parser.add_argument("--engine", default="rapidocr", choices=sorted(OCR_ENGINES))
+    parser.add_argument("--lang", default=None, help="Language (default: the engine's default language)")
+    parser.add_argument("--lines", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--profile", default=None, help="Profile the batch sizes are applied to (default: the default profile)")
+    parser.add_argument("--repeat", type=int, default=5)
+    options = parser.parse_args()
+
+    module = load_module(options.engine)
+    lang = options.lang or module.DEFAULT_LANG
+    base = ocr_profiles.resolve_profile(options.profile)
+    frames = {lines: make_frame(lines) for lines in options.lines}
+
+    print(f"{options.engine}, lang {lang}, profile {base}, {options.repeat} runs per frame")
+    print(f"  {'lines':>5} {'batch':>5} {'found':>6} {'detect ms':>10} {'rec ms':>9} {'rec ms/line':>12} {'total p50':>10}")
+    for batch_size in options.batch_sizes:
+        # A throwaway profile per batch size, so every size gets its own engine
+        profile = f"{base}_batch{batch_size}"
+        ocr_profiles.profiles()[profile] = dict(ocr_profiles.profiles()[base], rec_batch_size=batch_size)
+        module.initialize_ocr_engine(lang, profile)
+        for lines, frame in frames.items():
+            stages = {"detect": [], "recognize": [], "inference": []}
+            totals = []
+            found = 0
+            for _ in range(options.repeat):
+                timer = StageTimer()
+                result = module.process_image(frame, lang=lang, preprocess_images=False, char_level='False',
+                                              timer=timer, profile=profile)
+                if result.get("status") != "success":
+                    raise SystemExit(f"OCR failed: {result.get('message')}")
+                for stage in stages:
+                    stages[stage].append(timer.stages.get(stage, 0.0))
+                totals.append(timer.total())
+                found = len(result["results"])
+            detect = sum(stages["detect"]) / options.repeat
+            # Engines without separate stages report everything as inference
+            recognize = sum(stages["recognize"]) / options.repeat or sum(stages["inference"]) / options.repeat
+            print(f"  {lines:>5} {batch_size:>5} {found:>6} {detect * 1000:>10.1f} {recognize * 1000:>9.1f}"
+                  f" {recognize * 1000 / max(found, 1):>12.2f} {percentile(totals, 0.5) * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
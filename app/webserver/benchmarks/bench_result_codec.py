@@ -0,0 +1,58 @@
+"""
+Compare the JSON and binary OCR result encodings on a synthetic character-level frame.
+
+Usage: python bench_result_codec.py [--detections 800] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_codec import encode_result, decode_columns, decode_result
+
+LATIN = "abcdefghijklmnopqrstuvwxyz0123456789あいう"
+
+def make_result(detections, alphabet=LATIN):
+    """Build a result shaped like process_image output with char_level enabled."""
+    random.seed(0)
+    results = []
+    for _ in range(detections):
+        x, y = random.uniform(0, 1800), random.uniform(0, 1000)
+        results.append({
+            "rect": [[x, y], [x + 12.5, y], [x + 12.5, y + 24.0], [x, y + 24.0]],
+            "text": random.choice(alphabet),
+            "confidence": random.random(),
+            "is_character": True
+        })
+    return {"status": "success", "results": results, "processing_time_seconds": 0.1, "char_level": "True"}
+
+def measure(func, repeat):
+    """Average milliseconds per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR result encoding benchmark")
+    parser.add_argument("--detections", type=int, default=800)
+    parser.add_argument("--repeat", type=int, default=200)
+    options = parser.parse_args()
+    
+    result = make_result(options.detections)
+    as_json = json.dumps(result, ensure_ascii=False).encode('utf-8')
+    as_binary = encode_result(result)
+    
+    print(f"{options.detections} detections")
+    print(f"  json    {len(as_json):>9} bytes  encode {measure(lambda: json.dumps(result, ensure_ascii=False).encode('utf-8'), options.repeat):7.3f} ms"
+          f"  decode {measure(lambda: json.loads(as_json), options.repeat):7.3f} ms")
+    print(f"  binary  {len(as_binary):>9} bytes  encode {measure(lambda: encode_result(result), options.repeat):7.3f} ms"
+          f"  decode {measure(lambda: decode_columns(as_binary), options.repeat):7.3f} ms (columns),"
+          f" {measure(lambda: decode_result(as_binary), options.repeat):7.3f} ms (dicts)")
+
+if __name__ == "__main__":
+    main()
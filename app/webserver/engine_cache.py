@@ -0,0 +1,278 @@
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+import numpy as np
+import cv2
+
+try:
+    import psutil
+except ImportError:
+    psutil = None  # Engine sizes fall back to the per-engine estimate
+
+# Defaults, overridden by the server with configure()
+MAX_ENGINES = 3  # Engines kept loaded per OCR implementation
+MEMORY_BUDGET_MB = 4096  # Memory the loaded engines of one implementation may use together
+
+class EngineWarming(Exception):
+    """Raised when the engine a request needs is still initializing in the background."""
+
+# Model states reported by EngineCache.status()
+STATE_LOADING = 'loading'  # Building the engine
+STATE_WARMING = 'warming'  # Running the dummy inference
+STATE_READY = 'ready'
+STATE_FAILED = 'failed'
+
+class CachedEngine:
+    """One initialized engine with its own inference lock."""
+
+    def __init__(self, key, engine, size_mb, load_time, warmup_time):
+        self.key = key
+        self.engine = engine
+        self.size_mb = size_mb
+        self.load_time = load_time
+        self.warmup_time = warmup_time
+        self.lock = threading.Lock()  # Engines are not thread-safe, one inference at a time
+
+class EngineCache:
+    """
+    LRU cache of initialized OCR engines keyed by their resolved model configuration.
+
+    Languages that map to the same models (en and fr both use the Latin recognizer) share
+    one engine. A configuration that is not loaded yet is built and warmed up with a dummy
+    inference on a background thread; until it is ready, leasing it raises EngineWarming so
+    the request can be answered right away, while engines for other configurations keep serving.
+    """
+
+    def __init__(self, name, factory, engine_size_mb, warmup=None):
+        """
+        Args:
+            name (str): Implementation name, used for logs and the ready flag file.
+            factory (callable): Builds an engine from a configuration key.
+            engine_size_mb (int): Memory estimate per engine when it cannot be measured.
+            warmup (callable): Runs a dummy inference on a new engine before it serves requests.
+        """
+        self.name = name
+        self.factory = factory
+        self.warmup = warmup
+        self.engine_size_mb = engine_size_mb
+        self.max_engines = MAX_ENGINES
+        self.memory_budget_mb = MEMORY_BUDGET_MB
+        self._engines = OrderedDict()  # key -> CachedEngine, least recently used first
+        self._warming = {}  # key -> threading.Event set when the build finishes
+        self._errors = {}  # key -> message of the last failed build
+        self._states = {}  # key -> STATE_LOADING or STATE_WARMING while a build runs
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()  # One build at a time so memory measurements stay meaningful
+
+    def configure(self, max_engines=None, memory_budget_mb=None):
+        """Change the eviction limits; takes effect on the next load."""
+        if max_engines is not None:
+            self.max_engines = max(1, max_engines)
+        if memory_budget_mb is not None:
+            self.memory_budget_mb = max(0, memory_budget_mb)
+
+    def get(self, key):
+        """
+        Return the engine for key, building it on the calling thread if needed.
+        """
+        while True:
+            with self._lock:
+                entry = self._engines.get(key)
+                if entry is not None:
+                    self._engines.move_to_end(key)
+                    return entry
+                event = self._warming.get(key)
+                if event is None:
+                    event = self._warming[key] = threading.Event()
+                    build = True
+                else:
+                    build = False
+            if build:
+                with self._lock:
+                    self._states[key] = STATE_LOADING
+                self._build(key, event)
+            else:
+                event.wait()
+            with self._lock:
+                if key not in self._engines and key in self._errors:
+                    raise RuntimeError(self._errors[key])
+
+    def ensure(self, key):
+        """
+        Return the engine for key if it is loaded, otherwise start building it in the background.
+
+        Raises:
+            EngineWarming: While the engine is still initializing.
+            RuntimeError: If the last attempt to build it failed; the next call tries again.
+        """
+        with self._lock:
+            entry = self._engines.get(key)
+            if entry is not None:
+                self._engines.move_to_end(key)
+                return entry
+            error = self._errors.pop(key, None)
+            if error is None:
+                self._start_warming(key)
+        if error is not None:
+            raise RuntimeError(error)
+        raise EngineWarming(f"{self.name} engine for {key} is warming up, try again shortly")
+
+    def wait(self, key, timeout):
+        """
+        Return the engine for key, waiting up to timeout seconds for a background build of it.
+
+        Raises:
+            EngineWarming: If it is still initializing after timeout seconds.
+            RuntimeError: If building it failed.
+        """
+        try:
+            return self.ensure(key)
+        except EngineWarming:
+            with self._lock:
+                event = self._warming.get(key)
+        if event is not None and not event.wait(timeout):
+            raise EngineWarming(f"{self.name} engine for {key} is still warming up after {timeout} seconds")
+        return self.ensure(key)
+
+    @contextmanager
+    def lease(self, key, wait=False):
+        """
+        Hold the engine for key for one inference.
+
+        Args:
+            key: Resolved model configuration.
+            wait (bool): Build the engine on this thread if needed instead of raising EngineWarming.
+
+        Yields:
+            The initialized OCR engine
+        """
+        entry = self.get(key) if wait else self.ensure(key)
+        with entry.lock:
+            yield entry.engine
+
+    def preload(self, key):
+        """Start building the engine for key in the background unless it is loaded or building."""
+        with self._lock:
+            if key not in self._engines:
+                self._errors.pop(key, None)
+                self._start_warming(key)
+
+    def status(self):
+        """
+        State and timings of every model configuration, most recently used first.
+
+        Returns:
+            dict: "models" list of {"config", "state", ...} plus memory use and limits.
+        """
+        with self._lock:
+            models = [
+                {
+                    "config": str(entry.key),
+                    "state": STATE_READY,
+                    "load_seconds": round(entry.load_time, 3),
+                    "warmup_seconds": round(entry.warmup_time, 3),
+                    "size_mb": round(entry.size_mb, 1)
+                }
+                for entry in reversed(self._engines.values())
+            ]
+            models += [{"config": str(key), "state": state} for key, state in self._states.items()]
+            models += [
+                {"config": str(key), "state": STATE_FAILED, "error": message}
+                for key, message in self._errors.items()
+            ]
+            return {
+                "models": models,
+                "memory_mb": round(sum(entry.size_mb for entry in self._engines.values()), 1),
+                "memory_budget_mb": self.memory_budget_mb,
+                "max_engines": self.max_engines
+            }
+
+    def _start_warming(self, key):
+        """Start a background build of key unless one is running. Call with self._lock held."""
+        if key in self._warming:
+            return
+        event = self._warming[key] = threading.Event()
+        self._states[key] = STATE_LOADING
+        thread = threading.Thread(target=self._build, args=(key, event), name=f"{self.name}-warmup", daemon=True)
+        thread.start()
+
+    def _build(self, key, event):
+        try:
+            with self._build_lock:
+                print(f"Initializing {self.name} engine for {key}...")
+                before = _process_memory_mb()
+                start_time = time.time()
+                engine = self.factory(key)
+                load_time = time.time() - start_time
+                after = _process_memory_mb()
+                size_mb = after - before if before is not None and after is not None and after > before else self.engine_size_mb
+                print(f"{self.name} initialization for {key} completed in {load_time:.2f} seconds ({size_mb:.0f} MB)")
+
+            # The first inference pays for lazy allocations and kernel selection, do it before serving
+            warmup_time = 0.0
+            if self.warmup is not None:
+                with self._lock:
+                    self._states[key] = STATE_WARMING
+                start_time = time.time()
+                self.warmup(engine)
+                warmup_time = time.time() - start_time
+                print(f"{self.name} warmup for {key} completed in {warmup_time:.2f} seconds")
+
+            with self._lock:
+                self._errors.pop(key, None)
+                self._engines[key] = CachedEngine(key, engine, size_mb, load_time, warmup_time)
+                evicted = self._evict(key)
+            for entry in evicted:
+                print(f"Evicted {self.name} engine for {entry.key} ({entry.size_mb:.0f} MB)")
+            _write_ready_flag(self.name)
+        except Exception as e:
+            print(f"Error initializing {self.name} engine for {key}: {e}")
+            with self._lock:
+                self._errors[key] = f"Cannot initialize {self.name} engine for {key}: {e}"
+        finally:
+            with self._lock:
+                self._warming.pop(key, None)
+                self._states.pop(key, None)
+            event.set()
+
+    def _evict(self, keep):
+        """Drop least recently used engines over the count or memory limit. Call with self._lock held."""
+        evicted = []
+        while len(self._engines) > 1:
+            total = sum(entry.size_mb for entry in self._engines.values())
+            over_budget = self.memory_budget_mb and total > self.memory_budget_mb
+            if len(self._engines) <= self.max_engines and not over_budget:
+                break
+            key = next(iter(self._engines))
+            if key == keep:
+                self._engines.move_to_end(key)
+                continue
+            # An engine in use is dropped from the cache but freed only after its lease ends
+            evicted.append(self._engines.pop(key))
+        return evicted
+
+def warmup_image():
+    """
+    Small BGR image with a line of dark text on white, for dummy inferences.
+
+    A blank image would let detection find nothing and skip recognition entirely.
+    """
+    image = np.full((96, 480, 3), 255, dtype=np.uint8)
+    cv2.putText(image, "Warmup OCR 0123", (12, 64), cv2.FONT_HERSHEY_SIMPLEX, 1.4, (0, 0, 0), 3, cv2.LINE_AA)
+    return image
+
+def _process_memory_mb():
+    """Resident memory of this process in MB, or None without psutil."""
+    if psutil is None:
+        return None
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+def _write_ready_flag(name):
+    """Write the ready flag file the client polls for."""
+    flag_file = os.path.join(tempfile.gettempdir(), f"{name}_ready.txt")
+    with open(flag_file, "w") as f:
+        f.write("READY")
+    print("Ready flag created!")
@@ -0,0 +1,290 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+from metrics import NULL_TIMER
+
+# HDR preprocessing for tone-mapped frames from GDI capture, as every engine module applies it
+CLAHE_CLIP_LIMIT = 2.5
+CLAHE_TILE_GRID = (8, 8)
+BILATERAL_DIAMETER = 5
+BILATERAL_SIGMA = 50  # Colour and space sigma of the bilateral filter
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]], dtype=np.float32)
+BASIC_CONTRAST = 2.0  # Contrast factor of the basic mode, as PIL's ImageEnhance.Contrast applies it
+MEDIAN_SIZE = 3
+# Frames this flat, bright or dark get the enhanced mode in 'auto'
+HDR_STD_BELOW = 40
+HDR_MEAN_ABOVE = 200
+HDR_MEAN_BELOW = 55
+STATS_STRIDE = 4  # Every this many pixels along both axes go into the brightness statistics
+# Per-session decisions (PreprocessController)
+HDR_HYSTERESIS = 8  # Grey levels the statistics must clear the thresholds by before 'enhanced' is dropped
+SCENE_STRIDE = 16  # Sampling step of the thumbnail a frame is compared with the last decision's in
+SCENE_CHANGE_THRESHOLD = 12  # Mean grey level change of the thumbnail that counts as a new scene
+DECISION_SECONDS = 10.0  # Longest a decision is kept without a scene change
+MAX_PREPROCESS_SESSIONS = 64  # Sessions whose decision each process keeps, least recently used dropped first
+
+# Smallest frame the engines get when upscaling is asked for
+MIN_WIDTH = 1024
+MIN_HEIGHT = 768
+
+SHAPES_PER_BUFFER = 2  # Resolutions each scratch buffer is kept in per thread
+
+# cvtColor codes between the channel orders frames come in and the ones engines want
+CONVERSIONS = {
+    ('GRAY', 'BGR'): cv2.COLOR_GRAY2BGR,
+    ('GRAY', 'RGB'): cv2.COLOR_GRAY2RGB,
+    ('RGB', 'BGR'): cv2.COLOR_RGB2BGR,
+    ('RGB', 'GRAY'): cv2.COLOR_RGB2GRAY,
+    ('BGR', 'RGB'): cv2.COLOR_BGR2RGB,
+    ('BGR', 'GRAY'): cv2.COLOR_BGR2GRAY,
+    ('BGRA', 'BGR'): cv2.COLOR_BGRA2BGR,
+    ('BGRA', 'RGB'): cv2.COLOR_BGRA2RGB,
+    ('BGRA', 'GRAY'): cv2.COLOR_BGRA2GRAY
+}
+
+class BufferPool:
+    """
+    Scratch arrays by name and shape, kept per thread and reused from frame to frame.
+
+    Every OCR worker thread gets its own set, so a buffer is only overwritten by the next
+    frame the same thread prepares. Each name keeps its SHAPES_PER_BUFFER most recent shapes.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.allocations = 0  # Buffers created so far, for the benchmarks
+
+    def get(self, name, shape, dtype=np.uint8):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            buffers = self._local.buffers = OrderedDict()  # (name, shape, dtype) -> array, least recently used first
+        key = (name, tuple(shape), np.dtype(dtype).str)
+        array = buffers.get(key)
+        if array is not None:
+            buffers.move_to_end(key)
+            return array
+        array = buffers[key] = np.empty(shape, dtype)
+        with self._lock:
+            self.allocations += 1
+        same_name = [other for other in buffers if other[0] == name]
+        for other in same_name[:-SHAPES_PER_BUFFER]:
+            del buffers[other]
+        return array
+
+BUFFERS = BufferPool()
+_local = threading.local()  # Per-thread CLAHE, since it keeps scratch state between calls
+
+def clahe():
+    instance = getattr(_local, "clahe", None)
+    if instance is None:
+        instance = _local.clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+    return instance
+
+def read_frame(source):
+    """
+    Get the pixels of a frame without copying in-memory ones.
+
+    Args:
+        source (str or np.ndarray): Image path, or a frame as an (H, W) GRAY,
+            (H, W, 3) RGB or (H, W, 4) BGRA array.
+
+    Returns:
+        tuple: (np.ndarray, channel order 'GRAY', 'RGB', 'BGRA' or 'BGR')
+
+    Raises:
+        ValueError: If the file cannot be read as an image.
+    """
+    if isinstance(source, np.ndarray):
+        if source.ndim == 2:
+            return source, 'GRAY'
+        return source, 'BGRA' if source.shape[2] == 4 else 'RGB'
+    image = cv2.imread(source, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Cannot read image: {source}")
+    return image, 'BGR'
+
+def convert(image, order, target, buffer):
+    """Convert image from one channel order to another into the named buffer; no-op if they agree."""
+    if order == target:
+        return image
+    shape = image.shape[:2] if target == 'GRAY' else image.shape[:2] + (3,)
+    return cv2.cvtColor(image, CONVERSIONS[(order, target)], dst=BUFFERS.get(buffer, shape))
+
+def frame_stats(gray):
+    """Mean and standard deviation of the grey levels, from every STATS_STRIDE-th pixel."""
+    sample = gray[::STATS_STRIDE, ::STATS_STRIDE]
+    return float(sample.mean()), float(sample.std())
+
+def choose_mode(mean, std, current=None):
+    """
+    Preprocessing mode for frames with these statistics.
+
+    Flat, bright or dark frames get 'enhanced'. When current is 'enhanced', the statistics
+    must clear the thresholds by HDR_HYSTERESIS before 'basic' is chosen, so frames near a
+    threshold do not switch modes back and forth.
+    """
+    margin = HDR_HYSTERESIS if current == 'enhanced' else 0
+    if std < HDR_STD_BELOW + margin or mean > HDR_MEAN_ABOVE - margin or mean < HDR_MEAN_BELOW + margin:
+        return 'enhanced'
+    return 'basic'
+
+class PreprocessController:
+    """
+    Preprocessing mode of one client stream, decided once per scene instead of every frame.
+
+    The mode is chosen from the brightness statistics of a frame (choose_mode) and kept
+    for the frames after it. Each frame is only compared with the frame the decision was
+    made on, in a thumbnail of every SCENE_STRIDE-th pixel. The mode is chosen again when the
+    thumbnail changed by SCENE_CHANGE_THRESHOLD, the frame size changed, or the decision is
+    older than DECISION_SECONDS.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mode = None  # Current decision, None before the first frame
+        self.thumbnail = None  # Thumbnail of the frame it was made on
+        self.decided = 0.0  # time.monotonic() of the decision
+        self.decisions = 0  # Decisions made, the first one included
+
+    def decide(self, gray, timer=NULL_TIMER):
+        """
+        Mode for a grey frame of this stream.
+
+        The timer gets a "decide" lap for the check, and notes preprocess_mode and
+        preprocess_decision: 'first', 'scene' or 'timer' when the mode was chosen again,
+        'cached' when it was kept.
+
+        Returns:
+            str: 'basic' or 'enhanced'
+        """
+        with self.lock:
+            thumbnail = np.ascontiguousarray(gray[::SCENE_STRIDE, ::SCENE_STRIDE])
+            if self.mode is None:
+                reason = 'first'
+            elif thumbnail.shape != self.thumbnail.shape:
+                reason = 'scene'
+            elif time.monotonic() - self.decided > DECISION_SECONDS:
+                reason = 'timer'
+            elif cv2.mean(cv2.absdiff(thumbnail, self.thumbnail))[0] > SCENE_CHANGE_THRESHOLD:
+                reason = 'scene'
+            else:
+                reason = 'cached'
+            if reason != 'cached':
+                mean, std = frame_stats(gray)
+                mode = choose_mode(mean, std, self.mode)
+                if mode != self.mode:
+                    print(f"Preprocessing mode {mode} (mean={mean:.1f}, std={std:.1f}, {reason})")
+                self.mode = mode
+                self.thumbnail = thumbnail
+                self.decided = time.monotonic()
+                self.decisions += 1
+            timer.lap("decide")
+            timer.note("preprocess_mode", self.mode)
+            timer.note("preprocess_decision", reason)
+            return self.mode
+
+_controllers = OrderedDict()  # session -> PreprocessController, least recently used first
+_controllers_lock = threading.Lock()
+
+def preprocess_controller(session):
+    """The PreprocessController of a session key, created on first use."""
+    with _controllers_lock:
+        controller = _controllers.get(session)
+        if controller is None:
+            controller = _controllers[session] = PreprocessController()
+            while len(_controllers) > MAX_PREPROCESS_SESSIONS:
+                _controllers.popitem(last=False)
+        else:
+            _controllers.move_to_end(session)
+        return controller
+
+def preprocess_hdr(gray, mode='auto'):
+    """
+    Enhance a grey frame for OCR; HDR tone-mapped frames from GDI capture get CLAHE,
+    bilateral filtering and sharpening, others a contrast stretch and median filter.
+
+    Args:
+        gray (np.ndarray): (H, W) grey frame.
+        mode (str): 'auto' (choose from this frame's statistics), 'basic', or 'enhanced'
+
+    Returns:
+        np.ndarray: Enhanced grey frame, in a scratch buffer of this thread.
+    """
+    if mode == 'auto':
+        mean, std = frame_stats(gray)
+        mode = choose_mode(mean, std)
+        if mode == 'enhanced':
+            print(f"Auto-detected HDR artifacts (mean={mean:.1f}, std={std:.1f})")
+
+    shape = gray.shape
+    if mode == 'enhanced':
+        enhanced = clahe().apply(gray, BUFFERS.get("clahe", shape))
+        denoised = cv2.bilateralFilter(enhanced, BILATERAL_DIAMETER, BILATERAL_SIGMA, BILATERAL_SIGMA,
+                                       dst=BUFFERS.get("denoised", shape))
+        print("Applied CLAHE + bilateral filter + sharpening")
+        return cv2.filter2D(denoised, -1, SHARPEN_KERNEL, dst=BUFFERS.get("sharpened", shape))
+
+    # Basic mode: stretch around the mean grey level, then remove speckles
+    mean = cv2.mean(gray)[0]
+    contrasted = cv2.addWeighted(gray, BASIC_CONTRAST, gray, 0.0, -(BASIC_CONTRAST - 1) * int(mean + 0.5),
+                                 dst=BUFFERS.get("contrasted", shape))
+    return cv2.medianBlur(contrasted, MEDIAN_SIZE, dst=BUFFERS.get("median", shape))
+
+def upscale(image, buffer, min_width=MIN_WIDTH, min_height=MIN_HEIGHT):
+    """
+    Upscale the image into the named buffer if it is below the minimum size.
+
+    Returns:
+        tuple: (np.ndarray, scale factor, 1.0 when the image is returned as it is)
+    """
+    height, width = image.shape[:2]
+    if width >= min_width and height >= min_height:
+        return image, 1.0
+    scale = max(min_width / width, min_height / height)
+    size = (int(width * scale), int(height * scale))
+    print(f"Upscaling image from ({width}, {height}) to {size}")
+    out = BUFFERS.get(buffer, (size[1], size[0]) + image.shape[2:])
+    return cv2.resize(image, size, dst=out, interpolation=cv2.INTER_LANCZOS4), scale
+
+def prepare_frame(source, preprocess=False, upscale_if_needed=False, order='BGR', slot=0, session=None,
+                  timer=NULL_TIMER):
+    """
+    Load a frame and apply the requested preprocessing and upscaling, as ndarrays throughout.
+
+    Every step writes into a scratch buffer of this thread that the next frame of the same
+    resolution reuses, and the CLAHE object is built once per thread. Preprocessing works on
+    the grey frame and upscales it before it is expanded back to three channels.
+
+    Args:
+        source (str or np.ndarray): Image path or in-memory frame (see read_frame).
+        preprocess (bool): Apply preprocess_hdr.
+        upscale_if_needed (bool): Upscale frames below MIN_WIDTH x MIN_HEIGHT.
+        order (str): Channel order the engine wants, 'BGR' or 'RGB'.
+        slot (int): Buffer set to use; frames prepared together before one engine call
+            (process_images) need one slot each.
+        session (str): Client stream the frame belongs to; its PreprocessController picks
+            the preprocessing mode. None picks it from this frame alone.
+        timer (StageTimer): Gets the controller's "decide" lap and notes.
+
+    Returns:
+        tuple: (np.ndarray, upscale factor). The array is a scratch buffer that stays valid
+        until this thread prepares another frame in the same slot, or the frame itself when
+        it needs no change.
+    """
+    image, image_order = read_frame(source)
+    if preprocess:
+        gray = convert(image, image_order, 'GRAY', "gray")
+        mode = 'auto'
+        if session is not None:
+            timer.lap("preprocess")
+            mode = preprocess_controller(session).decide(gray, timer)
+        image = preprocess_hdr(gray, mode)
+        image_order = 'GRAY'
+    scale = 1.0
+    if upscale_if_needed:
+        image, scale = upscale(image, f"upscaled{slot}")
+    return convert(image, image_order, order, f"frame{slot}"), scale
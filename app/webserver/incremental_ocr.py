@@ -0,0 +1,210 @@
+import threading
+import time
+import numpy as np
+import cv2
+
+from metrics import NULL_TIMER
+
+TILE_SIZE = 32  # Pixels per side of the tiles consecutive frames are compared in
+DIFF_THRESHOLD = 24  # Smallest per-channel change that makes a tile dirty; smaller ones are capture noise
+TILE_MARGIN = 1  # Clean tiles around a dirty one that are OCRed again with it, for text that grew past the change
+REGION_MARGIN = 8  # Extra pixels around every re-run region so the detector sees whole glyphs
+FULL_PASS_FRACTION = 0.5  # Above this share of the frame to re-run, one full pass is cheaper
+KEYFRAME_INTERVAL = 100  # Incremental passes before a full pass refreshes every detection
+
+# How a frame was recognized, as counted in ocr_incremental_frames_total
+MODE_FULL = 'full'
+MODE_PARTIAL = 'partial'
+MODE_UNCHANGED = 'unchanged'
+
+def decode_frame(source):
+    """
+    Frame to diff: in-memory frames as they are, image files decoded to RGB.
+
+    Returns:
+        np.ndarray: The frame, or None if the file cannot be read.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    image = cv2.imread(source, cv2.IMREAD_COLOR)
+    if image is None:
+        return None
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+def dirty_regions(previous, frame):
+    """
+    Compare two frames of the same shape tile by tile.
+
+    Returns:
+        list: (x0, y0, x1, y1) pixel rectangles around every group of changed tiles,
+        margins included, clipped to the frame.
+    """
+    height, width = frame.shape[:2]
+    diff = cv2.absdiff(previous, frame)
+    if diff.ndim == 3:
+        diff = diff.max(axis=2)
+    # Largest change in each tile; edge tiles are smaller when the size is not a multiple
+    tiles = np.maximum.reduceat(diff, np.arange(0, height, TILE_SIZE), axis=0)
+    tiles = np.maximum.reduceat(tiles, np.arange(0, width, TILE_SIZE), axis=1)
+    dirty = (tiles >= DIFF_THRESHOLD).astype(np.uint8)
+    if not dirty.any():
+        return []
+    if TILE_MARGIN:
+        dirty = cv2.dilate(dirty, np.ones((2 * TILE_MARGIN + 1, 2 * TILE_MARGIN + 1), np.uint8))
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(dirty, connectivity=8)
+    regions = []
+    for x, y, w, h, _ in stats[1:]:
+        regions.append((
+            max(0, x * TILE_SIZE - REGION_MARGIN),
+            max(0, y * TILE_SIZE - REGION_MARGIN),
+            min(width, (x + w) * TILE_SIZE + REGION_MARGIN),
+            min(height, (y + h) * TILE_SIZE + REGION_MARGIN)
+        ))
+    return regions
+
+def rect_bounds(rect):
+    """(x0, y0, x1, y1) bounding box of a detection's corner points."""
+    xs = [point[0] for point in rect]
+    ys = [point[1] for point in rect]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def overlaps(a, b):
+    """Whether two (x0, y0, x1, y1) boxes overlap or touch."""
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def union(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+def grow_regions(regions, boxes, width, height):
+    """
+    Grow the dirty regions over every previous detection they touch and merge the ones that meet.
+
+    A line that changed in part is then recognized again as a whole, and every previous
+    detection ends up either inside a region or clear of all of them. Character-level
+    detections of one line touch each other, so the growth spreads along the line.
+
+    Returns:
+        list: (x0, y0, x1, y1) integer pixel rectangles, clipped to the frame.
+    """
+    while True:
+        grown = []
+        for region in regions:
+            for box in boxes:
+                if overlaps(region, box):
+                    region = union(region, box)
+            for other in [other for other in grown if overlaps(region, other)]:
+                grown.remove(other)
+                region = union(region, other)
+            grown.append(region)
+        grown = [
+            (max(0, int(x0)), max(0, int(y0)), min(width, int(np.ceil(x1))), min(height, int(np.ceil(y1))))
+            for x0, y0, x1, y1 in grown
+        ]
+        if grown == regions:
+            return grown
+        regions = grown
+
+def offset_detections(detections, dx, dy):
+    """Move detections found in a crop into frame coordinates."""
+    for detection in detections:
+        detection["rect"] = [[x + dx, y + dy] for x, y in detection["rect"]]
+    return detections
+
+def insert_in_reading_order(detections, block):
+    """
+    Insert the detections of one region before the first kept detection below its top.
+
+    The region's own order (lines, and the characters of each line) is left as the engine gave it.
+    """
+    if not block:
+        return
+    top = min(rect_bounds(detection["rect"])[1] for detection in block)
+    index = next(
+        (i for i, detection in enumerate(detections) if rect_bounds(detection["rect"])[1] > top), len(detections)
+    )
+    detections[index:index] = block
+
+class IncrementalSession:
+    """
+    Previous frame and detections of one client stream, to OCR only what changed since.
+
+    Between captures usually only a dialogue box or a tooltip changes. Each frame is compared
+    with the previous one in tiles; groups of changed tiles, grown over the previous detections
+    they touch, are cropped and recognized on their own, and the detections from the rest of
+    the frame are kept. The result has the same fields as a full pass.
+
+    A full pass runs for the first frame, after the options or the frame size change, when
+    too much of the frame changed, and every KEYFRAME_INTERVAL incremental passes. Frames of
+    one session are processed one at a time, since each is compared with the one before.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.frame = None  # Copy of the last frame recognized
+        self.options = None  # Engine options it was recognized with
+        self.result = None  # Its process_image result
+        self.partial_passes = 0  # Incremental passes since the last full one
+
+    def process(self, source, options, recognize, timer=NULL_TIMER):
+        """
+        Recognize a frame, reusing the detections of the previous frame where it did not change.
+
+        Args:
+            source: np.ndarray frame or image path, as for process_image.
+            options: Hashable engine options (engine, language, ...); a change forces a full pass.
+            recognize (callable): Runs the engine on a frame or crop and returns a process_image result.
+            timer: StageTimer; the comparison is charged to a "diff" stage.
+
+        Returns:
+            tuple: (process_image result dict, MODE_FULL, MODE_PARTIAL or MODE_UNCHANGED)
+        """
+        with self.lock:
+            start_time = time.time()
+            frame = decode_frame(source)
+            if frame is None:
+                # The engine reports the unreadable file
+                return recognize(source), MODE_FULL
+            if (self.frame is None or options != self.options or frame.shape != self.frame.shape
+                    or self.partial_passes >= KEYFRAME_INTERVAL):
+                timer.lap("diff")
+                return self._full_pass(frame, options, recognize), MODE_FULL
+
+            height, width = frame.shape[:2]
+            regions = dirty_regions(self.frame, frame)
+            if not regions:
+                timer.lap("diff")
+                return dict(self.result, processing_time_seconds=time.time() - start_time), MODE_UNCHANGED
+            previous = self.result["results"]
+            boxes = [rect_bounds(detection["rect"]) for detection in previous]
+            regions = grow_regions(regions, boxes, width, height)
+            timer.lap("diff")
+            if sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions) > FULL_PASS_FRACTION * width * height:
+                return self._full_pass(frame, options, recognize), MODE_FULL
+
+            detections = [
+                detection for detection, box in zip(previous, boxes)
+                if not any(overlaps(box, region) for region in regions)
+            ]
+            for x0, y0, x1, y1 in regions:
+                result = recognize(np.ascontiguousarray(frame[y0:y1, x0:x1]))
+                if result.get("status") != "success":
+                    # Keep the previous frame, so the next one is compared with what the detections show
+                    return result, MODE_PARTIAL
+                insert_in_reading_order(detections, offset_detections(result["results"], x0, y0))
+
+            np.copyto(self.frame, frame)
+            self.result = dict(self.result, results=detections, processing_time_seconds=time.time() - start_time)
+            self.partial_passes += 1
+            return dict(self.result), MODE_PARTIAL
+
+    def _full_pass(self, frame, options, recognize):
+        result = recognize(frame)
+        if result.get("status") == "success":
+            self.frame = frame.copy()
+            self.options = options
+            self.result = dict(result)
+            self.partial_passes = 0
+        else:
+            self.frame = None
+        return result
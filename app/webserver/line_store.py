@@ -0,0 +1,197 @@
+import atexit
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+LINE_STORE_MB = 256  # Size cap of the on-disk line store (--line-store-mb)
+COMPACT_TARGET = 0.8  # Compaction trims the store to this share of its cap
+FLUSH_SECONDS = 1.0  # Longest a recognized line waits before it is written
+FLUSH_BATCH = 256  # Queued lookups and recognitions that trigger a write without waiting
+SIZE_CHECK_SECONDS = 60  # How often the writer checks the size cap
+BUSY_TIMEOUT_MS = 5000  # How long a statement waits for another process's write lock
+MAX_QUERY_KEYS = 500  # Keys per SELECT, below SQLite's limit on statement variables
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lines (
+    model TEXT NOT NULL,
+    digest BLOB NOT NULL,
+    text TEXT NOT NULL,
+    score REAL NOT NULL,
+    used REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS lines_key ON lines (model, digest);
+CREATE INDEX IF NOT EXISTS lines_used ON lines (used);
+"""
+
+class LineStore:
+    """
+    Recognized text of line crops in an SQLite file, shared by server processes and restarts.
+
+    Rows map (model, crop digest) to text and score. Lookups run on the calling thread; new
+    lines and the use times of hits are queued and written in batches by a background thread,
+    so recognition never waits for the disk. Every process opens the file on its own: WAL
+    mode lets readers go on while one process writes, and writers wait up to BUSY_TIMEOUT_MS
+    for each other.
+
+    When the file grows past its cap, the least recently used rows are deleted down to
+    COMPACT_TARGET of it and the freed pages are handed back to the file system.
+    """
+
+    def __init__(self, path, max_mb=LINE_STORE_MB):
+        """
+        Args:
+            path (str): SQLite file, created if missing.
+            max_mb (float): Size cap in MB, 0 for no cap.
+
+        Raises:
+            sqlite3.Error: If the file cannot be opened.
+        """
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._reader = self._connect()
+        self._reader.executescript(SCHEMA)
+        self._read_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="line-store-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                                     isolation_level=None)
+        # Only takes effect on a new file, before it switches to WAL and gets its first table
+        connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        return connection
+
+    def get_many(self, model, digests):
+        """
+        Look up crop digests of one model.
+
+        Returns:
+            dict: digest -> (text, score) for the digests the store has.
+        """
+        found = {}
+        digests = list(digests)
+        try:
+            with self._read_lock:
+                for start in range(0, len(digests), MAX_QUERY_KEYS):
+                    chunk = digests[start:start + MAX_QUERY_KEYS]
+                    rows = self._reader.execute(
+                        f"SELECT digest, text, score FROM lines WHERE model = ? AND digest IN ({', '.join('?' * len(chunk))})",
+                        [model] + chunk
+                    )
+                    for digest, text, score in rows:
+                        found[bytes(digest)] = (text, score)
+        except sqlite3.Error as e:
+            print(f"Line store lookup failed: {e}")
+            return {}
+        if found:
+            self._queue.put(("touch", model, list(found), None))
+        return found
+
+    def put_many(self, model, entries):
+        """Queue (digest, text, score) rows to be written."""
+        if entries:
+            self._queue.put(("put", model, None, list(entries)))
+
+    def status(self):
+        """File and size, for the stats command; cheap enough for every metrics scrape."""
+        try:
+            with self._read_lock:
+                size = self._size(self._reader)
+        except sqlite3.Error as e:
+            return {"path": self.path, "error": str(e)}
+        return {"path": self.path, "bytes": size, "max_bytes": self.max_bytes}
+
+    def close(self):
+        """Write what is queued and stop the writer."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(FLUSH_SECONDS * 5)
+
+    def _compact(self, connection):
+        """
+        Delete the least recently used rows until the store fits in COMPACT_TARGET of its cap,
+        then give the freed pages back.
+        """
+        size = self._size(connection)
+        if not self.max_bytes or size <= self.max_bytes:
+            return
+        rows = connection.execute("SELECT COUNT(*) FROM lines").fetchone()[0]
+        excess = int(rows * (1 - COMPACT_TARGET * self.max_bytes / size)) + 1
+        with _transaction(connection):
+            connection.execute(
+                "DELETE FROM lines WHERE rowid IN (SELECT rowid FROM lines ORDER BY used LIMIT ?)", (excess,)
+            )
+        # executescript steps the pragma to the end; execute would only free its first page
+        connection.executescript("PRAGMA incremental_vacuum;")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"Compacted line store {self.path}: removed {excess} of {rows} lines, {size} -> {self._size(connection)} bytes")
+
+    @staticmethod
+    def _size(connection):
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        pages = connection.execute("PRAGMA page_count").fetchone()[0]
+        free = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return (pages - free) * page_size
+
+    def _write_loop(self):
+        connection = self._connect()
+        last_check = 0.0
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = None
+            while len(batch) < FLUSH_BATCH:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()) if batch else None)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                if not batch:
+                    deadline = time.monotonic() + FLUSH_SECONDS
+                batch.append(item)
+            try:
+                self._write(connection, batch)
+                if self.max_bytes and time.monotonic() - last_check > SIZE_CHECK_SECONDS:
+                    last_check = time.monotonic()
+                    self._compact(connection)
+            except sqlite3.Error as e:
+                print(f"Line store write failed: {e}")
+        connection.close()
+
+    @staticmethod
+    def _write(connection, batch):
+        now = time.time()
+        rows = [(model, digest, text, score, now) for kind, model, _, entries in batch if kind == "put"
+                for digest, text, score in entries]
+        touched = [(now, model, digest) for kind, model, digests, _ in batch if kind == "touch" for digest in digests]
+        if not rows and not touched:
+            return
+        with _transaction(connection):
+            connection.executemany(
+                "INSERT INTO lines (model, digest, text, score, used) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (model, digest) DO UPDATE SET text = excluded.text, score = excluded.score, used = excluded.used",
+                rows
+            )
+            connection.executemany("UPDATE lines SET used = ? WHERE model = ? AND digest = ?", touched)
+
+@contextmanager
+def _transaction(connection):
+    """One write transaction on an autocommit connection, taking the write lock up front."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
@@ -0,0 +1,209 @@
+import bisect
+import threading
+import time
+from collections import deque
+
+# Histogram bucket upper bounds in seconds, also exported as Prometheus "le" labels
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PERCENTILE_WINDOW = 1024  # Recent observations kept per histogram for p50/p95/p99
+
+class LatencyHistogram:
+    """
+    Latency histogram with cumulative buckets for Prometheus and a window of recent samples for percentiles.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=PERCENTILE_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def percentiles(self, *quantiles):
+        """Percentiles of the recent window, nearest rank; None when nothing was observed."""
+        if not self.recent:
+            return [None] * len(quantiles)
+        samples = sorted(self.recent)
+        return [samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles]
+
+    def summary(self):
+        """Count, mean, p50/p95/p99 and max in milliseconds."""
+        p50, p95, p99 = self.percentiles(0.5, 0.95, 0.99)
+        to_ms = lambda value: None if value is None else round(value * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": to_ms(self.total / self.count) if self.count else None,
+            "p50_ms": to_ms(p50),
+            "p95_ms": to_ms(p95),
+            "p99_ms": to_ms(p99),
+            "max_ms": to_ms(self.max) if self.count else None
+        }
+
+class Metrics:
+    """
+    Thread-safe counters and latency histograms, keyed by name and labels.
+
+    Counters are updated from the event loop and the OCR worker threads alike.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}  # name -> {labels tuple: value}
+        self._histograms = {}  # name -> {labels tuple: LatencyHistogram}
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def observe_stages(self, timer, name="ocr_stage_seconds"):
+        """Record every stage of a StageTimer in the stage histogram."""
+        for stage, seconds in timer.stages.items():
+            self.observe(name, seconds, stage=stage)
+
+    def snapshot(self):
+        """
+        JSON-friendly view for the stats command.
+
+        Returns:
+            dict: {"counters": {name: {label string: value}}, "histograms": {name: {label string: summary}}}
+        """
+        with self._lock:
+            return {
+                "counters": {
+                    name: {_label_string(key): value for key, value in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "histograms": {
+                    name: {_label_string(key): histogram.summary() for key, histogram in series.items()}
+                    for name, series in self._histograms.items()
+                }
+            }
+
+    def render_prometheus(self, gauges=None):
+        """
+        Render everything in the Prometheus text exposition format.
+
+        Args:
+            gauges (dict): Extra gauge values by name, either a number or {labels tuple: number}.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_prometheus_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float('inf'),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_prometheus_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_prometheus_labels(key)} {histogram.total:.6f}")
+                    lines.append(f"{name}_count{_prometheus_labels(key)} {histogram.count}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {name} gauge")
+            series = value if isinstance(value, dict) else {(): value}
+            for key, number in series.items():
+                lines.append(f"{name}{_prometheus_labels(key)} {number}")
+        return "\n".join(lines) + "\n"
+
+class StageTimer:
+    """
+    Splits one request's latency into consecutive stages.
+
+    Each lap() charges the time since the previous lap (or since the timer was created)
+    to the named stage, so the stages of a request add up to its total latency. Decisions
+    made along the way (e.g. the preprocessing mode) can be noted next to the stages.
+    """
+
+    def __init__(self):
+        self.created = time.perf_counter()
+        self._last = self.created
+        self.stages = {}
+        self.notes = {}
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._last
+        self._last = now
+
+    def note(self, name, value):
+        """Record a value for the timings object, e.g. which way a decision went."""
+        self.notes[name] = value
+
+    def absorb(self, stages, rest, notes=None):
+        """
+        Charge stages measured elsewhere (e.g. in a worker process), and the part of the time
+        since the last lap they do not cover to the stage named rest. Notes made there are kept.
+        """
+        self.notes.update(notes or {})
+        now = time.perf_counter()
+        covered = 0.0
+        for stage, seconds in stages.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            covered += seconds
+        self.stages[rest] = self.stages.get(rest, 0.0) + max(0.0, now - self._last - covered)
+        self._last = now
+
+    def total(self):
+        return self._last - self.created
+
+    def summary(self):
+        """Stage durations and their total in milliseconds, and the notes, for the timings object of a response."""
+        timings = {f"{stage}_ms": round(seconds * 1000, 3) for stage, seconds in self.stages.items()}
+        timings["total_ms"] = round(self.total() * 1000, 3)
+        timings.update(self.notes)
+        return timings
+
+class NullTimer:
+    """StageTimer stand-in that records nothing, for callers that do not measure."""
+
+    stages = {}
+    notes = {}
+
+    def lap(self, stage):
+        pass
+
+    def note(self, name, value):
+        pass
+
+    def absorb(self, stages, rest, notes=None):
+        pass
+
+    def total(self):
+        return 0.0
+
+    def summary(self):
+        return {}
+
+NULL_TIMER = NullTimer()
+
+def _label_string(key):
+    return ",".join(f"{name}={value}" for name, value in key) or "total"
+
+def _prometheus_labels(key):
+    if not key:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in key)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(key, escaped)) + "}"
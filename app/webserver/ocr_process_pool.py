@@ -0,0 +1,466 @@
+import importlib
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import numpy as np
+
+import ocr_profiles
+from engine_cache import EngineWarming
+from metrics import StageTimer, NULL_TIMER
+from text_lines import LINE_CACHE_SIZE
+
+# Frames travel to the worker processes in reusable shared memory buffers; only the job
+# description (buffer name, shape and options) goes through the pipe.
+BUFFER_GRANULARITY = 1024 * 1024  # Buffers are rounded up to whole MB so nearby resolutions share them
+MAX_FREE_BUFFERS = 8  # Idle buffers kept for reuse; beyond that the smallest are released
+WORKER_ATTACHMENTS = 8  # Buffers a worker keeps mapped, least recently used are unmapped first
+STOP_TIMEOUT = 5  # Seconds a worker gets to exit on its own before it is terminated
+
+class ProcessWorkerPool:
+    """
+    OCR engine replicas in worker processes, for CPU-bound engines on many-core machines.
+
+    Each worker imports the engine modules and builds its own models, so N workers run N
+    inferences at once instead of one per engine. Where the platform has a fork server the
+    engine libraries are imported there once and every worker is forked from it, sharing those
+    pages copy-on-write. The models themselves are built in each worker after the fork, since
+    ONNX Runtime and torch thread pools do not survive a fork. On Windows workers are spawned
+    and import everything themselves.
+
+    Jobs go to the least loaded live worker: fewest jobs in flight, then least busy time. A
+    worker that exits is restarted and its jobs fail with a RuntimeError.
+    """
+
+    def __init__(self, processes, settings):
+        """
+        Args:
+            processes (int): Number of worker processes.
+            settings (dict): Worker configuration, see worker_settings().
+        """
+        self.processes = processes
+        self.settings = settings
+        methods = multiprocessing.get_all_start_methods()
+        self.start_method = 'forkserver' if 'forkserver' in methods else 'spawn'
+        self._context = multiprocessing.get_context(self.start_method)
+        if self.start_method == 'forkserver':
+            # Engine directories must be on sys.path before the fork server starts, it copies it
+            for name in settings["preload"]:
+                _add_engine_path(settings, name)
+            self._context.set_forkserver_preload(
+                ["numpy", "cv2", "engine_cache", "metrics"]
+                + [settings["engines"][name][1] for name in settings["preload"]]
+            )
+        self._buffers = FrameBuffers()
+        self._job_ids = itertools.count(1)
+        self._condition = threading.Condition()
+        self._workers = []
+        self._stopped = False
+
+    def start(self):
+        """Start the worker processes; blocks until the fork server (if any) has imported the engines."""
+        for index in range(self.processes):
+            worker = self._start_worker(index)
+            with self._condition:
+                if self._stopped:
+                    worker.stop()
+                    return
+                self._workers.append(worker)
+                self._condition.notify_all()
+
+    def stop(self):
+        """Stop every worker and free the frame buffers. Jobs still in flight fail."""
+        with self._condition:
+            self._stopped = True
+            workers = list(self._workers)
+        for worker in workers:
+            worker.stop()
+        self._buffers.close()
+
+    def process_image(self, engine, source, timer=NULL_TIMER, on_lines=None, **options):
+        """
+        Run process_image of an engine module in a worker process and wait for its result.
+
+        Args:
+            engine (str): Registered engine name.
+            source (str or np.ndarray): Image path, or a frame (copied into a shared memory buffer).
+            timer (StageTimer): Gets the worker's stage laps, and a "dispatch" stage for the
+                frame copy, the pipe round trip and any wait behind another job.
+            on_lines (callable): Called on the pool's receiver thread with the line-level
+                detections of each recognition batch, for engines with PROGRESSIVE_LINES.
+            **options: Keyword arguments for process_image; refine=True adds the character-level
+                split of the lines as "characters".
+
+        Raises:
+            EngineWarming: While no worker process is running yet.
+            RuntimeError: If the worker exited before answering.
+        """
+        buffer = None
+        try:
+            if isinstance(source, np.ndarray):
+                buffer = self._buffers.acquire(source.nbytes)
+                np.copyto(np.ndarray(source.shape, dtype=np.uint8, buffer=buffer.buf), source)
+                frame, path = (buffer.name, source.shape), None
+            else:
+                frame, path = None, source
+            worker = self._least_loaded()
+            if on_lines is not None:
+                options = dict(options, progressive=True)
+            future = worker.submit(next(self._job_ids), (engine, frame, path, options), on_lines)
+            result, stages, notes = future.result()
+        finally:
+            if buffer is not None:
+                self._buffers.release(buffer)
+        timer.absorb(stages, "dispatch", notes)
+        return result
+
+    def status(self):
+        """Per-worker load, for the stats and status commands."""
+        with self._condition:
+            workers = [worker.status() for worker in self._workers]
+        return {"start_method": self.start_method, "processes": self.processes, "workers": workers}
+
+    def _least_loaded(self):
+        with self._condition:
+            live = [worker for worker in self._workers if worker.alive]
+            if not live:
+                raise EngineWarming("OCR worker processes are starting, try again shortly")
+            worker = min(live, key=lambda worker: (worker.in_flight, worker.busy_seconds))
+            worker.in_flight += 1
+            return worker
+
+    def _start_worker(self, index, restarts=0):
+        return WorkerProcess(self, index, restarts)
+
+    def _restart(self, worker):
+        """Replace a worker whose process exited. Called from its receiver thread."""
+        with self._condition:
+            if self._stopped or worker not in self._workers:
+                return
+        print(f"OCR worker process {worker.index} exited, restarting it")
+        replacement = self._start_worker(worker.index, worker.restarts + 1)
+        with self._condition:
+            if self._stopped:
+                replacement.stop()
+                return
+            self._workers[self._workers.index(worker)] = replacement
+
+class WorkerProcess:
+    """One worker process, the pipe to it and the jobs it has not answered yet."""
+
+    def __init__(self, pool, index, restarts=0):
+        self.pool = pool
+        self.index = index
+        self.restarts = restarts
+        self.in_flight = 0  # Updated under the pool's condition
+        self.jobs = 0
+        self.busy_seconds = 0.0
+        self._pending = {}  # job id -> (Future, submit time, on_lines callback or None)
+        self._send_lock = threading.Lock()
+        self._closed = False  # Set once the receiver has seen the process exit
+        self._connection, child = pool._context.Pipe()
+        self.process = pool._context.Process(
+            target=worker_main, args=(index, child, pool.settings), name=f"ocr-process-{index}", daemon=True
+        )
+        self.process.start()
+        child.close()
+        self._receiver = threading.Thread(target=self._receive, name=f"ocr-process-{index}-receiver", daemon=True)
+        self._receiver.start()
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def submit(self, job_id, job, on_lines=None):
+        future = Future()
+        with self._send_lock:
+            try:
+                if self._closed:
+                    raise OSError("process exited")
+                self._pending[job_id] = (future, time.perf_counter(), on_lines)
+                self._connection.send((job_id,) + job)
+            except (OSError, ValueError) as e:
+                self._pending.pop(job_id, None)
+                self._finish(time.perf_counter())
+                raise RuntimeError(f"OCR worker process {self.index} is gone: {e}")
+        return future
+
+    def status(self):
+        return {
+            "index": self.index,
+            "pid": self.process.pid,
+            "alive": self.alive,
+            "in_flight": self.in_flight,
+            "jobs": self.jobs,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "restarts": self.restarts
+        }
+
+    def stop(self):
+        try:
+            with self._send_lock:
+                self._connection.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(STOP_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(STOP_TIMEOUT)
+        self._connection.close()
+
+    def _receive(self):
+        while True:
+            try:
+                message = self._connection.recv()
+            except (EOFError, OSError):
+                break
+            if len(message) == 2:
+                # Lines of a progressive job, ahead of its result
+                job_id, lines = message
+                with self._send_lock:
+                    entry = self._pending.get(job_id)
+                if entry is not None:
+                    entry[2](lines)
+                continue
+            job_id, result, stages, notes = message
+            with self._send_lock:
+                entry = self._pending.pop(job_id, None)
+            if entry is None:
+                continue
+            future, submitted, _ = entry
+            self._finish(submitted)
+            future.set_result((result, stages, notes))
+        # The process exited (or was stopped); fail what it still had
+        with self._send_lock:
+            self._closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future, submitted, _ in pending:
+            self._finish(submitted)
+            future.set_exception(RuntimeError(f"OCR worker process {self.index} exited"))
+        self.pool._restart(self)
+
+    def _finish(self, submitted):
+        with self.pool._condition:
+            self.in_flight -= 1
+            self.jobs += 1
+            self.busy_seconds += time.perf_counter() - submitted
+
+class FrameBuffers:
+    """Reusable shared memory segments that carry frames to the worker processes."""
+
+    def __init__(self):
+        self._free = []  # Idle segments, smallest first
+        self._all = {}  # name -> SharedMemory, every segment created
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        """Return an idle segment of at least size bytes, creating one if none fits."""
+        with self._lock:
+            for i, shm in enumerate(self._free):
+                if shm.size >= size:
+                    return self._free.pop(i)
+        shm = shared_memory.SharedMemory(create=True, size=-(-max(size, 1) // BUFFER_GRANULARITY) * BUFFER_GRANULARITY)
+        with self._lock:
+            self._all[shm.name] = shm
+        return shm
+
+    def release(self, shm):
+        with self._lock:
+            self._free.append(shm)
+            self._free.sort(key=lambda segment: segment.size)
+            dropped = self._free[:-MAX_FREE_BUFFERS] if len(self._free) > MAX_FREE_BUFFERS else []
+            del self._free[:len(dropped)]
+            for segment in dropped:
+                del self._all[segment.name]
+        for segment in dropped:
+            _release_segment(segment)
+
+    def close(self):
+        with self._lock:
+            segments = list(self._all.values())
+            self._all.clear()
+            self._free.clear()
+        for segment in segments:
+            _release_segment(segment)
+
+def worker_settings(engines, webserver_dir, preload, max_engines, memory_budget_mb, line_cache_entries=LINE_CACHE_SIZE,
+                    line_store=None):
+    """
+    Configuration every worker process starts from.
+
+    Args:
+        engines (dict): OCR_ENGINES of the server, name -> (directory, module).
+        webserver_dir (str): Directory the engine directories are in.
+        preload (dict): Engine name -> languages (None for its default) to build at startup.
+        max_engines (int): Models kept per engine in each worker.
+        memory_budget_mb (int): Memory budget of one engine's models in each worker.
+        line_cache_entries (int): Recognized line crops each worker remembers per engine, 0 for none.
+        line_store (tuple): (path, size cap in MB) of the on-disk line store the workers share, or None.
+    """
+    return {
+        "engines": dict(engines),
+        "webserver_dir": webserver_dir,
+        "preload": dict(preload),
+        "max_engines": max_engines,
+        "memory_budget_mb": memory_budget_mb,
+        "line_cache_entries": line_cache_entries,
+        "line_store": line_store,
+        "profiles_path": ocr_profiles.profiles_path(),
+        "default_profile": ocr_profiles.default_profile()
+    }
+
+def split_lines(module, lines):
+    """Character-level detections for line-level ones, as process_image returns with char_level 'True'."""
+    characters = []
+    for line in lines:
+        if len(line["text"]) > 1:
+            characters.extend(module.split_into_characters(line["text"], line["rect"], line["confidence"]))
+        else:
+            characters.append(line)
+    return characters
+
+class WorkerEngines:
+    """Engine modules of one worker process, imported in the background like the server's get_engine."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.modules = {}
+        self._loading = set()
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """
+        Return the loaded module of an engine, or start loading it.
+
+        Raises:
+            EngineWarming: While the module is loading.
+            RuntimeError: If the last load failed; the next request tries again.
+        """
+        module = self.modules.get(name)
+        if module is not None:
+            return module
+        with self._lock:
+            error = self._errors.pop(name, None)
+            if error is None:
+                self.preload(name, [])
+        if error is not None:
+            raise RuntimeError(error)
+        raise EngineWarming(f"OCR engine {name} is loading, try again shortly")
+
+    def preload(self, name, languages):
+        """Load an engine module and build its models for languages (None: its DEFAULT_LANG) in the background."""
+        if name in self.modules or name in self._loading:
+            return
+        self._loading.add(name)
+        threading.Thread(target=self._load, args=(name, languages), name=f"{name}-preload", daemon=True).start()
+
+    def _load(self, name, languages):
+        try:
+            _add_engine_path(self.settings, name)
+            module = importlib.import_module(self.settings["engines"][name][1])
+            module.ENGINE_CACHE.configure(self.settings["max_engines"], self.settings["memory_budget_mb"])
+            if hasattr(module, "LINE_CACHE"):
+                module.LINE_CACHE.configure(self.settings["line_cache_entries"])
+                if self.settings["line_store"]:
+                    module.LINE_CACHE.open_store(*self.settings["line_store"])
+            self.modules[name] = module
+            for lang in (languages if languages is not None else [module.DEFAULT_LANG]):
+                module.ENGINE_CACHE.preload(module.resolve_engine_config(lang))
+        except Exception as e:
+            print(f"Cannot load OCR engine {name}: {e}")
+            with self._lock:
+                self._errors[name] = f"OCR engine {name} cannot be loaded in this environment: {e}"
+        finally:
+            with self._lock:
+                self._loading.discard(name)
+
+def worker_main(index, connection, settings):
+    """
+    Serve OCR jobs from the pipe until it closes or a None job arrives.
+
+    A job is (job id, engine, frame, path, options) where frame is (buffer name, shape) or
+    None for a path. The reply is (job id, result dict, stage seconds, timer notes). With
+    progressive=True in the options and an engine with PROGRESSIVE_LINES, each recognition
+    batch goes out as (job id, lines) before it.
+    """
+    # Ctrl+C reaches the whole process group; the server stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ocr_profiles.configure(settings["profiles_path"], settings["default_profile"])
+    engines = WorkerEngines(settings)
+    for name, languages in settings["preload"].items():
+        engines.preload(name, languages)
+    attachments = OrderedDict()  # buffer name -> SharedMemory, least recently used first
+
+    while True:
+        try:
+            job = connection.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        job_id, engine, frame, path, options = job
+        timer = StageTimer()
+        refine = options.pop("refine", False)
+        progressive = options.pop("progressive", False)
+        image = None
+        try:
+            module = engines.get(engine)
+            if progressive and getattr(module, "PROGRESSIVE_LINES", False):
+                options["on_lines"] = lambda lines: connection.send((job_id, lines))
+            if frame is not None:
+                name, shape = frame
+                image = np.ndarray(shape, dtype=np.uint8, buffer=_attach(attachments, name).buf)
+            else:
+                image = path
+            result = module.process_image(image, timer=timer, **options)
+            module.release_gpu_resources()
+            if refine and result.get("status") == "success":
+                result["characters"] = split_lines(module, result["results"])
+        except EngineWarming as e:
+            result = {"status": "warming", "message": str(e)}
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        # Drop the buffer view before the buffer can be unmapped
+        image = None
+        try:
+            connection.send((job_id, result, timer.stages, timer.notes))
+        except (OSError, ValueError):
+            break
+
+    for shm in attachments.values():
+        shm.close()
+
+def _attach(attachments, name):
+    """Map a frame buffer once and keep it mapped for the next jobs that use it."""
+    shm = attachments.get(name)
+    if shm is not None:
+        attachments.move_to_end(name)
+        return shm
+    shm = attachments[name] = shared_memory.SharedMemory(name=name)
+    while len(attachments) > WORKER_ATTACHMENTS:
+        _, oldest = attachments.popitem(last=False)
+        oldest.close()
+    return shm
+
+def _add_engine_path(settings, name):
+    path = os.path.join(settings["webserver_dir"], settings["engines"][name][0])
+    if path not in sys.path:
+        sys.path.append(path)
+
+def _release_segment(shm):
+    try:
+        shm.close()
+        shm.unlink()
+    except BufferError:
+        # A frame view is still alive somewhere; the OS reclaims the mapping on exit
+        pass
+    except FileNotFoundError:
+        pass
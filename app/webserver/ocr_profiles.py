@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+
+# Named engine tuning profiles, selected per request with "profile=" or per connection with
+# "hello|profile=". A profile holds engine-neutral settings that each process_image module maps
+# to its own options (ONNX Runtime session options, PaddleOCR arguments, torch threads), plus
+# optional per-engine sections ("rapidocr": {...}) overriding them for one engine. An engine
+# ignores settings it has no equivalent for. Profiles are read once; restart the server after
+# editing ocr_profiles.json, since engines already built keep their settings.
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocr_profiles.json")
+DEFAULT_PROFILE = 'default'
+
+# Settings a profile may give and their types; a setting left out keeps the engine's own default
+PROFILE_SETTINGS = {
+    "provider": str,  # Execution provider: auto, cpu, cuda or dml
+    "intra_op_threads": int,  # Threads inside one operator
+    "inter_op_threads": int,  # Operators run in parallel
+    "det_limit_type": str,  # min: resize so the short side is at least det_limit_side_len, max: the long side at most
+    "det_limit_side_len": int,
+    "det_box_thresh": float,  # Minimum detection box score
+    "text_score": float,  # Minimum recognition score of a kept line
+    "rec_batch_size": int,  # Text lines recognized per batch
+    "use_angle_cls": bool,  # Classify and flip upside-down lines
+    "model_type": str  # mobile or server
+}
+PROVIDERS = ('auto', 'cpu', 'cuda', 'dml')
+LIMIT_TYPES = ('min', 'max')
+MODEL_TYPES = ('mobile', 'server')
+
+_profiles = None  # name -> profile dict, loaded on first use
+_default_profile = DEFAULT_PROFILE
+_path = PROFILES_PATH
+_lock = threading.Lock()
+
+def configure(path=None, default=None):
+    """
+    Load the profiles from path (default: ocr_profiles.json next to this file) and pick the default profile.
+
+    Raises:
+        ValueError: If the file is invalid or the default profile is not in it.
+    """
+    global _profiles, _default_profile, _path
+    with _lock:
+        profiles, file_default = _read_profiles(path or _path)
+        default = default or file_default
+        if default not in profiles:
+            raise ValueError(f"Unknown default profile: {default}")
+        _path = path or _path
+        _profiles = profiles
+        _default_profile = default
+
+def profiles():
+    """Loaded profiles by name, reading the profile file on first use."""
+    if _profiles is None:
+        configure()
+    return _profiles
+
+def default_profile():
+    profiles()
+    return _default_profile
+
+def profiles_path():
+    """File the profiles are read from, for processes that load them again."""
+    return _path
+
+def describe_profiles():
+    """Profile names with their descriptions, for the hello and status replies."""
+    return {name: profile.get("description", "") for name, profile in profiles().items()}
+
+def resolve_profile(name=None):
+    """
+    Validate a profile name from a request, None meaning the default profile.
+
+    Raises:
+        ValueError: If the profile is unknown.
+    """
+    if not name:
+        return default_profile()
+    if name not in profiles():
+        raise ValueError(f"Unknown profile: {name}")
+    return name
+
+def profile_settings(name, engine):
+    """
+    Settings of a profile for one engine: the shared settings with the engine's section applied over them.
+
+    Args:
+        name (str): Profile name, None for the default profile.
+        engine (str): Registered engine name, e.g. 'rapidocr'.
+
+    Returns:
+        dict: Setting name -> value, only for the settings the profile gives.
+    """
+    profile = profiles()[resolve_profile(name)]
+    settings = {key: value for key, value in profile.items() if key in PROFILE_SETTINGS}
+    settings.update(profile.get(engine, {}))
+    return settings
+
+def _read_profiles(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            document = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cannot read profiles from {path}: {e}")
+    profiles = document.get("profiles")
+    if not isinstance(profiles, dict) or not profiles:
+        raise ValueError(f"No profiles in {path}")
+    for name, profile in profiles.items():
+        for key, value in profile.items():
+            if key == "description":
+                continue
+            if key in PROFILE_SETTINGS:
+                _check_setting(name, key, value)
+            elif isinstance(value, dict):
+                # Per-engine section
+                for setting, engine_value in value.items():
+                    if setting not in PROFILE_SETTINGS:
+                        raise ValueError(f"Profile {name}: unknown {key} setting {setting}")
+                    _check_setting(name, setting, engine_value)
+            else:
+                raise ValueError(f"Profile {name}: unknown setting {key}")
+    return profiles, document.get("default", DEFAULT_PROFILE)
+
+def _check_setting(name, key, value):
+    expected = PROFILE_SETTINGS[key]
+    # bool is an int subclass, and JSON numbers like 1 are fine where a float is expected
+    valid = isinstance(value, expected) and not (expected is int and isinstance(value, bool))
+    if expected is float:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    if not valid:
+        raise ValueError(f"Profile {name}: {key} must be a {expected.__name__}, not {value!r}")
+    allowed = {"provider": PROVIDERS, "det_limit_type": LIMIT_TYPES, "model_type": MODEL_TYPES}.get(key)
+    if allowed and value not in allowed:
+        raise ValueError(f"Profile {name}: {key} must be one of {', '.join(allowed)}, not {value!r}")
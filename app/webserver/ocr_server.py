@@ -0,0 +1,1525 @@
+import argparse
+import asyncio
+import importlib
+import socket
+import json
+import logging
+import os
+import time
+import threading
+import uuid
+import signal
+import struct
+import sys
+import numpy as np
+from collections import OrderedDict, namedtuple
+from multiprocessing import shared_memory
+
+import ocr_profiles
+from engine_cache import EngineWarming
+from incremental_ocr import IncrementalSession
+from metrics import Metrics, StageTimer, NULL_TIMER
+from ocr_process_pool import ProcessWorkerPool, split_lines, worker_settings
+from result_cache import RESULT_CACHE_MB, ResultCache, frame_digest
+from line_store import LINE_STORE_MB
+from text_lines import LINE_CACHE_SIZE
+from result_codec import (
+    FORMAT_JSON, FORMAT_BINARY, RESULT_FORMATS, COMPRESSION_NONE, COMPRESSION_ZLIB, COMPRESSION_THRESHOLD,
+    add_metadata, append_json_fields, compress_payload, encode_result, is_binary_result
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Server configuration
+HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
+PORT = 9997         # Port to listen on (--port, the engine launchers pass their own)
+BUFFER_SIZE = 1024  # Buffer size for receiving data
+MAX_CONNECTIONS = 64  # Maximum number of concurrent connections (idle ones cost almost nothing)
+CONNECTION_TIMEOUT = 60  # Connection timeout in seconds
+MAX_WORKERS = 2  # Maximum number of worker threads for OCR processing (--workers)
+PROCESSES = 0  # Engine worker processes (--processes); 0 runs the engines on the worker threads
+MAX_PENDING_TASKS = 10  # Queued OCR requests before the server reports busy (--max-pending)
+BATCH_WINDOW_MS = 0  # How long a frame waits for others to share its engine call (--batch-window), 0 to not batch
+MAX_BATCH = 8  # Frames run together at most (--max-batch)
+MAX_IN_FLIGHT = 8  # OCR requests one connection may have outstanding before we stop reading from it
+STREAM_BUFFER_LIMIT = 1024 * 1024  # Read buffer per connection before the transport is paused
+METRICS_PORT = None  # Local port for the Prometheus text endpoint (--metrics-port), off by default
+
+# Protocol v2 framing, negotiated per connection with "hello|protocol=2".
+# Legacy clients keep the "<size>\r\n<payload>" text mode.
+PROTOCOL_LEGACY = 1
+PROTOCOL_V2 = 2
+FRAME_MAGIC = b'RS'
+FRAME_HEADER = struct.Struct('!2sBBII')  # magic, message type, flags, request id, payload length
+MSG_COMMAND = 1
+MSG_RESPONSE = 2
+MSG_PARTIAL = 3  # Progressive OCR: line-level detections, sent as soon as they are recognized
+MSG_REFINE = 4  # Progressive OCR: character-level detections replacing the lines sent so far
+MSG_END = 5  # Progressive OCR: end of frame with the final status, always the last message for a request
+FLAG_BINARY_RESULT = 0x01  # Response payload is a result_codec binary result, not JSON
+FLAG_COMPRESSED = 0x02  # Response payload is zlib compressed (inflate it before decoding)
+MAX_FRAME_SIZE = 256 * 1024 * 1024  # Upper bound for a single frame payload
+
+# OCR engines by the implementation name clients send: (engine directory, process_image module).
+# Each module is imported on the first request that names it, from its directory next to this file.
+WEBSERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+OCR_ENGINES = {
+    'easyocr': ('EasyOCR', 'process_image_easyocr'),
+    'paddleocr': ('PaddleOCR', 'process_image_paddleocr'),
+    'rapidocr': ('RapidOCR', 'process_image_rapidocr')
+}
+DEFAULT_ENGINE = 'rapidocr'  # Used when a request does not name an engine (--engine)
+MAX_CACHED_ENGINES = 3  # Initialized models kept per engine, e.g. one per language (--max-engines)
+ENGINE_MEMORY_BUDGET_MB = 4096  # Memory the cached models of one engine may use (--engine-memory)
+ENGINE_WAIT_SECONDS = 120  # How long a request from a legacy client waits for its engine to load
+
+# Image written by the client for read_image, and the raw layouts accepted by read_frame
+IMAGE_PATH = os.path.join(WEBSERVER_DIR, "image_to_process.png")
+PIXEL_FORMATS = {'BGRA': 4, 'RGB': 3, 'GRAY': 1}  # Bytes per pixel
+TRUE_FLAGS = {'true', '1', 'yes', 'on'}  # Spellings of boolean command arguments and options
+FALSE_FLAGS = {'false', '0', 'no', 'off'}
+
+# Shared memory frame slots: each slot is a little-endian header followed by the pixels
+SLOT_HEADER = struct.Struct('<QIIII40x')  # sequence, width, height, stride, format code (64 bytes)
+SLOT_FORMATS = ['BGRA', 'RGB', 'GRAY']  # Index is the format code in the slot header
+SLOT_ALIGNMENT = 64
+MAX_SHARED_MEMORY = 1024 * 1024 * 1024  # Upper bound for one client's frame slots
+
+# Server state, only touched from the event loop thread so no locking is needed
+active_connections = 0  # Track active connections
+client_writers = set()  # Open client streams, closed on shutdown
+ocr_scheduler = None  # OcrScheduler, created when the server starts
+process_pool = None  # ProcessWorkerPool when the engines run in worker processes
+result_cache = None  # ResultCache of encoded responses for repeated frames, None when it is off
+metrics = Metrics()  # Request counters and per-stage latency histograms, shared with the workers
+default_engine = DEFAULT_ENGINE
+enabled_engines = set(OCR_ENGINES)  # Engines this server may load (--engines)
+max_cached_engines = MAX_CACHED_ENGINES
+engine_memory_budget_mb = ENGINE_MEMORY_BUDGET_MB
+line_cache_entries = LINE_CACHE_SIZE  # Recognized line crops remembered per engine (--line-cache)
+line_store = None  # (path, size cap in MB) of the on-disk line store (--line-store), None to keep lines in memory only
+
+# Loaded engine modules, shared by every connection and worker thread
+engine_modules = {}
+engine_import_locks = {name: threading.Lock() for name in OCR_ENGINES}
+engine_states = {}  # name -> {"state": loading/ready/failed, "import_seconds", "error"} once a load started
+
+# Cold start measurement: the first successful OCR result, in seconds since the server started
+SERVER_START_TIME = time.time()
+first_result_seconds = None
+
+class SchedulerBusy(Exception):
+    """Raised when the OCR queue is full."""
+
+class JobSuperseded(Exception):
+    """Set on a queued OCR job that a newer frame from the same client replaced."""
+
+# A queued scheduler job
+PendingJob = namedtuple('PendingJob', ['future', 'func', 'args', 'batch_key', 'submitted'])
+
+# Arguments of run_ocr_task, by name
+OcrJob = namedtuple('OcrJob', [
+    'engine', 'source', 'lang', 'char_level', 'hdr_support', 'extra', 'result_format', 'compress_threshold',
+    'emit', 'timer', 'report_timings', 'profile', 'use_cache', 'incremental', 'preprocess_session', 'engine_wait'
+], defaults=(True, None, None, None))
+
+class OcrScheduler:
+    """
+    Bounded pool of OCR worker threads with latest-frame-wins coalescing and micro-batching.
+    
+    Jobs are queued under a key, normally one per client connection. Submitting a job
+    under a key whose previous job has not started yet replaces that job in place, so
+    workers never spend time on a frame that is already stale.
+    
+    With a batch window, a worker that takes a job with a batch key waits until the window
+    after that job was submitted has passed (or max_batch jobs are together) and takes every
+    queued job with the same batch key along, handing them to batch_func as one batch. Jobs
+    from several clients that need the same engine call then share it, at the cost of up to
+    one window of extra latency.
+    """
+    
+    def __init__(self, workers, max_pending, batch_window=0.0, max_batch=MAX_BATCH, batch_func=None):
+        """
+        Args:
+            workers (int): Worker threads.
+            max_pending (int): Queued jobs before submit raises SchedulerBusy.
+            batch_window (float): Seconds a batchable job waits for others, 0 to never batch.
+            max_batch (int): Most jobs in one batch.
+            batch_func (callable): Runs a batch: takes the list of job args tuples and returns
+                one (result, error) pair per job.
+        """
+        self.workers = workers
+        self.max_pending = max_pending
+        self.batch_window = batch_window if batch_func is not None else 0.0
+        self.max_batch = max(1, max_batch)
+        self.batch_func = batch_func
+        self._pending = OrderedDict()  # key -> PendingJob, oldest first
+        self._collecting = set()  # Batch keys a worker is gathering jobs for
+        self._condition = threading.Condition()
+        self._running = 0
+        self._stopped = False
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"ocr-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    @property
+    def queue_depth(self):
+        return len(self._pending)
+    
+    @property
+    def running(self):
+        return self._running
+    
+    def submit(self, key, func, *args, batch_key=None):
+        """
+        Queue func(*args) on the worker pool. Must be called from the event loop thread.
+        
+        Jobs with equal batch keys may run together through batch_func instead of func.
+        
+        Returns:
+            asyncio.Future: Resolves to the return value of func, or fails with
+            JobSuperseded if a newer job for the same key replaces it first.
+        """
+        future = asyncio.get_running_loop().create_future()
+        with self._condition:
+            if self._stopped:
+                raise SchedulerBusy("Server is shutting down")
+            replaced = self._pending.get(key)
+            if replaced is None and len(self._pending) >= self.max_pending:
+                raise SchedulerBusy("Server is busy, try again later")
+            # Assigning to an existing key keeps its place in the queue
+            self._pending[key] = PendingJob(future, func, args, batch_key, time.perf_counter())
+            # A worker gathering a batch waits on the same condition, wake it too
+            if self.batch_window:
+                self._condition.notify_all()
+            else:
+                self._condition.notify()
+        if replaced is not None:
+            replaced[0].set_exception(JobSuperseded())
+        return future
+    
+    def cancel(self, *keys):
+        """Drop the queued (not yet running) jobs for the given keys, if any."""
+        with self._condition:
+            jobs = [self._pending.pop(key, None) for key in keys]
+        for job in jobs:
+            if job is not None:
+                job.future.cancel()
+    
+    def stop(self):
+        """Stop the workers and cancel every queued job. Running jobs finish in the background."""
+        with self._condition:
+            self._stopped = True
+            jobs = list(self._pending.values())
+            self._pending.clear()
+            self._condition.notify_all()
+        for job in jobs:
+            job.future.cancel()
+    
+    def _take(self, batch_key=None, limit=None):
+        """
+        Pop queued jobs, oldest first. Call with the condition held.
+        
+        Without a batch key: the first job whose batch is not being gathered by another worker.
+        With one: up to limit jobs with that batch key.
+        """
+        taken = []
+        for key, job in list(self._pending.items()):
+            if batch_key is None:
+                if job.batch_key is None or job.batch_key not in self._collecting:
+                    return [self._pending.pop(key)]
+            elif job.batch_key == batch_key:
+                if len(taken) >= limit:
+                    break
+                taken.append(self._pending.pop(key))
+        return taken
+    
+    def _worker(self):
+        while True:
+            with self._condition:
+                batch = []
+                while not self._stopped:
+                    batch = self._take()
+                    if batch:
+                        break
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                batch_key = batch[0].batch_key
+                if batch_key is not None and self.batch_window > 0 and self.max_batch > 1:
+                    self._collecting.add(batch_key)
+                    deadline = batch[0].submitted + self.batch_window
+                    while True:
+                        batch += self._take(batch_key, self.max_batch - len(batch))
+                        remaining = deadline - time.perf_counter()
+                        if len(batch) >= self.max_batch or remaining <= 0 or self._stopped:
+                            break
+                        self._condition.wait(remaining)
+                    self._collecting.discard(batch_key)
+                    # Jobs of this batch that arrived too late may go to an idle worker now
+                    self._condition.notify_all()
+                self._running += len(batch)
+            
+            if len(batch) == 1:
+                outcomes = [self._run(batch[0].func, *batch[0].args)]
+            else:
+                outcomes = self._run(self.batch_func, [job.args for job in batch])
+                if outcomes[1] is not None:
+                    outcomes = [(None, outcomes[1])] * len(batch)
+                else:
+                    outcomes = outcomes[0]
+            with self._condition:
+                self._running -= len(batch)
+            # Release the jobs' frames (they may be shared memory views) before waking the loop
+            futures = [job.future for job in batch]
+            del batch
+            for future, (result, error) in zip(futures, outcomes):
+                try:
+                    future.get_loop().call_soon_threadsafe(resolve_future, future, result, error)
+                except RuntimeError:
+                    # The event loop has already shut down
+                    pass
+    
+    @staticmethod
+    def _run(func, *args):
+        try:
+            return func(*args), None
+        except Exception as e:
+            return None, e
+
+def resolve_future(future, result, error):
+    """Complete a scheduler future on the event loop thread unless it was cancelled."""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+def resolve_engine(implementation):
+    """
+    Map the implementation field of a request (e.g. "RapidOCR") to a registered engine name.
+    
+    Raises:
+        ValueError: If the engine is unknown or not enabled on this server.
+    """
+    name = (implementation or default_engine).strip().lower()
+    if name not in OCR_ENGINES:
+        raise ValueError(f"Unknown OCR engine: {implementation}")
+    if name not in enabled_engines:
+        raise ValueError(f"OCR engine {implementation} is not enabled on this server")
+    return name
+
+def load_engine(name):
+    """
+    Import the process_image module of an engine on this thread and return it.
+    
+    Importing only loads the engine libraries; models are built per language by the
+    module's ENGINE_CACHE.
+    """
+    module = engine_modules.get(name)
+    if module is not None:
+        return module
+    with engine_import_locks[name]:
+        module = engine_modules.get(name)
+        if module is None:
+            directory, module_name = OCR_ENGINES[name]
+            path = os.path.join(WEBSERVER_DIR, directory)
+            if path not in sys.path:
+                sys.path.append(path)
+            logger.info(f"Loading OCR engine {name}")
+            engine_states[name] = {"state": "loading"}
+            start_time = time.time()
+            try:
+                module = importlib.import_module(module_name)
+            except ImportError as e:
+                message = f"OCR engine {name} is not installed in this environment: {e}"
+                engine_states[name] = {"state": "failed", "error": message}
+                raise RuntimeError(message)
+            except Exception as e:
+                engine_states[name] = {"state": "failed", "error": str(e)}
+                raise
+            module.ENGINE_CACHE.configure(max_cached_engines, engine_memory_budget_mb)
+            if hasattr(module, "LINE_CACHE"):
+                module.LINE_CACHE.configure(line_cache_entries)
+                if line_store is not None:
+                    module.LINE_CACHE.open_store(*line_store)
+            engine_modules[name] = module
+            engine_states[name] = {"state": "ready", "import_seconds": round(time.time() - start_time, 3)}
+            logger.info(f"Loaded OCR engine {name} in {time.time() - start_time:.2f} seconds")
+    return module
+
+def get_engine(name, wait=None):
+    """
+    Return the process_image module of an engine if it is loaded, otherwise start loading it.
+    
+    Args:
+        name (str): Registered engine name.
+        wait (float): Seconds to wait for a load that is running, loading the module on this
+            thread if none is; None to raise EngineWarming right away.
+    
+    Raises:
+        EngineWarming: While the module is loading in the background.
+        RuntimeError: If the last load failed; the next request tries again.
+    """
+    module = engine_modules.get(name)
+    if module is not None:
+        return module
+    state = engine_states.get(name, {})
+    if state.get("state") == "failed":
+        engine_states.pop(name, None)
+        raise RuntimeError(state["error"])
+    if wait is not None:
+        lock = engine_import_locks[name]
+        if lock.acquire(timeout=wait):
+            lock.release()
+            return load_engine(name)
+    elif state.get("state") != "loading":
+        start_preload(name, [])
+    raise EngineWarming(f"OCR engine {name} is loading, try again shortly")
+
+def wait_for_models(module, lang, profile, wait):
+    """
+    Wait up to wait seconds for an engine module's models for lang to be built, if wait is set.
+    
+    Raises:
+        EngineWarming: If they are still initializing after that.
+        RuntimeError: If building them failed.
+    """
+    if wait is not None:
+        module.ENGINE_CACHE.wait(module.resolve_engine_config(lang, profile), wait)
+
+def start_preload(name, languages):
+    """
+    Load an engine module and build its models for the given languages on a background thread.
+    
+    Args:
+        name (str): Registered engine name.
+        languages (list): Languages to build models for; None for the module's DEFAULT_LANG.
+    """
+    engine_states.setdefault(name, {"state": "loading"})
+    
+    def preload():
+        try:
+            module = load_engine(name)
+        except Exception as e:
+            logger.error(f"Cannot preload OCR engine {name}: {e}")
+            return
+        for lang in (languages if languages is not None else [module.DEFAULT_LANG]):
+            module.ENGINE_CACHE.preload(module.resolve_engine_config(lang))
+    
+    threading.Thread(target=preload, name=f"{name}-preload", daemon=True).start()
+
+def parse_preload(spec):
+    """
+    Parse a --preload value such as "rapidocr,paddleocr:ja+en" into {engine: languages}.
+    
+    Languages are None for an engine given without any, meaning its default language.
+    """
+    engines = {}
+    if spec.strip().lower() in ("", "none"):
+        return engines
+    for item in spec.split(","):
+        name, _, languages = item.strip().partition(":")
+        name = name.strip().lower()
+        if name not in OCR_ENGINES:
+            raise ValueError(f"Unknown OCR engine: {name}")
+        if languages:
+            engines.setdefault(name, []).extend(lang.strip() for lang in languages.split("+") if lang.strip())
+        else:
+            engines.setdefault(name, None)
+    return engines
+
+def engine_status():
+    """
+    Report the load state of every enabled engine and of its models.
+    
+    Returns:
+        dict: Engine name -> {"state", "import_seconds", "models", ...}
+    """
+    engines = {}
+    for name in sorted(enabled_engines):
+        status = dict(engine_states.get(name, {"state": "idle"}))
+        module = engine_modules.get(name)
+        if module is not None:
+            status.update(module.ENGINE_CACHE.status())
+            if hasattr(module, "LINE_CACHE"):
+                status["line_cache"] = module.LINE_CACHE.status()
+        engines[name] = status
+    return engines
+
+def server_stats():
+    """
+    Snapshot for the stats command: connections, queue, counters, latency percentiles and engines.
+    """
+    snapshot = metrics.snapshot()
+    return {
+        "uptime_seconds": round(time.time() - SERVER_START_TIME, 3),
+        "active_connections": active_connections,
+        "queue": {
+            "depth": ocr_scheduler.queue_depth,
+            "running": ocr_scheduler.running,
+            "workers": ocr_scheduler.workers,
+            "max_pending": ocr_scheduler.max_pending,
+            "batch_window_ms": round(ocr_scheduler.batch_window * 1000, 3),
+            "max_batch": ocr_scheduler.max_batch
+        },
+        "counters": snapshot["counters"],
+        "latency": snapshot["histograms"],
+        "engines": engine_status(),
+        "processes": process_pool.status() if process_pool is not None else None,
+        "result_cache": result_cache.status() if result_cache is not None else None
+    }
+
+def prometheus_gauges():
+    """Point-in-time values exported next to the counters and histograms."""
+    gauges = {
+        "ocr_active_connections": active_connections,
+        "ocr_queue_depth": ocr_scheduler.queue_depth,
+        "ocr_jobs_running": ocr_scheduler.running,
+        "ocr_uptime_seconds": round(time.time() - SERVER_START_TIME, 3)
+    }
+    memory = {}
+    models = {}
+    line_lookups = {}
+    line_store_bytes = {}
+    for name, status in engine_status().items():
+        if "memory_mb" in status:
+            memory[(("engine", name),)] = status["memory_mb"]
+        for model in status.get("models", []):
+            key = (("engine", name), ("state", model["state"]))
+            models[key] = models.get(key, 0) + 1
+        if "line_cache" in status:
+            line_lookups[(("engine", name), ("result", "hit"))] = status["line_cache"]["hits"]
+            line_lookups[(("engine", name), ("result", "miss"))] = status["line_cache"]["misses"]
+            if "bytes" in (status["line_cache"]["store"] or {}):
+                line_store_bytes[(("engine", name),)] = status["line_cache"]["store"]["bytes"]
+    if memory:
+        gauges["ocr_engine_memory_mb"] = memory
+    if models:
+        gauges["ocr_engine_models"] = models
+    if line_lookups:
+        gauges["ocr_line_cache_lookups"] = line_lookups
+    if line_store_bytes:
+        gauges["ocr_line_store_bytes"] = line_store_bytes
+    if process_pool is not None:
+        gauges["ocr_process_jobs_in_flight"] = {
+            (("worker", str(worker["index"])),): worker["in_flight"] for worker in process_pool.status()["workers"]
+        }
+    if result_cache is not None:
+        cache = result_cache.status()
+        gauges["ocr_result_cache_bytes"] = cache["bytes"]
+        gauges["ocr_result_cache_entries"] = cache["entries"]
+    return gauges
+
+async def handle_metrics_request(reader, writer):
+    """
+    Answer a scrape on the metrics port with the Prometheus text format, whatever the path.
+    """
+    try:
+        await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), CONNECTION_TIMEOUT)
+        body = metrics.render_prometheus(prometheus_gauges()).encode('utf-8')
+        writer.write(
+            b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            + f"Content-Length: {len(body)}\r\n\r\n".encode('ascii') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError) as e:
+        logger.debug(f"Metrics request failed: {e}")
+    finally:
+        writer.close()
+
+async def handle_client_connection(reader, writer):
+    """
+    Handle a client connection.
+    """
+    global active_connections
+    addr = writer.get_extra_info('peername')
+    
+    # Check if we can handle more connections
+    if active_connections >= MAX_CONNECTIONS:
+        logger.warning(f"Maximum connections reached. Rejecting connection from {addr}")
+        writer.close()
+        return
+    
+    active_connections += 1
+    client_writers.add(writer)
+    metrics.inc("ocr_connections_total")
+    logger.info(f"Connected by {addr}. Active connections: {active_connections}")
+    
+    # Disable Nagle once for the whole connection
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    
+    # Every connection starts in legacy text mode until it negotiates v2
+    protocol = PROTOCOL_LEGACY
+    result_format = FORMAT_JSON  # OCR result encoding, negotiated with "hello|format=binary"
+    compress_threshold = None  # Smallest OCR response to compress, None when compression is off
+    report_timings = False  # Add a "timings" object to OCR responses unless a request says otherwise
+    session_profile = None  # Tuning profile for requests that do not name one, set with "hello|profile="
+    session_incremental = False  # OCR only what changed since the previous frame, set with "hello|incremental=true"
+    incremental_sessions = {}  # stream option -> IncrementalSession with that stream's previous frame
+    request_id = 0
+    frame_slots = None  # Shared memory frame slots opened by this client
+    source = None
+    connection_key = object()  # Coalescing key for this client's frames
+    queued_keys = set()  # Scheduler keys of this client's jobs, cancelled when it disconnects
+    connection_id = uuid.uuid4().hex[:8]  # Names this client's preprocessing sessions in the engine processes
+    last_response = None  # Task sending the most recent untagged OCR response
+    response_tasks = set()
+    in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+    
+    try:
+        while True:
+            # Receive data from the client
+            try:
+                if protocol == PROTOCOL_V2:
+                    frame = await asyncio.wait_for(receive_frame(reader), CONNECTION_TIMEOUT)
+                    if frame is None:
+                        logger.info(f"Client {addr} disconnected")
+                        break
+                    msg_type, flags, request_id, data = frame
+                    if msg_type != MSG_COMMAND:
+                        logger.warning(f"Ignoring unexpected message type {msg_type} from {addr}")
+                        continue
+                else:
+                    request_id = 0
+                    data = await asyncio.wait_for(reader.read(BUFFER_SIZE), CONNECTION_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Connection with {addr} timed out")
+                break
+            
+            # If no data, the client has closed the connection
+            if not data:
+                logger.info(f"Client {addr} disconnected")
+                break
+            timer = StageTimer()
+            
+            # Split the command line from any binary body that follows the first newline
+            newline = data.find(b'\n')
+            if newline >= 0:
+                command = bytes(data[:newline]).decode('utf-8').strip()
+                body = memoryview(data)[newline + 1:]
+            else:
+                command = bytes(data).decode('utf-8').strip()
+                body = memoryview(b'')
+            logger.info(f"Received command: {command}")
+            name, args, options = parse_command(command)
+            metrics.inc("ocr_commands_total", command=name)
+            
+            # A request id (id= option, or a non-zero v2 header id) tags the response with it;
+            # tagged OCR responses are sent as soon as they are ready, untagged ones in order
+            tagged = "id" in options or request_id != 0
+            if "id" in options:
+                try:
+                    request_id = int(options["id"])
+                    if not 0 <= request_id <= 0xFFFFFFFF:
+                        raise ValueError
+                except ValueError:
+                    await send_json(writer, {"status": "error", "message": f"Invalid request id: {options['id']}"}, protocol)
+                    continue
+            
+            if name == "hello":
+                try:
+                    requested_profile = ocr_profiles.resolve_profile(options.get("profile", session_profile))
+                    requested_timings = parse_flag(options.get("timings", False))
+                    requested_incremental = parse_flag(options.get("incremental", False))
+                except ValueError as e:
+                    await send_json(writer, {"status": "error", "message": str(e)}, protocol, request_id, tagged)
+                    continue
+                session_profile = requested_profile
+                # Negotiate the protocol and result format; the reply still uses the framing the client spoke in
+                requested = options.get("protocol", str(PROTOCOL_LEGACY))
+                accepted = PROTOCOL_V2 if requested == str(PROTOCOL_V2) else PROTOCOL_LEGACY
+                requested_format = options.get("format", FORMAT_JSON).lower()
+                result_format = requested_format if requested_format in RESULT_FORMATS else FORMAT_JSON
+                # Compression is announced in the v2 frame flags, so legacy framing never compresses
+                compress_threshold = None
+                if accepted == PROTOCOL_V2 and options.get("compress", COMPRESSION_NONE).lower() == COMPRESSION_ZLIB:
+                    try:
+                        compress_threshold = max(0, int(options.get("compress_threshold", COMPRESSION_THRESHOLD)))
+                    except ValueError:
+                        compress_threshold = COMPRESSION_THRESHOLD
+                report_timings = requested_timings
+                session_incremental = requested_incremental
+                reply = {
+                    "status": "success",
+                    "protocol": accepted,
+                    "format": result_format,
+                    "timings": report_timings,
+                    "incremental": session_incremental,
+                    "compress": COMPRESSION_NONE if compress_threshold is None else COMPRESSION_ZLIB,
+                    "profile": session_profile,
+                    "profiles": sorted(ocr_profiles.profiles()),
+                    "max_frame_size": MAX_FRAME_SIZE,
+                    "max_in_flight": MAX_IN_FLIGHT
+                }
+                if compress_threshold is not None:
+                    reply["compress_threshold"] = compress_threshold
+                await send_json(writer, reply, protocol, request_id, tagged)
+                protocol = accepted
+                logger.info(f"Client {addr} negotiated protocol v{protocol}, {result_format} results")
+            
+            elif name == "status":
+                # Engine readiness and timings; clients poll this instead of the ready flag files
+                reply = {
+                    "status": "success",
+                    "uptime_seconds": round(time.time() - SERVER_START_TIME, 3),
+                    "first_result_seconds": first_result_seconds,
+                    "default_engine": default_engine,
+                    "default_profile": ocr_profiles.default_profile(),
+                    "profiles": ocr_profiles.describe_profiles(),
+                    "engines": engine_status(),
+                    "processes": process_pool.status() if process_pool is not None else None
+                }
+                await send_json(writer, reply, protocol, request_id, tagged)
+            
+            elif name == "stats":
+                # Counters, queue state and per-stage latency percentiles
+                reply = {"status": "success"}
+                reply.update(server_stats())
+                await send_json(writer, reply, protocol, request_id, tagged)
+            
+            elif name == "shm_open":
+                # Create (or attach to) the shared memory frame slots for this connection
+                try:
+                    if frame_slots is not None:
+                        frame_slots.close()
+                        frame_slots = None
+                    frame_slots = SharedFrameSlots(
+                        int(options.get("slots", 2)),
+                        int(options["slot_size"]),
+                        options.get("name")
+                    )
+                    reply = {"status": "success"}
+                    reply.update(frame_slots.describe())
+                    logger.info(f"Opened shared memory frame slots for {addr}: {frame_slots.describe()}")
+                except (KeyError, ValueError, OSError) as e:
+                    reply = {"status": "error", "message": f"Cannot open shared memory: {e}"}
+                    logger.warning(reply["message"])
+                await send_json(writer, reply, protocol, request_id, tagged)
+            
+            elif name == "shm_close":
+                if frame_slots is not None:
+                    frame_slots.close()
+                    frame_slots = None
+                await send_json(writer, {"status": "success"}, protocol, request_id, tagged)
+            
+            elif name in ("read_image", "read_frame"):
+                # Parse parameters if provided
+                lang = 'english'  # Default language
+                implementation = default_engine
+                char_level_rec = 'True'
+                hdr_support_rec = 'False'
+                
+                if len(args) > 0 and args[0]:
+                    lang = args[0]
+                if len(args) > 1 and args[1]:
+                    implementation = args[1]
+                if len(args) > 2 and args[2]:
+                    char_level_rec = args[2]
+                if len(args) > 3 and args[3]:
+                    hdr_support_rec = args[3]
+
+                # read_frame carries the raw pixels in-band, read_image names a shared
+                # memory slot or falls back to the shared PNG
+                source = IMAGE_PATH
+                sequence = None
+                try:
+                    engine = resolve_engine(implementation)
+                    profile = ocr_profiles.resolve_profile(options.get("profile", session_profile))
+                    # The engines compare char_level with 'True' and echo it in the result; the HDR
+                    # flag goes to them as a real bool, since any non-empty string is truthy
+                    char_level = str(parse_flag(char_level_rec))
+                    hdr_support = parse_flag(hdr_support_rec)
+                    request_timings = parse_flag(options.get("timings", report_timings))
+                    coalesce = parse_flag(options.get("coalesce", True))
+                    progressive = parse_flag(options.get("progressive", False))
+                    request_incremental = parse_flag(options.get("incremental", session_incremental))
+                    use_cache = parse_flag(options.get("cache", True))
+                except ValueError as e:
+                    await send_json(writer, {"status": "error", "message": str(e)}, protocol, request_id, tagged)
+                    logger.warning(f"Rejected request: {e}")
+                    continue
+                if name == "read_frame" or "slot" in options:
+                    try:
+                        if name == "read_frame":
+                            if protocol != PROTOCOL_V2:
+                                raise ValueError("read_frame requires protocol v2")
+                            source = frame_from_buffer(body, options)
+                        else:
+                            if frame_slots is None:
+                                raise ValueError("No shared memory open, send shm_open first")
+                            expected = int(options["seq"]) if "seq" in options else None
+                            source, sequence = frame_slots.frame(int(options["slot"]), expected)
+                    except ValueError as e:
+                        await send_json(writer, {"status": "error", "message": str(e)}, protocol, request_id, tagged)
+                        logger.warning(f"Rejected frame: {e}")
+                        continue
+                
+                # Log the OCR engine and language being used
+                logger.info(f"Using {engine} ({profile} profile) with language: {lang}, character-level: {char_level}, HDR support: {hdr_support}")
+                
+                # Process image with the selected engine on the worker pool; a newer frame from this client
+                # (or from the same stream=, if given) replaces one still waiting in the queue
+                # unless coalescing is turned off
+                extra = {}
+                if sequence is not None:
+                    extra.update({"slot": int(options["slot"]), "sequence": sequence})
+                if tagged:
+                    extra["request_id"] = request_id
+                # A trace id (the client's trace=, or generated when timings are requested) ties
+                # the response to the server log lines of the request
+                trace_id = options.get("trace") or (uuid.uuid4().hex[:16] if request_timings else None)
+                if trace_id:
+                    extra["trace_id"] = trace_id
+                if coalesce:
+                    coalesce_key = (connection_key, options.get("stream"))
+                else:
+                    # A key of its own, still tied to this client so a disconnect cancels the job
+                    coalesce_key = (connection_key, object())
+                
+                # Progressive requests get their lines as soon as they are recognized instead of
+                # one response at the end; the messages carry the request id in their frame header
+                emit = None
+                if progressive:
+                    if protocol != PROTOCOL_V2:
+                        await send_json(writer, {"status": "error", "message": "progressive requires protocol v2"}, protocol, request_id, tagged)
+                        continue
+                    emit = make_emitter(writer, protocol, request_id)
+                
+                # Incremental requests recognize only the regions that changed since the stream's
+                # previous frame; progressive ones always get a full pass
+                incremental = None
+                if emit is None and request_incremental:
+                    incremental = incremental_sessions.get(options.get("stream"))
+                    if incremental is None:
+                        incremental = incremental_sessions[options.get("stream")] = IncrementalSession()
+                
+                # With HDR support, each stream keeps its preprocessing mode until its scene changes
+                preprocess_session = f"{connection_id}/{options.get('stream', '')}" if hdr_support else None
+                
+                # Legacy clients only tell success from error, so their requests wait for a loading
+                # engine instead of being answered "warming"
+                engine_wait = ENGINE_WAIT_SECONDS if protocol != PROTOCOL_V2 else None
+                
+                # Frames from any client that need the same engine call may share it (--batch-window)
+                batch_key = (engine, lang, char_level, hdr_support, profile, engine_wait) if emit is None and incremental is None else None
+                
+                # Stop reading from this client while it already has MAX_IN_FLIGHT requests outstanding
+                timer.lap("decode")
+                await in_flight.acquire()
+                try:
+                    future = ocr_scheduler.submit(
+                        coalesce_key, run_ocr_task, engine, source, lang, char_level, hdr_support,
+                        extra, result_format, compress_threshold, emit, timer, request_timings, profile, use_cache,
+                        incremental, preprocess_session, engine_wait, batch_key=batch_key
+                    )
+                except SchedulerBusy as e:
+                    in_flight.release()
+                    metrics.inc("ocr_rejected_total", engine=engine)
+                    await send_json(writer, {"status": "error", "message": str(e)}, protocol, request_id, tagged)
+                    logger.warning("Rejected task due to server load")
+                    continue
+                finally:
+                    # Only the queued job keeps the frame (and any slot view) alive
+                    source = None
+                
+                # Keep reading commands while OCR runs
+                task = asyncio.create_task(send_ocr_response(
+                    writer, future, None if tagged else last_response, protocol, request_id, tagged, timer,
+                    engine, MSG_RESPONSE if emit is None else MSG_END, trace_id
+                ))
+                if not tagged:
+                    last_response = task
+                response_tasks.add(task)
+                task.add_done_callback(response_tasks.discard)
+                task.add_done_callback(lambda _: in_flight.release())
+                queued_keys.add(coalesce_key)
+                if not coalesce:
+                    # A key of its own is never used again once its job is done
+                    task.add_done_callback(lambda _, key=coalesce_key: queued_keys.discard(key))
+            else:
+                # Unknown command
+                await send_json(writer, {"status": "error", "message": "Unknown command"}, protocol, request_id, tagged)
+                logger.info(f"Unknown command: {command}")
+    
+    except Exception as e:
+        logger.error(f"Error handling client connection: {e}")
+    
+    finally:
+        # Clean up the connection
+        source = None
+        ocr_scheduler.cancel(*queued_keys)
+        for task in list(response_tasks):
+            task.cancel()
+        if frame_slots is not None:
+            frame_slots.close()
+        client_writers.discard(writer)
+        writer.close()
+        active_connections -= 1
+        logger.info(f"Connection with {addr} closed. Active connections: {active_connections}")
+
+async def send_ocr_response(writer, future, previous, protocol, request_id, tagged, timer, engine, msg_type=MSG_RESPONSE,
+                            trace_id=None):
+    """
+    Wait for an OCR job and send its response, after the previous response if one is given.
+    """
+    try:
+        response = await future
+    except JobSuperseded:
+        metrics.inc("ocr_results_total", engine=engine, status="superseded")
+        response = {"status": "superseded", "message": "Replaced by a newer frame"}
+    except Exception as e:
+        logger.error(f"OCR task failed: {e}")
+        metrics.inc("ocr_results_total", engine=engine, status="error")
+        response = {"status": "error", "message": str(e)}
+    
+    if previous is not None:
+        await asyncio.wait([previous])
+    
+    # Send results back to client, already encoded by the worker unless something went wrong
+    if isinstance(response, dict):
+        if tagged:
+            response["request_id"] = request_id
+        if trace_id:
+            response["trace_id"] = trace_id
+        response = json.dumps(response, ensure_ascii=False).encode('utf-8'), 0
+    payload, flags = response
+    await send_message(writer, payload, protocol, request_id, msg_type, flags)
+    timer.lap("send")
+    
+    # Record the stage breakdown and log the time taken
+    metrics.observe_stages(timer)
+    metrics.observe("ocr_request_seconds", timer.total(), engine=engine)
+    if "preprocess_decision" in timer.notes:
+        metrics.inc("ocr_preprocess_decisions_total", engine=engine, reason=timer.notes["preprocess_decision"])
+    stages = ", ".join(f"{stage} {seconds * 1000:.1f}" for stage, seconds in timer.stages.items())
+    trace = f" [trace {trace_id}]" if trace_id else ""
+    logger.info(f"Sent OCR results to client{trace} (time taken: {timer.total():.2f} seconds; ms {stages})")
+
+def run_ocr_task(engine, source, lang, char_level, hdr_support, extra=None, result_format=FORMAT_JSON,
+                 compress_threshold=None, emit=None, timer=NULL_TIMER, report_timings=False, profile=None,
+                 use_cache=True, incremental=None, preprocess_session=None, engine_wait=None):
+    """
+    Run OCR with the named engine on a worker thread and encode (and maybe compress) the response.
+    
+    With emit, the line-level detections go out in MSG_PARTIAL messages, followed by a
+    MSG_REFINE message with the character-level expansion when char_level is 'True'. Engines
+    that recognize lines in batches (PROGRESSIVE_LINES: RapidOCR and EasyOCR) send one
+    MSG_PARTIAL per recognition batch while the frame is still being recognized, also from
+    worker processes; with the others one MSG_PARTIAL with every line follows the engine
+    call. Each MSG_PARTIAL carries only lines not sent before. The returned response then
+    only carries the final status.
+    
+    The timer gets the queue, preprocess, inference (detect and recognize where the engine
+    runs them separately), postprocess and serialize stage laps;
+    with report_timings the final response carries them in a "timings" object. The engine
+    is built with the named tuning profile (see ocr_profiles).
+    
+    With worker processes (--processes) this thread only hands the job to the least loaded
+    process and waits; the frame goes there through shared memory.
+    
+    With the result cache on and use_cache, a frame whose pixels, engine and options match
+    an earlier successful one gets that response back without running the engine (the
+    "cache" stage is hashing the frame). Progressive requests are never cached.
+    
+    With an IncrementalSession, only the regions that changed since the session's previous
+    frame are recognized and merged with its other detections (see incremental_ocr).
+    
+    With hdr_support and a preprocess_session, the preprocessing mode is the one kept for
+    that stream (see image_pipeline.PreprocessController) instead of one chosen per frame.
+    Incremental crops choose their own, since they are not frames of the stream.
+    
+    With engine_wait, an engine module or models for the language that are still loading are
+    waited for up to that many seconds each, and a request they are still not ready for gets
+    an error instead of a "warming" response.
+    
+    Returns:
+        tuple: (payload bytes, frame flags).
+    """
+    job = OcrJob(
+        engine, source, lang, char_level, hdr_support, extra, result_format, compress_threshold, emit, timer,
+        report_timings, profile, use_cache, incremental, preprocess_session, engine_wait
+    )
+    timer.lap("queue")
+    # A frame identical to one recognized before is answered from the result cache unless cache=false
+    cache_key, response = lookup_result_cache(job)
+    if response is not None:
+        return response
+    # Recognize lines only when progressive; splitting them into characters is the refinement
+    options = {
+        "lang": lang, "char_level": char_level if emit is None else 'False', "preprocess_images": hdr_support,
+        "profile": profile, "preprocess_session": preprocess_session if incremental is None else None
+    }
+    module = None
+    streamed = False
+    def on_lines(lines):
+        nonlocal streamed
+        streamed = True
+        # Timed as part of recognition, which it interleaves with
+        partial = dict(extra or {}, status="partial", char_level=char_level, results=lines)
+        emit(MSG_PARTIAL, *encode_response(partial, result_format, compress_threshold))
+    try:
+        if process_pool is not None:
+            def recognize(image):
+                return process_pool.process_image(engine, image, timer, on_lines if emit is not None else None,
+                                                  refine=emit is not None and char_level == 'True', **options)
+        else:
+            module = get_engine(engine, engine_wait)
+            wait_for_models(module, lang, profile, engine_wait)
+            if emit is not None and getattr(module, "PROGRESSIVE_LINES", False):
+                options["on_lines"] = on_lines
+            def recognize(image):
+                return module.process_image(image, timer=timer, **options)
+        if incremental is not None:
+            result, mode = incremental.process(source, (engine, lang, char_level, hdr_support, profile), recognize, timer)
+            metrics.inc("ocr_incremental_frames_total", engine=engine, mode=mode)
+        else:
+            result = recognize(source)
+        if module is not None:
+            module.release_gpu_resources()
+    except EngineWarming as e:
+        result = {"status": "warming", "message": str(e)}
+    return finish_ocr_task(job, result, module, cache_key, streamed)
+
+def run_ocr_batch(batch):
+    """
+    Run OCR jobs that share engine, language, options and profile as one engine call.
+    
+    Engines with process_images detect each frame on its own and recognize the lines of all
+    of them together; others run the frames back to back. Progressive jobs are never batched.
+    Frames answered from the result cache are left out of the engine call.
+    
+    Args:
+        batch (list): run_ocr_task argument tuples.
+    
+    Returns:
+        list: (response or None, error or None) per job, as OcrScheduler expects.
+    """
+    outcomes = [None] * len(batch)
+    jobs = []
+    cache_keys = []
+    for index, args in enumerate(batch):
+        job = OcrJob(*args)
+        job.timer.lap("queue")
+        cache_key, response = lookup_result_cache(job)
+        if response is not None:
+            outcomes[index] = (response, None)
+        else:
+            jobs.append(job)
+            cache_keys.append(cache_key)
+    if not jobs:
+        return outcomes
+    first = jobs[0]
+    metrics.inc("ocr_batches_total", engine=first.engine)
+    metrics.inc("ocr_batched_frames_total", len(jobs), engine=first.engine)
+    options = {
+        "lang": first.lang, "char_level": first.char_level, "preprocess_images": first.hdr_support,
+        "profile": first.profile
+    }
+    module = None
+    try:
+        module = get_engine(first.engine, first.engine_wait)
+        wait_for_models(module, first.lang, first.profile, first.engine_wait)
+        if hasattr(module, "process_images"):
+            results = module.process_images([job.source for job in jobs], timers=[job.timer for job in jobs],
+                                            preprocess_sessions=[job.preprocess_session for job in jobs], **options)
+        else:
+            results = [
+                module.process_image(job.source, timer=job.timer, preprocess_session=job.preprocess_session, **options)
+                for job in jobs
+            ]
+        module.release_gpu_resources()
+    except EngineWarming as e:
+        results = [{"status": "warming", "message": str(e)} for _ in jobs]
+    logger.info(f"Ran a batch of {len(jobs)} frames on {first.engine}")
+    
+    pending = (index for index, outcome in enumerate(outcomes) if outcome is None)
+    for index, job, cache_key, result in zip(pending, jobs, cache_keys, results):
+        try:
+            outcomes[index] = (finish_ocr_task(job, result, module, cache_key), None)
+        except Exception as e:
+            outcomes[index] = (None, e)
+    return outcomes
+
+def lookup_result_cache(job):
+    """
+    Look a job up in the result cache.
+    
+    Returns:
+        tuple: (cache key, or None if the job's response must not be cached; the finished
+        response on a hit, otherwise None).
+    """
+    if result_cache is None or not job.use_cache or job.emit is not None:
+        return None, None
+    try:
+        key = (frame_digest(job.source), job.engine, job.lang, job.char_level, job.hdr_support, job.profile,
+               job.result_format)
+    except OSError:
+        # No image to hash; the engine reports the missing file
+        return None, None
+    entry = result_cache.get(key)
+    job.timer.lap("cache")
+    metrics.inc("ocr_result_cache_total", engine=job.engine, result="hit" if entry is not None else "miss")
+    if entry is None:
+        return key, None
+    metrics.inc("ocr_results_total", engine=job.engine, status="success")
+    fields = dict(job.extra or {}, cached=True)
+    return key, finish_payload(entry.payload, entry.flags, fields, job.compress_threshold, job.timer, job.report_timings)
+
+def finish_ocr_task(job, result, module=None, cache_key=None, streamed=False):
+    """
+    Count, tag and encode the result of one OCR job, emitting the progressive messages if it has an emitter.
+    
+    Args:
+        job (OcrJob): The job the result is for.
+        result (dict): Value returned by process_image.
+        module: Engine module, used to split lines into characters; None when a worker process already did.
+        cache_key: Result cache key to store a successful response under, None to not cache it.
+        streamed (bool): The lines already went out in MSG_PARTIAL messages while they were recognized.
+    
+    Returns:
+        tuple: (payload bytes, frame flags).
+    """
+    global first_result_seconds
+    engine, char_level, extra, emit, timer = job.engine, job.char_level, job.extra, job.emit, job.timer
+    result_format, compress_threshold, report_timings = job.result_format, job.compress_threshold, job.report_timings
+    status = result.get("status", "error")
+    if status == "warming" and job.engine_wait is not None:
+        # A legacy client would drop a "warming" response without showing anything
+        result, status = dict(result, status="error"), "error"
+    metrics.inc("ocr_results_total", engine=engine, status=status)
+    if first_result_seconds is None and status == "success":
+        first_result_seconds = round(time.time() - SERVER_START_TIME, 3)
+        logger.info(f"First OCR result {first_result_seconds:.2f} seconds after start")
+    if emit is None or status != "success":
+        # The cached body leaves out the per-request fields, which are added to every response on its way out
+        payload, flags = encode_body(result, result_format)
+        if cache_key is not None and status == "success":
+            result_cache.put(cache_key, payload, flags)
+        return finish_payload(payload, flags, extra, compress_threshold, timer, report_timings)
+    
+    if extra:
+        result.update(extra)
+    lines = result.pop("results")
+    characters = result.pop("characters", None)  # Already split by a worker process
+    result["char_level"] = char_level
+    if not streamed:
+        emit(MSG_PARTIAL, *encode_response(dict(result, status="partial", results=lines), result_format, compress_threshold, timer))
+    if char_level == 'True':
+        if characters is None:
+            characters = split_lines(module, lines)
+        timer.lap("refine")
+        emit(MSG_REFINE, *encode_response(dict(result, status="refine", results=characters), result_format, compress_threshold, timer))
+    result["lines"] = len(lines)
+    return encode_response(result, result_format, compress_threshold, timer, report_timings)
+
+def encode_response(result, result_format=FORMAT_JSON, compress_threshold=None, timer=NULL_TIMER, report_timings=False):
+    """
+    Encode an OCR result dict in the connection's result format, compressing it if enabled.
+    
+    With report_timings, a "timings" object with the timer's stages, including this
+    serialization, is added to the response. Compression and sending happen after it is
+    written, so they only show up in the server log and metrics.
+    
+    Returns:
+        tuple: (payload bytes, frame flags). Results without detections are always JSON.
+    """
+    payload, flags = encode_body(result, result_format)
+    return finish_payload(payload, flags, None, compress_threshold, timer, report_timings)
+
+def encode_body(result, result_format=FORMAT_JSON):
+    """Encode an OCR result dict in the connection's result format, without timings or compression."""
+    if result_format == FORMAT_BINARY and is_binary_result(result):
+        return encode_result(result), FLAG_BINARY_RESULT
+    return json.dumps(result, ensure_ascii=False).encode('utf-8'), 0
+
+def finish_payload(payload, flags, fields=None, compress_threshold=None, timer=NULL_TIMER, report_timings=False):
+    """
+    Add top-level fields (and the "timings" object with report_timings) to an encoded result
+    and compress it if enabled.
+    
+    The fields are spliced into the encoded object, so a cached body can be sent tagged
+    with the ids of a new request without encoding it again.
+    
+    Returns:
+        tuple: (payload bytes, frame flags).
+    """
+    fields = dict(fields) if fields else {}
+    if report_timings:
+        # Added last so the timings can include encoding the result
+        timer.lap("serialize")
+        fields["timings"] = timer.summary()
+    if fields:
+        payload = add_metadata(payload, fields) if flags & FLAG_BINARY_RESULT else append_json_fields(payload, fields)
+    if compress_threshold is not None:
+        payload, compressed = compress_payload(payload, compress_threshold)
+        if compressed:
+            flags |= FLAG_COMPRESSED
+    timer.lap("serialize")
+    return payload, flags
+
+def make_emitter(writer, protocol, request_id):
+    """
+    Return a callback that OCR worker threads use to send progressive messages for one request.
+    
+    Messages are written from the event loop in the order they are emitted, and before the
+    final response, which the loop only sees after the job has finished.
+    """
+    loop = asyncio.get_running_loop()
+    
+    def emit(msg_type, payload, flags=0):
+        try:
+            loop.call_soon_threadsafe(write_message, writer, payload, protocol, request_id, msg_type, flags)
+        except RuntimeError:
+            # The event loop has already shut down
+            pass
+    
+    return emit
+
+def parse_command(command):
+    """
+    Split a "name|arg|arg|key=value" command into its name, positional args and options.
+    """
+    parts = command.split("|")
+    args = []
+    options = {}
+    for part in parts[1:]:
+        if "=" in part:
+            key, value = part.split("=", 1)
+            options[key.strip().lower()] = value.strip()
+        else:
+            args.append(part)
+    return parts[0].strip(), args, options
+
+def parse_flag(value):
+    """
+    Read a boolean command argument or option the way clients spell it ("True", "false", "1", "off", ...).
+    
+    Raises:
+        ValueError: If the value is not a recognized spelling of true or false.
+    """
+    if isinstance(value, bool):
+        return value
+    flag = str(value).strip().lower()
+    if flag in TRUE_FLAGS:
+        return True
+    if flag in FALSE_FLAGS:
+        return False
+    raise ValueError(f"Invalid boolean value: {value}")
+
+class SharedFrameSlots:
+    """
+    Frame slots in a shared memory segment that the client writes and the server OCRs in place.
+    
+    Each slot is a SLOT_HEADER followed by slot_size bytes of pixels. The client writes the
+    pixels first and bumps the sequence in the header last, then sends
+    "read_image|...|slot=<id>|seq=<sequence>". A slot must not be rewritten until its
+    response has arrived.
+    """
+    
+    def __init__(self, slots, slot_size, name=None):
+        if slots <= 0 or slot_size <= 0:
+            raise ValueError(f"Invalid slot layout: {slots} slots of {slot_size} bytes")
+        # Keep every slot header (and so every pixel block) cache-line aligned
+        self.slot_bytes = -(-(SLOT_HEADER.size + slot_size) // SLOT_ALIGNMENT) * SLOT_ALIGNMENT
+        self.slots = slots
+        self.slot_size = self.slot_bytes - SLOT_HEADER.size
+        size = slots * self.slot_bytes
+        if size > MAX_SHARED_MEMORY:
+            raise ValueError(f"Shared memory of {size} bytes exceeds limit of {MAX_SHARED_MEMORY}")
+        
+        # Without a name the server creates (and later unlinks) the segment itself
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            if self.shm.size < size:
+                self.shm.close()
+                raise ValueError(f"Shared memory {name} has {self.shm.size} bytes, expected {size}")
+    
+    def describe(self):
+        """Layout details the client needs to write into the slots."""
+        return {
+            "name": self.shm.name,
+            "slots": self.slots,
+            "slot_bytes": self.slot_bytes,
+            "slot_size": self.slot_size,
+            "header_size": SLOT_HEADER.size,
+            "formats": SLOT_FORMATS
+        }
+    
+    def frame(self, slot, expected_sequence=None):
+        """
+        View the frame in a slot without copying.
+        
+        Returns:
+            tuple: (np.ndarray view of the pixels, slot sequence number)
+        """
+        if not 0 <= slot < self.slots:
+            raise ValueError(f"Slot {slot} out of range (0-{self.slots - 1})")
+        offset = slot * self.slot_bytes
+        sequence, width, height, stride, format_code = SLOT_HEADER.unpack_from(self.shm.buf, offset)
+        if expected_sequence is not None and sequence != expected_sequence:
+            raise ValueError(f"Slot {slot} holds sequence {sequence}, expected {expected_sequence}")
+        if format_code >= len(SLOT_FORMATS):
+            raise ValueError(f"Unknown pixel format code {format_code} in slot {slot}")
+        
+        start = offset + SLOT_HEADER.size
+        pixels = self.shm.buf[start:start + self.slot_size]
+        return wrap_frame(pixels, width, height, stride, SLOT_FORMATS[format_code]), sequence
+    
+    def close(self):
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except BufferError:
+            # A frame view is still alive somewhere; the OS reclaims the mapping on exit
+            logger.warning(f"Shared memory {self.shm.name} still in use, leaving it mapped")
+        except Exception as e:
+            logger.error(f"Error closing shared memory: {e}")
+
+def wrap_frame(buffer, width, height, stride, pixel_format):
+    """
+    Wrap raw pixel bytes as a NumPy array without copying.
+    
+    Args:
+        buffer (memoryview): Pixel bytes, row after row.
+        width (int): Frame width in pixels.
+        height (int): Frame height in pixels.
+        stride (int): Bytes per row, including any padding.
+        pixel_format (str): BGRA, RGB or GRAY.
+    
+    Returns:
+        np.ndarray: (H, W, 4) BGRA, (H, W, 3) RGB or (H, W) GRAY view of the buffer.
+    """
+    channels = PIXEL_FORMATS.get(pixel_format)
+    if channels is None:
+        raise ValueError(f"Unsupported pixel format: {pixel_format}")
+    if width <= 0 or height <= 0 or stride < width * channels:
+        raise ValueError(f"Invalid frame geometry: {width}x{height}, stride {stride}")
+    required = stride * (height - 1) + width * channels
+    if len(buffer) < required:
+        raise ValueError(f"Frame body has {len(buffer)} bytes, expected at least {required}")
+    
+    # Rows may be padded to the stride, so describe the layout with explicit strides
+    if channels == 1:
+        return np.ndarray((height, width), dtype=np.uint8, buffer=buffer, strides=(stride, 1))
+    return np.ndarray((height, width, channels), dtype=np.uint8, buffer=buffer, strides=(stride, channels, 1))
+
+def frame_from_buffer(buffer, options):
+    """
+    Wrap the pixel body of a read_frame command as a NumPy array without copying.
+    
+    Args:
+        buffer (memoryview): Pixel bytes, row after row.
+        options (dict): Command options with width, height, stride and format (BGRA, RGB or GRAY).
+    
+    Returns:
+        np.ndarray: View of the buffer (see wrap_frame).
+    """
+    try:
+        width = int(options["width"])
+        height = int(options["height"])
+        pixel_format = options.get("format", "BGRA").upper()
+        stride = int(options.get("stride", width * PIXEL_FORMATS.get(pixel_format, 1)))
+    except KeyError as e:
+        raise ValueError(f"Missing frame option: {e}")
+    return wrap_frame(buffer, width, height, stride, pixel_format)
+
+async def receive_frame(reader):
+    """
+    Receive one protocol v2 frame.
+    
+    Returns:
+        tuple: (message type, flags, request id, payload) or None if the client disconnected.
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+        magic, msg_type, flags, request_id, length = FRAME_HEADER.unpack(header)
+        if magic != FRAME_MAGIC:
+            raise ValueError(f"Invalid frame magic: {magic!r}")
+        if length > MAX_FRAME_SIZE:
+            raise ValueError(f"Frame of {length} bytes exceeds limit of {MAX_FRAME_SIZE}")
+        payload = await reader.readexactly(length) if length else b''
+    except asyncio.IncompleteReadError:
+        return None
+    return msg_type, flags, request_id, payload
+
+def write_message(writer, response, protocol=PROTOCOL_LEGACY, request_id=0, msg_type=MSG_RESPONSE, flags=0):
+    """
+    Queue a response on the transport using the framing negotiated for the connection.
+    
+    Legacy text mode prefixes an ASCII size line; protocol v2 prefixes a binary FRAME_HEADER.
+    """
+    if writer.is_closing():
+        return
+    if protocol == PROTOCOL_V2:
+        header = FRAME_HEADER.pack(FRAME_MAGIC, msg_type, flags, request_id, len(response))
+    else:
+        header = str(len(response)).encode('utf-8') + b'\r\n'
+    # Header and payload go to the transport together
+    writer.writelines([header, response])
+    metrics.inc("ocr_bytes_sent_total", len(header) + len(response))
+    logger.debug(f"Sent response with size: {len(response)}")
+
+async def send_message(writer, response, protocol=PROTOCOL_LEGACY, request_id=0, msg_type=MSG_RESPONSE, flags=0):
+    """
+    Send a response and wait until the transport has room again.
+    """
+    try:
+        write_message(writer, response, protocol, request_id, msg_type, flags)
+        # drain applies backpressure when a slow client stops reading
+        await writer.drain()
+    except (ConnectionError, OSError) as e:
+        logger.error(f"Error sending response: {e}")
+
+async def send_json(writer, reply, protocol=PROTOCOL_LEGACY, request_id=0, tagged=False):
+    """
+    Encode a JSON reply, tagged with the request id when the request carried one, and send it.
+    """
+    if tagged:
+        reply["request_id"] = request_id
+    await send_message(writer, json.dumps(reply, ensure_ascii=False).encode('utf-8'), protocol, request_id)
+
+async def serve(port, workers, max_pending, preload=None, metrics_port=None, processes=0, batch_window_ms=0,
+                max_batch=MAX_BATCH, result_cache_mb=RESULT_CACHE_MB):
+    """Run the server until a termination signal arrives."""
+    global ocr_scheduler, process_pool, result_cache
+    loop = asyncio.get_running_loop()
+    result_cache = ResultCache(int(result_cache_mb * 1024 * 1024)) if result_cache_mb > 0 else None
+    if processes and batch_window_ms:
+        # A batch would have to run in one worker process, which is what the other processes are for
+        logger.warning("--batch-window has no effect with --processes, frames are not batched")
+        batch_window_ms = 0
+    ocr_scheduler = OcrScheduler(workers, max_pending, batch_window_ms / 1000, max_batch, run_ocr_batch)
+    shutdown_event = asyncio.Event()
+    
+    def signal_handler(sig, frame):
+        """
+        Handle termination signals gracefully.
+        """
+        logger.info("Shutting down server...")
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(shutdown_event.set)
+    
+    # Set up signal handlers
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    server = await asyncio.start_server(
+        handle_client_connection, HOST, port,
+        limit=STREAM_BUFFER_LIMIT, backlog=MAX_CONNECTIONS, reuse_address=True
+    )
+    logger.info(f"Server started on {HOST}:{port} with {workers} OCR workers, engines: {', '.join(sorted(enabled_engines))} (default {default_engine})")
+    if result_cache is not None:
+        logger.info(f"Caching the responses to repeated frames in up to {result_cache_mb} MB")
+    if ocr_scheduler.batch_window:
+        logger.info(f"Batching frames that arrive within {batch_window_ms} ms, up to {ocr_scheduler.max_batch} per batch")
+    if processes:
+        # Worker processes preload the engines themselves; starting them may wait for the fork server's imports
+        preload = {name: languages for name, languages in (preload or {}).items() if name in enabled_engines}
+        process_pool = ProcessWorkerPool(processes, worker_settings(
+            OCR_ENGINES, WEBSERVER_DIR, preload, max_cached_engines, engine_memory_budget_mb, line_cache_entries,
+            line_store
+        ))
+        threading.Thread(target=process_pool.start, name="ocr-process-start", daemon=True).start()
+        logger.info(f"Running engines in {processes} worker processes ({process_pool.start_method})")
+        preload = None
+    metrics_server = None
+    if metrics_port:
+        metrics_server = await asyncio.start_server(handle_metrics_request, HOST, metrics_port, reuse_address=True)
+        logger.info(f"Prometheus metrics on http://{HOST}:{metrics_port}/metrics")
+    
+    # Engines load in the background so the port is usable at once; "status" reports progress
+    for name, languages in (preload or {}).items():
+        if name in enabled_engines:
+            start_preload(name, languages)
+    
+    try:
+        await shutdown_event.wait()
+    finally:
+        # Stop accepting, then close open connections instead of waiting for them
+        server.close()
+        if metrics_server is not None:
+            metrics_server.close()
+        for writer in list(client_writers):
+            writer.close()
+        await server.wait_closed()
+        ocr_scheduler.stop()
+        if process_pool is not None:
+            process_pool.stop()
+        logger.info("Server shutdown complete")
+
+def main(engine=DEFAULT_ENGINE, port=PORT):
+    """
+    Start the server and listen for connections.
+    
+    Args:
+        engine (str): Default engine for requests that do not name one.
+        port (int): Default port to listen on.
+    """
+    global default_engine, enabled_engines, max_cached_engines, engine_memory_budget_mb, line_cache_entries, line_store
+    parser = argparse.ArgumentParser(description="OCR socket server")
+    parser.add_argument("--port", type=int, default=port, help="Port to listen on")
+    parser.add_argument("--engine", default=engine, choices=sorted(OCR_ENGINES), help="Engine used when a request does not name one")
+    parser.add_argument("--engines", default=",".join(sorted(OCR_ENGINES)), help="Comma separated engines this server may load")
+    parser.add_argument("--preload", default=None, help='Engines and languages to load at startup, e.g. "rapidocr:en+ja,paddleocr", or "none" (default: the default engine)')
+    parser.add_argument("--profile", default=None, help="Tuning profile for requests that do not name one (default: the one set in the profiles file)")
+    parser.add_argument("--profiles", default=ocr_profiles.PROFILES_PATH, help="JSON file with the engine tuning profiles")
+    parser.add_argument("--max-engines", type=int, default=MAX_CACHED_ENGINES, help="Initialized models kept per engine (LRU)")
+    parser.add_argument("--engine-memory", type=int, default=ENGINE_MEMORY_BUDGET_MB, help="Memory budget in MB for the cached models of one engine, 0 for no limit")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Serve Prometheus text metrics on this local port")
+    parser.add_argument("--workers", type=int, default=None, help=f"Number of OCR worker threads (default: {MAX_WORKERS}, or twice --processes)")
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="Run the engines in this many worker processes, 0 to run them on the worker threads")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING_TASKS, help="Queued OCR requests before reporting busy")
+    parser.add_argument("--batch-window", type=float, default=BATCH_WINDOW_MS, help="Milliseconds a frame waits for frames from other clients to run with it, 0 to not batch (try 5-15)")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="Most frames run together in one batch")
+    parser.add_argument("--line-cache", type=int, default=LINE_CACHE_SIZE, help="Recognized text line crops remembered per engine (RapidOCR), 0 to recognize every line")
+    parser.add_argument("--line-store", default=None, help="SQLite file that keeps recognized lines across restarts and server processes, e.g. line_cache.sqlite3")
+    parser.add_argument("--line-store-mb", type=float, default=LINE_STORE_MB, help="Size cap of the --line-store file in MB, 0 for no cap")
+    parser.add_argument("--result-cache", type=float, default=RESULT_CACHE_MB, help="MB of responses kept for frames seen before, 0 to turn the cache off")
+    options = parser.parse_args()
+    
+    enabled_engines = {name.strip().lower() for name in options.engines.split(",") if name.strip()}
+    unknown = enabled_engines - set(OCR_ENGINES)
+    if unknown:
+        parser.error(f"Unknown OCR engines: {', '.join(sorted(unknown))}")
+    default_engine = options.engine
+    enabled_engines.add(default_engine)
+    max_cached_engines = options.max_engines
+    engine_memory_budget_mb = options.engine_memory
+    line_cache_entries = max(0, options.line_cache)
+    if options.line_store:
+        line_store = (os.path.abspath(options.line_store), max(0.0, options.line_store_mb))
+    try:
+        ocr_profiles.configure(options.profiles, options.profile)
+        preload = parse_preload(options.preload if options.preload is not None else default_engine)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    # With worker processes a second job per process waits ready behind the running one
+    processes = max(0, options.processes)
+    workers = options.workers if options.workers is not None else (2 * processes or MAX_WORKERS)
+    try:
+        asyncio.run(serve(
+            options.port, max(1, workers), max(1, options.max_pending), preload, options.metrics_port, processes,
+            max(0.0, options.batch_window), options.max_batch, options.result_cache
+        ))
+    except Exception as e:
+        logger.error(f"Error in main server loop: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
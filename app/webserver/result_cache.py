@@ -0,0 +1,92 @@
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+import numpy as np
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None  # Frames are hashed with BLAKE2b, a few times slower on big frames
+
+RESULT_CACHE_MB = 64  # Encoded responses kept for repeated frames (--result-cache), 0 to turn the cache off
+ENTRY_OVERHEAD = 256  # Bytes counted per entry on top of its payload, for the key and bookkeeping
+
+# An encoded response as finish_ocr_task produced it, before per-request fields and compression
+CachedResponse = namedtuple('CachedResponse', ['payload', 'flags'])
+
+def frame_digest(source):
+    """
+    Hash the pixels of a frame, or the bytes of an image file, into a short digest.
+
+    Frames are hashed with their shape so that the same bytes in another geometry do not
+    match. Rows padded to a stride are copied together first, since only contiguous memory
+    can be hashed.
+
+    Args:
+        source: np.ndarray frame or path to an image file.
+
+    Returns:
+        bytes: 16 byte digest.
+    """
+    hasher = xxhash.xxh3_128() if xxhash is not None else hashlib.blake2b(digest_size=16)
+    if isinstance(source, np.ndarray):
+        hasher.update(repr(source.shape).encode('ascii'))
+        hasher.update(np.ascontiguousarray(source))
+    else:
+        with open(source, 'rb') as f:
+            hasher.update(f.read())
+    return hasher.digest()
+
+class ResultCache:
+    """
+    LRU cache of encoded OCR responses for frames seen before, bounded by a byte budget.
+
+    Menus and visual novels show the same screen for seconds at a time. Keyed by the frame
+    digest and every option that changes the response, a hit is answered with the stored
+    payload, skipping both the engine and the encoding. Entries are evicted least recently
+    used first once their payloads exceed the budget.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max(0, max_bytes)
+        self._entries = OrderedDict()  # key -> CachedResponse, least recently used first
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the CachedResponse for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, payload, flags):
+        """Store an encoded response, evicting old ones to stay within the budget."""
+        size = len(payload) + ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.payload) + ENTRY_OVERHEAD
+            self._entries[key] = CachedResponse(bytes(payload), flags)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.payload) + ENTRY_OVERHEAD
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def status(self):
+        """Entries, bytes used and budget, for the stats command."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hasher": "xxh3_128" if xxhash is not None else "blake2b"
+            }
@@ -0,0 +1,183 @@
+import json
+import struct
+import zlib
+import numpy as np
+
+# Columnar binary encoding of OCR results, negotiated per connection with "hello|format=binary".
+#
+# Layout (little-endian, every array 4-byte aligned):
+#   header        RESULT_HEADER: magic, version, reserved, detection count N, text blob size T, metadata size M
+#   coords        float32[N * 8]  four (x, y) corner points per detection, same order as "rect"
+#   confidences   float32[N]
+#   text offsets  uint32[N + 1]   byte offsets into the text blob; text i is blob[off[i]:off[i + 1]]
+#   flags         uint8[N]        RESULT_FLAG_CHARACTER for character-level detections
+#   text blob     T bytes of UTF-8
+#   metadata      M bytes of UTF-8 JSON with every top-level field except "results"
+RESULT_MAGIC = b'OCRB'
+RESULT_VERSION = 1
+RESULT_HEADER = struct.Struct('<4sHHIII')
+RESULT_FLAG_CHARACTER = 0x01
+
+# Response compression, negotiated per connection with "hello|compress=zlib". Payloads smaller
+# than the threshold are sent as they are since deflate would cost more than it saves.
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_THRESHOLD = 16 * 1024
+COMPRESSION_LEVEL = 1  # Fastest level; char-level JSON is repetitive enough that higher levels gain little
+
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+RESULT_FORMATS = (FORMAT_JSON, FORMAT_BINARY)
+
+def is_binary_result(result):
+    """Whether an OCR result dict can be sent in the binary format (only ones carrying detections can)."""
+    return result.get("status") != "error" and isinstance(result.get("results"), list)
+
+def encode_result(result):
+    """
+    Encode a successful OCR result dict in the columnar binary format.
+
+    Args:
+        result (dict): Result returned by process_image, with a "results" list of
+            {"rect", "text", "confidence", "is_character"} detections.
+
+    Returns:
+        bytes: Encoded result.
+    """
+    detections = result["results"]
+    count = len(detections)
+
+    rects = [item["rect"] for item in detections]
+    try:
+        coords = np.asarray(rects, dtype='<f4').reshape(count, 8)
+    except ValueError:
+        # Some detection is not a quadrilateral, send its bounding box instead
+        coords = np.array([bounding_quad(rect) for rect in rects], dtype='<f4').reshape(count, 8)
+    confidences = np.fromiter((item["confidence"] for item in detections), dtype='<f4', count=count)
+    flags = np.fromiter((item["is_character"] for item in detections), dtype=np.uint8, count=count)
+
+    texts = [item["text"] for item in detections]
+    joined = "".join(texts)
+    blob = joined.encode('utf-8')
+    offsets = np.zeros(count + 1, dtype='<u4')
+    if len(blob) == len(joined):
+        # ASCII only, so character and byte lengths agree
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+    else:
+        np.cumsum([len(text.encode('utf-8')) for text in texts], out=offsets[1:])
+
+    metadata = {key: value for key, value in result.items() if key != "results"}
+    metadata = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+
+    header = RESULT_HEADER.pack(RESULT_MAGIC, RESULT_VERSION, 0, count, len(blob), len(metadata))
+    return b''.join([
+        header, coords.tobytes(), confidences.tobytes(), offsets.tobytes(), flags.tobytes(), blob, metadata
+    ])
+
+def add_metadata(payload, fields):
+    """
+    Add top-level fields to an encoded binary result without encoding its columns again.
+
+    Only the metadata JSON at the end of the payload is rewritten, so this is cheap next to
+    encode_result; the server uses it to tag a cached result with per-request fields.
+
+    Returns:
+        bytes: Encoded result with the fields in its metadata.
+    """
+    magic, version, reserved, count, text_size, metadata_size = RESULT_HEADER.unpack_from(payload)
+    if magic != RESULT_MAGIC:
+        raise ValueError(f"Invalid result magic: {magic!r}")
+    columns_end = len(payload) - metadata_size
+    metadata = json.loads(bytes(payload[columns_end:]).decode('utf-8'))
+    metadata.update(fields)
+    metadata = json.dumps(metadata, ensure_ascii=False).encode('utf-8')
+    header = RESULT_HEADER.pack(magic, version, reserved, count, text_size, len(metadata))
+    return b''.join([header, memoryview(payload)[RESULT_HEADER.size:columns_end], metadata])
+
+def append_json_fields(payload, fields):
+    """Add top-level fields to an encoded JSON object by splicing them in before its closing brace."""
+    if not fields:
+        return payload
+    encoded = json.dumps(fields, ensure_ascii=False).encode('utf-8')
+    if payload == b'{}':
+        return encoded
+    return b''.join([payload[:-1], b', ', encoded[1:]])
+
+def compress_payload(payload, threshold=COMPRESSION_THRESHOLD, level=COMPRESSION_LEVEL):
+    """
+    Deflate a response payload (zlib format) if it is at least threshold bytes and gets smaller.
+
+    Returns:
+        tuple: (payload, True if it was compressed)
+    """
+    if len(payload) < threshold:
+        return payload, False
+    compressed = zlib.compress(payload, level)
+    if len(compressed) >= len(payload):
+        return payload, False
+    return compressed, True
+
+def decode_columns(payload):
+    """
+    Decode a binary result into NumPy views of its columns without copying them.
+
+    Returns:
+        dict: "coords" (N, 4, 2) float32, "confidences" (N,) float32, "offsets" (N + 1,) uint32,
+        "flags" (N,) uint8, "text" (bytes blob) and "metadata" (dict).
+    """
+    magic, version, _, count, text_size, metadata_size = RESULT_HEADER.unpack_from(payload)
+    if magic != RESULT_MAGIC:
+        raise ValueError(f"Invalid result magic: {magic!r}")
+    if version != RESULT_VERSION:
+        raise ValueError(f"Unsupported result version: {version}")
+
+    buffer = memoryview(payload)
+    offset = RESULT_HEADER.size
+    coords = np.frombuffer(buffer, dtype='<f4', count=count * 8, offset=offset).reshape(count, 4, 2)
+    offset += count * 32
+    confidences = np.frombuffer(buffer, dtype='<f4', count=count, offset=offset)
+    offset += count * 4
+    offsets = np.frombuffer(buffer, dtype='<u4', count=count + 1, offset=offset)
+    offset += (count + 1) * 4
+    flags = np.frombuffer(buffer, dtype=np.uint8, count=count, offset=offset)
+    offset += count
+    text = bytes(buffer[offset:offset + text_size])
+    offset += text_size
+    metadata = json.loads(bytes(buffer[offset:offset + metadata_size]).decode('utf-8'))
+    return {
+        "coords": coords,
+        "confidences": confidences,
+        "offsets": offsets,
+        "flags": flags,
+        "text": text,
+        "metadata": metadata
+    }
+
+def decode_result(payload):
+    """
+    Decode a binary result back into the dict process_image returned, for clients that want JSON-shaped data.
+    """
+    columns = decode_columns(payload)
+    offsets = columns["offsets"].tolist()
+    text = columns["text"]
+    result = columns["metadata"]
+    result["results"] = [
+        {
+            "rect": rect,
+            "text": text[offsets[i]:offsets[i + 1]].decode('utf-8'),
+            "confidence": confidence,
+            "is_character": bool(flag & RESULT_FLAG_CHARACTER)
+        }
+        for i, (rect, confidence, flag) in enumerate(zip(
+            columns["coords"].tolist(), columns["confidences"].tolist(), columns["flags"].tolist()
+        ))
+    ]
+    return result
+
+def bounding_quad(rect):
+    """Axis-aligned bounding box of a polygon as four corner points, clockwise from top-left."""
+    points = np.asarray(rect, dtype=np.float32).reshape(-1, 2)
+    if len(points) == 0:
+        return [[0, 0], [0, 0], [0, 0], [0, 0]]
+    (x1, y1), (x2, y2) = points.min(axis=0), points.max(axis=0)
+    return [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
@@ -0,0 +1,39 @@
+"""
+Shared setup for the server tests.
+
+The server modules import each other as top-level modules from the webserver directory,
+and the engine modules from their own directories, as ocr_server.load_engine does.
+Run from anywhere with: python -m pytest app/webserver/tests
+"""
+import os
+import sys
+import pytest
+
+WEBSERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (WEBSERVER_DIR, os.path.join(WEBSERVER_DIR, "RapidOCR")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from tests.helpers import FakeEngine  # noqa: E402, after the path setup
+
+@pytest.fixture
+def server():
+    """ocr_server with its globals reset around the test; engines are installed by the test."""
+    import ocr_server
+    saved = (ocr_server.ocr_scheduler, dict(ocr_server.engine_modules), ocr_server.result_cache)
+    yield ocr_server
+    if ocr_server.ocr_scheduler is not None and ocr_server.ocr_scheduler is not saved[0]:
+        ocr_server.ocr_scheduler.stop()
+    ocr_server.ocr_scheduler, ocr_server.result_cache = saved[0], saved[2]
+    ocr_server.engine_modules.clear()
+    ocr_server.engine_modules.update(saved[1])
+
+@pytest.fixture
+def fake_engine_factory(server):
+    """Install a FakeEngine as every engine of the server."""
+    def install(**options):
+        engine = FakeEngine(**options)
+        for name in server.OCR_ENGINES:
+            server.engine_modules[name] = engine
+        return engine
+    return install
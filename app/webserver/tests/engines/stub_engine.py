@@ -0,0 +1,52 @@
+"""
+Engine module for the process pool tests, importable in worker processes.
+
+Reports what reached it instead of recognizing text: the pixel sum and shape of a frame,
+or the path of an image file, and the id of the worker process.
+"""
+import os
+import numpy as np
+
+DEFAULT_LANG = 'en'
+PROGRESSIVE_LINES = True
+
+class StubEngineCache:
+    """Records what the worker configures and preloads."""
+
+    def __init__(self):
+        self.preloaded = []
+
+    def configure(self, max_engines=None, memory_budget_mb=None):
+        pass
+
+    def preload(self, key):
+        self.preloaded.append(key)
+
+ENGINE_CACHE = StubEngineCache()
+
+def resolve_engine_config(lang='en', profile=None):
+    return (lang, profile)
+
+def process_image(image, timer=None, lang='en', char_level='False', on_lines=None, **options):
+    if isinstance(image, np.ndarray):
+        source = {"shape": list(image.shape), "sum": int(image.sum(dtype=np.int64))}
+    else:
+        source = {"path": image}
+    lines = [{"text": "Quest", "confidence": 0.9, "rect": [[0, 0], [10, 0], [10, 5], [0, 5]]}]
+    if on_lines is not None:
+        on_lines(lines)
+    timer.lap("recognize")
+    return {
+        "status": "success",
+        "results": lines,
+        "pid": os.getpid(),
+        "lang": lang,
+        "preloaded": ENGINE_CACHE.preloaded,
+        **source
+    }
+
+def split_into_characters(text, box, confidence):
+    return [{"text": char, "confidence": confidence, "rect": box} for char in text]
+
+def release_gpu_resources():
+    pass
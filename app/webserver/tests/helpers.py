@@ -0,0 +1,100 @@
+"""Stand-ins for engine modules and a test client for the server tests."""
+import asyncio
+import json
+import threading
+import time
+
+def wait_for(condition, timeout=5.0):
+    """Poll condition until it holds, failing the test after timeout seconds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.01)
+
+class FakeEngineCache:
+    """Stand-in for an engine module's EngineCache whose models are always built."""
+
+    def __init__(self):
+        self.waited = []  # Keys requests waited for, in order
+
+    def wait(self, key, timeout):
+        self.waited.append(key)
+
+class FakeEngine:
+    """
+    Stand-in for an engine module: answers every frame with one line of text.
+
+    With hold set, each call waits until release() so tests can fill the scheduler queue.
+    """
+
+    DEFAULT_LANG = 'en'
+
+    def __init__(self, hold=False):
+        self.calls = []  # process_image keyword arguments, in call order
+        self.ENGINE_CACHE = FakeEngineCache()
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)  # Released once per call that has begun
+        if not hold:
+            self.gate.set()
+
+    def release(self):
+        self.gate.set()
+
+    def process_image(self, image, timer=None, **options):
+        self.calls.append(options)
+        self.started.release()
+        self.gate.wait(10)
+        return {
+            "status": "success",
+            "results": [{"text": "Quest", "confidence": 0.9, "rect": [[0, 0], [10, 0], [10, 5], [0, 5]]}],
+            "processing_time_seconds": 0.0,
+            "char_level": options.get("char_level", "False")
+        }
+
+    def resolve_engine_config(self, lang='en', profile=None):
+        return (lang, profile)
+
+    def release_gpu_resources(self):
+        pass
+
+class Client:
+    """Test client of a server listening on a random local port, legacy framing until v2 is negotiated."""
+
+    def __init__(self, server, reader, writer, listener):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.listener = listener
+
+    @classmethod
+    async def connect(cls, server):
+        listener = await asyncio.start_server(server.handle_client_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        return cls(server, reader, writer, listener)
+
+    async def send(self, command, body=b"", request_id=0):
+        """Send a command; v2 framing when request_id is given, legacy text otherwise."""
+        data = command.encode() + (b"\n" + body if body else b"")
+        if request_id:
+            data = self.server.FRAME_HEADER.pack(self.server.FRAME_MAGIC, self.server.MSG_COMMAND, 0, request_id,
+                                                 len(data)) + data
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def receive_legacy(self):
+        size = int((await self.reader.readuntil(b"\r\n"))[:-2])
+        return json.loads(await self.reader.readexactly(size))
+
+    async def receive_frame(self):
+        """(message type, flags, request id, payload) of the next v2 frame."""
+        header = await self.reader.readexactly(self.server.FRAME_HEADER.size)
+        magic, msg_type, flags, request_id, length = self.server.FRAME_HEADER.unpack(header)
+        assert magic == self.server.FRAME_MAGIC
+        return msg_type, flags, request_id, await self.reader.readexactly(length)
+
+    async def close(self):
+        self.writer.close()
+        self.listener.close()
+        await self.listener.wait_closed()
@@ -0,0 +1,63 @@
+"""zlib compression of responses, negotiated with hello|compress=zlib."""
+import asyncio
+import json
+import os
+import zlib
+
+from ocr_server import OcrScheduler
+from result_codec import compress_payload, decode_result
+from tests.helpers import Client
+
+def test_small_payload_sent_as_is():
+    payload = b'{"status": "success"}'
+    assert compress_payload(payload, threshold=1024) == (payload, False)
+
+def test_large_payload_round_trip():
+    payload = json.dumps([{"text": "Quest", "confidence": 0.9}] * 200).encode()
+    compressed, done = compress_payload(payload, threshold=1024)
+    assert done and len(compressed) < len(payload)
+    assert zlib.decompress(compressed) == payload
+
+def test_incompressible_payload_sent_as_is():
+    payload = os.urandom(512)
+    assert compress_payload(payload, threshold=0) == (payload, False)
+
+def test_encode_response_sets_the_frame_flags(server):
+    result = {"status": "success", "results": [
+        {"rect": [[0, 0], [1, 0], [1, 1], [0, 1]], "text": "Quest", "confidence": 0.5, "is_character": False}
+    ] * 100}
+    payload, flags = server.encode_response(result, server.FORMAT_BINARY, compress_threshold=0)
+    assert flags == server.FLAG_BINARY_RESULT | server.FLAG_COMPRESSED
+    assert decode_result(zlib.decompress(payload)) == result
+
+    payload, flags = server.encode_response(result, server.FORMAT_JSON)
+    assert flags == 0 and json.loads(payload) == result
+
+def test_negotiated_compression(server, fake_engine_factory):
+    fake_engine_factory()
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("hello|protocol=2|compress=zlib|compress_threshold=0")
+            hello = await client.receive_legacy()
+            await client.send("read_image|en|rapidocr|False|False", request_id=1)
+            response = await client.receive_frame()
+        finally:
+            await client.close()
+        return hello, response
+    hello, (msg_type, flags, request_id, payload) = asyncio.run(scenario())
+    assert hello["compress"] == "zlib" and hello["compress_threshold"] == 0
+    assert flags & server.FLAG_COMPRESSED
+    assert json.loads(zlib.decompress(payload))["results"][0]["text"] == "Quest"
+
+def test_legacy_framing_never_compresses(server):
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("hello|compress=zlib")
+            return await client.receive_legacy()
+        finally:
+            await client.close()
+    assert asyncio.run(scenario())["compress"] == "none"
@@ -0,0 +1,125 @@
+"""EngineCache: LRU eviction and background warming."""
+import threading
+import pytest
+
+import engine_cache
+from engine_cache import STATE_FAILED, STATE_LOADING, STATE_READY, STATE_WARMING, EngineCache, EngineWarming
+from tests.helpers import wait_for
+
+@pytest.fixture(autouse=True)
+def no_side_effects(monkeypatch):
+    """Use the per-engine estimate as engine size and skip the ready flag file."""
+    monkeypatch.setattr(engine_cache, "_process_memory_mb", lambda: None)
+    monkeypatch.setattr(engine_cache, "_write_ready_flag", lambda name: None)
+
+class Factory:
+    """Builds a string engine per key, optionally waiting for release() first."""
+
+    def __init__(self, hold=False, fail=()):
+        self.built = []
+        self.gate = threading.Event()
+        self.fail = set(fail)
+        if not hold:
+            self.gate.set()
+
+    def __call__(self, key):
+        self.gate.wait(10)
+        if key in self.fail:
+            raise OSError(f"no models for {key}")
+        self.built.append(key)
+        return f"engine-{key}"
+
+def loaded(cache):
+    return [model["config"] for model in cache.status()["models"] if model["state"] == STATE_READY]
+
+def test_least_recently_used_engine_is_evicted():
+    factory = Factory()
+    cache = EngineCache("test", factory, engine_size_mb=100)
+    cache.configure(max_engines=2)
+    cache.get("en")
+    cache.get("ja")
+    cache.get("en")  # ja is now the least recently used
+    cache.get("ko")
+    assert loaded(cache) == ["ko", "en"]
+    assert factory.built == ["en", "ja", "ko"]
+
+def test_memory_budget_evicts_engines():
+    cache = EngineCache("test", Factory(), engine_size_mb=300)
+    cache.configure(max_engines=5, memory_budget_mb=700)
+    for key in ("en", "ja", "ko"):
+        cache.get(key)
+    assert loaded(cache) == ["ko", "ja"]
+    assert cache.status()["memory_mb"] == 600
+
+def test_new_engine_is_kept_even_over_budget():
+    cache = EngineCache("test", Factory(), engine_size_mb=300)
+    cache.configure(memory_budget_mb=100)
+    cache.get("en")
+    cache.get("ja")
+    assert loaded(cache) == ["ja"]
+
+def test_lease_yields_the_engine():
+    cache = EngineCache("test", Factory(), engine_size_mb=100)
+    with cache.lease("en", wait=True) as engine:
+        assert engine == "engine-en"
+
+def test_missing_engine_warms_in_the_background():
+    factory = Factory(hold=True)
+    cache = EngineCache("test", factory, engine_size_mb=100)
+    with pytest.raises(EngineWarming):
+        cache.ensure("en")
+    assert cache.status()["models"] == [{"config": "en", "state": STATE_LOADING}]
+    with pytest.raises(EngineWarming):
+        cache.ensure("en")
+
+    factory.gate.set()
+    wait_for(lambda: loaded(cache) == ["en"])
+    assert cache.ensure("en").engine == "engine-en"
+    assert factory.built == ["en"]
+
+def test_warmup_runs_before_the_engine_serves():
+    gate = threading.Event()
+    warmed = []
+    def warmup(engine):
+        gate.wait(10)
+        warmed.append(engine)
+    cache = EngineCache("test", Factory(), engine_size_mb=100, warmup=warmup)
+    cache.preload("en")
+    wait_for(lambda: cache.status()["models"] == [{"config": "en", "state": STATE_WARMING}])
+    with pytest.raises(EngineWarming):
+        cache.ensure("en")
+    gate.set()
+    wait_for(lambda: loaded(cache) == ["en"])
+    assert warmed == ["engine-en"]
+
+def test_failed_build_is_reported_once_then_retried():
+    factory = Factory(fail={"en"})
+    cache = EngineCache("test", factory, engine_size_mb=100)
+    cache.preload("en")
+    wait_for(lambda: any(model["state"] == STATE_FAILED for model in cache.status()["models"]))
+    with pytest.raises(RuntimeError, match="no models for en"):
+        cache.ensure("en")
+
+    factory.fail.clear()
+    with pytest.raises(EngineWarming):
+        cache.ensure("en")
+    wait_for(lambda: loaded(cache) == ["en"])
+
+def test_get_raises_when_the_build_fails():
+    cache = EngineCache("test", Factory(fail={"en"}), engine_size_mb=100)
+    with pytest.raises(RuntimeError, match="Cannot initialize"):
+        cache.get("en")
+
+def test_wait_returns_once_the_background_build_finishes():
+    factory = Factory(hold=True)
+    cache = EngineCache("test", factory, engine_size_mb=100)
+    with pytest.raises(EngineWarming, match="after 0.05 seconds"):
+        cache.wait("en", 0.05)
+    threading.Timer(0.05, factory.gate.set).start()
+    assert cache.wait("en", 10).engine == "engine-en"
+    assert factory.built == ["en"]
+
+def test_wait_raises_when_the_build_fails():
+    cache = EngineCache("test", Factory(fail={"en"}), engine_size_mb=100)
+    with pytest.raises(RuntimeError, match="no models for en"):
+        cache.wait("en", 10)
@@ -0,0 +1,89 @@
+"""Engines that are still loading: "warming" for v2 clients, a wait or an error for legacy ones."""
+import asyncio
+import json
+import os
+import numpy as np
+import pytest
+
+from engine_cache import EngineWarming
+from ocr_server import OcrScheduler
+from tests.helpers import Client, FakeEngine
+
+class WarmingEngine(FakeEngine):
+    """Engine module whose models never finish loading."""
+
+    def process_image(self, image, timer=None, **options):
+        self.calls.append(options)
+        return {"status": "warming", "message": "rapidocr engine for latin is warming up, try again shortly"}
+
+@pytest.fixture
+def stub_engine(server, monkeypatch):
+    """Register the process pool test engine as "stub", not loaded yet."""
+    monkeypatch.setitem(server.OCR_ENGINES, "stub", (os.path.join("tests", "engines"), "stub_engine"))
+    monkeypatch.setitem(server.engine_import_locks, "stub", server.threading.Lock())
+    monkeypatch.setattr(server, "engine_states", {})
+    return "stub"
+
+def test_waiting_request_loads_the_engine(server, stub_engine):
+    module = server.get_engine(stub_engine, wait=1.0)
+    assert module.__name__ == "stub_engine"
+    assert server.engine_modules[stub_engine] is module
+    assert server.engine_states[stub_engine]["state"] == "ready"
+
+def test_wait_gives_up_after_its_timeout(server, stub_engine):
+    lock = server.engine_import_locks[stub_engine]
+    lock.acquire()  # Another thread is importing the engine
+    try:
+        with pytest.raises(EngineWarming):
+            server.get_engine(stub_engine, wait=0.05)
+    finally:
+        lock.release()
+
+def test_legacy_client_gets_an_error_instead_of_warming(server):
+    engine = WarmingEngine()
+    server.engine_modules["rapidocr"] = engine
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("read_image|en|rapidocr|False|False")
+            return await client.receive_legacy()
+        finally:
+            await client.close()
+    response = asyncio.run(scenario())
+    assert response["status"] == "error" and "warming up" in response["message"]
+
+def test_legacy_client_waits_for_the_models_of_its_language(server, fake_engine_factory):
+    engine = fake_engine_factory()
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("read_image|ja|rapidocr|False|False")
+            legacy = await client.receive_legacy()
+            await client.send("hello|protocol=2")
+            await client.receive_legacy()
+            await client.send("read_image|ko|rapidocr|False|False", request_id=4)
+            await client.receive_frame()
+        finally:
+            await client.close()
+        return legacy
+    assert asyncio.run(scenario())["status"] == "success"
+    assert engine.ENGINE_CACHE.waited == [("ja", "default")]
+    assert [call["lang"] for call in engine.calls] == ["ja", "ko"]
+
+def test_v2_client_gets_warming(server):
+    server.engine_modules["rapidocr"] = WarmingEngine()
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("hello|protocol=2")
+            await client.receive_legacy()
+            body = np.zeros((2, 4), dtype=np.uint8).tobytes()
+            await client.send("read_frame|en|rapidocr|False|False|width=4|height=2|format=GRAY", body, request_id=3)
+            return await client.receive_frame()
+        finally:
+            await client.close()
+    _, _, request_id, payload = asyncio.run(scenario())
+    assert request_id == 3 and json.loads(payload)["status"] == "warming"
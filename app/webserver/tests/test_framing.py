@@ -0,0 +1,127 @@
+"""Protocol v2 framing: frame headers, negotiation with hello and tagged responses."""
+import asyncio
+import json
+import numpy as np
+import pytest
+
+from ocr_server import OcrScheduler
+from tests.helpers import Client
+
+def read_frame_from(server, data):
+    """Run receive_frame on a reader holding data and then the end of the stream."""
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await server.receive_frame(reader)
+    return asyncio.run(scenario())
+
+class RecordingWriter:
+    """Collects what write_message queues on a transport."""
+
+    def __init__(self):
+        self.data = b""
+
+    def is_closing(self):
+        return False
+
+    def writelines(self, parts):
+        self.data += b"".join(parts)
+
+def test_frame_header_and_payload(server):
+    data = server.FRAME_HEADER.pack(server.FRAME_MAGIC, server.MSG_COMMAND, 0x01, 42, 5) + b"hello"
+    assert read_frame_from(server, data) == (server.MSG_COMMAND, 0x01, 42, b"hello")
+
+def test_empty_payload(server):
+    data = server.FRAME_HEADER.pack(server.FRAME_MAGIC, server.MSG_COMMAND, 0, 1, 0)
+    assert read_frame_from(server, data) == (server.MSG_COMMAND, 0, 1, b"")
+
+@pytest.mark.parametrize("cut", [0, 5, 14])
+def test_truncated_frame_is_a_disconnect(server, cut):
+    data = server.FRAME_HEADER.pack(server.FRAME_MAGIC, server.MSG_COMMAND, 0, 1, 4) + b"data"
+    assert read_frame_from(server, data[:cut]) is None
+
+def test_bad_magic_rejected(server):
+    data = server.FRAME_HEADER.pack(b"XX", server.MSG_COMMAND, 0, 1, 0)
+    with pytest.raises(ValueError, match="magic"):
+        read_frame_from(server, data)
+
+def test_oversized_frame_rejected(server):
+    data = server.FRAME_HEADER.pack(server.FRAME_MAGIC, server.MSG_COMMAND, 0, 1, server.MAX_FRAME_SIZE + 1)
+    with pytest.raises(ValueError, match="exceeds"):
+        read_frame_from(server, data)
+
+def test_write_message_framing(server):
+    legacy = RecordingWriter()
+    server.write_message(legacy, b'{"a": 1}')
+    assert legacy.data == b'8\r\n{"a": 1}'
+
+    framed = RecordingWriter()
+    server.write_message(framed, b"abc", server.PROTOCOL_V2, 7, server.MSG_PARTIAL, server.FLAG_COMPRESSED)
+    header = framed.data[:server.FRAME_HEADER.size]
+    assert server.FRAME_HEADER.unpack(header) == (server.FRAME_MAGIC, server.MSG_PARTIAL, server.FLAG_COMPRESSED, 7, 3)
+    assert framed.data[server.FRAME_HEADER.size:] == b"abc"
+
+def test_frame_from_buffer_wraps_the_body(server):
+    pixels = bytes(range(24))
+    frame = server.frame_from_buffer(memoryview(pixels), {"width": "4", "height": "2", "format": "RGB", "stride": "12"})
+    assert frame.shape == (2, 4, 3)
+    assert frame[1, 0].tolist() == [12, 13, 14]
+    with pytest.raises(ValueError, match="height"):
+        server.frame_from_buffer(memoryview(pixels), {"width": "4"})
+
+def test_hello_switches_the_connection_to_v2(server, fake_engine_factory):
+    engine = fake_engine_factory()
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("hello|protocol=2")
+            hello = await client.receive_legacy()
+            body = np.zeros((2, 4), dtype=np.uint8).tobytes()
+            await client.send("read_frame|en|rapidocr|False|False|width=4|height=2|format=GRAY", body, request_id=7)
+            response = await client.receive_frame()
+            await client.send("no_such_command", request_id=8)
+            unknown = await client.receive_frame()
+        finally:
+            await client.close()
+        return hello, response, unknown
+    hello, response, unknown = asyncio.run(scenario())
+    assert hello["protocol"] == server.PROTOCOL_V2
+    msg_type, flags, request_id, payload = response
+    assert (msg_type, flags, request_id) == (server.MSG_RESPONSE, 0, 7)
+    result = json.loads(payload)
+    assert result["status"] == "success" and result["request_id"] == 7
+    assert result["results"][0]["text"] == "Quest"
+    assert len(engine.calls) == 1
+    assert unknown[2] == 8 and json.loads(unknown[3])["status"] == "error"
+
+def test_hello_without_protocol_keeps_legacy_framing(server):
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("hello|protocol=3")
+            hello = await client.receive_legacy()
+            await client.send("no_such_command")
+            unknown = await client.receive_legacy()
+        finally:
+            await client.close()
+        return hello, unknown
+    hello, unknown = asyncio.run(scenario())
+    assert hello["protocol"] == server.PROTOCOL_LEGACY
+    assert unknown["status"] == "error"
+
+def test_bad_magic_closes_the_connection(server):
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("hello|protocol=2")
+            await client.receive_legacy()
+            client.writer.write(server.FRAME_HEADER.pack(b"XX", server.MSG_COMMAND, 0, 1, 0))
+            await client.writer.drain()
+            return await asyncio.wait_for(client.reader.read(), 5)
+        finally:
+            await client.close()
+    assert asyncio.run(scenario()) == b""
@@ -0,0 +1,65 @@
+"""Line crops, their digests and the cache of recognized lines."""
+import numpy as np
+import cv2
+
+from text_lines import LineCache, crop_text_line, line_digest
+
+def text_crop(text):
+    image = np.full((40, 200, 3), 255, dtype=np.uint8)
+    cv2.putText(image, text, (5, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA)
+    return image
+
+def test_crop_of_an_axis_aligned_box():
+    image = np.arange(60 * 80, dtype=np.uint16).reshape(60, 80).astype(np.float32)
+    crop = crop_text_line(image, [[10, 5], [50, 5], [50, 25], [10, 25]])
+    assert crop.shape == (20, 40)
+    assert crop[0, 0] == image[5, 10]
+
+def test_tall_crop_is_turned_horizontal():
+    image = np.zeros((100, 100, 3), dtype=np.uint8)
+    crop = crop_text_line(image, [[10, 10], [20, 10], [20, 60], [10, 60]])
+    assert crop.shape[:2] == (10, 50)
+
+def test_digest_ignores_colour():
+    crop = text_crop("Quest Log")
+    assert line_digest(crop) == line_digest(cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY))
+    assert line_digest(crop) == line_digest(crop.copy())
+    assert line_digest(crop) != line_digest(text_crop("Quest Lag"))
+
+def test_lookup_after_store():
+    cache = LineCache("test")
+    crops = [text_crop("Attack"), text_crop("Defend")]
+    keys, found = cache.lookup("latin", crops)
+    assert found == [None, None]
+    cache.store(keys, ["Attack", "Defend"], [0.9, 0.8])
+
+    keys, found = cache.lookup("latin", [crops[1], text_crop("Flee"), crops[0]])
+    assert found == [("Defend", 0.8), None, ("Attack", 0.9)]
+    status = cache.status()
+    assert (status["entries"], status["hits"], status["misses"], status["hit_rate"]) == (2, 2, 3, 0.4)
+
+def test_models_do_not_share_lines():
+    cache = LineCache("test")
+    crop = text_crop("Attack")
+    keys, _ = cache.lookup("latin", [crop])
+    cache.store(keys, ["Attack"], [0.9])
+    assert cache.lookup("japan", [crop])[1] == [None]
+
+def test_least_recently_used_line_is_evicted():
+    cache = LineCache("test", max_entries=2)
+    crops = [text_crop(text) for text in ("One", "Two", "Three")]
+    for crop, text in zip(crops, ("One", "Two", "Three")):
+        keys, _ = cache.lookup("latin", [crop])
+        cache.store(keys, [text], [1.0])
+    _, found = cache.lookup("latin", crops)
+    assert found == [None, ("Two", 1.0), ("Three", 1.0)]
+
+    cache.configure(1)
+    assert cache.status()["entries"] == 1
+
+def test_disabled_cache_stores_nothing():
+    cache = LineCache("test", max_entries=0)
+    keys, found = cache.lookup("latin", [text_crop("Attack")])
+    assert keys == [None] and found == [None]
+    cache.store(keys, ["Attack"], [0.9])
+    assert cache.status()["entries"] == 0 and cache.status()["hit_rate"] is None
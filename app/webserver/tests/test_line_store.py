@@ -0,0 +1,82 @@
+"""SQLite store of recognized lines shared across restarts."""
+import sqlite3
+import numpy as np
+import cv2
+
+from line_store import LineStore
+from text_lines import LineCache
+
+def digest(i):
+    return i.to_bytes(16, "big")
+
+def test_lines_survive_a_restart(tmp_path):
+    path = str(tmp_path / "lines.sqlite")
+    store = LineStore(path)
+    store.put_many("latin", [(digest(1), "Attack", 0.9), (digest(2), "Defend", 0.8)])
+    store.put_many("japan", [(digest(1), "攻撃", 0.7)])
+    store.close()
+
+    reopened = LineStore(path)
+    try:
+        assert reopened.get_many("latin", [digest(1), digest(2), digest(3)]) == {
+            digest(1): ("Attack", 0.9), digest(2): ("Defend", 0.8)
+        }
+        assert reopened.get_many("japan", [digest(1)]) == {digest(1): ("攻撃", 0.7)}
+        assert reopened.get_many("latin", []) == {}
+    finally:
+        reopened.close()
+
+def test_newer_line_replaces_older(tmp_path):
+    store = LineStore(str(tmp_path / "lines.sqlite"))
+    store.put_many("latin", [(digest(1), "Attak", 0.5)])
+    store.put_many("latin", [(digest(1), "Attack", 0.9)])
+    store.close()
+    reopened = LineStore(store.path)
+    assert reopened.get_many("latin", [digest(1)]) == {digest(1): ("Attack", 0.9)}
+    reopened.close()
+
+def test_lookups_over_the_query_limit(tmp_path):
+    store = LineStore(str(tmp_path / "lines.sqlite"))
+    store.put_many("latin", [(digest(i), str(i), 1.0) for i in range(1200)])
+    store.close()
+    reopened = LineStore(store.path)
+    found = reopened.get_many("latin", (digest(i) for i in range(0, 1300, 2)))
+    reopened.close()
+    assert len(found) == 600 and found[digest(1198)] == ("1198", 1.0)
+
+def test_compaction_drops_least_recently_used_lines(tmp_path):
+    path = str(tmp_path / "lines.sqlite")
+    store = LineStore(path, max_mb=0.1)
+    connection = store._connect()
+    text = "x" * 200
+    LineStore._write(connection, [("put", "latin", None, [(digest(i), text, 1.0) for i in range(1000)])])
+    LineStore._write(connection, [("put", "latin", None, [(digest(i), text, 1.0) for i in range(1000, 1050)])])
+    store._compact(connection)
+    connection.close()
+    store.close()
+
+    rows = sqlite3.connect(path).execute("SELECT digest FROM lines").fetchall()
+    kept = {int.from_bytes(row[0], "big") for row in rows}
+    assert 50 < len(kept) < 1050
+    assert set(range(1000, 1050)) <= kept
+    assert LineStore._size(sqlite3.connect(path)) <= store.max_bytes
+
+def test_line_cache_starts_warm_from_the_store(tmp_path):
+    path = str(tmp_path / "lines.sqlite")
+    crop = np.full((40, 200, 3), 255, dtype=np.uint8)
+    cv2.putText(crop, "Attack", (5, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA)
+
+    cache = LineCache("test")
+    cache.open_store(path, 16)
+    keys, _ = cache.lookup("latin", [crop])
+    cache.store(keys, ["Attack"], [0.9])
+    cache.line_store.close()
+
+    restarted = LineCache("test")
+    restarted.open_store(path, 16)
+    try:
+        assert restarted.lookup("latin", [crop])[1] == [("Attack", 0.9)]
+        assert restarted.status()["store_hits"] == 1
+        assert LineCache("other").store_model("latin") != restarted.store_model("latin")
+    finally:
+        restarted.line_store.close()
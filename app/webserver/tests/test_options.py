@@ -0,0 +1,53 @@
+"""Boolean arguments and options of client commands."""
+import asyncio
+import pytest
+
+from ocr_server import OcrScheduler, parse_flag
+from tests.helpers import Client
+
+@pytest.mark.parametrize("value", ["True", "true", "1", "yes", "ON", True])
+def test_true_spellings(value):
+    assert parse_flag(value) is True
+
+@pytest.mark.parametrize("value", ["False", "false", "0", "no", "Off", False])
+def test_false_spellings(value):
+    assert parse_flag(value) is False
+
+@pytest.mark.parametrize("value", ["", "maybe", "2"])
+def test_other_values_rejected(value):
+    with pytest.raises(ValueError):
+        parse_flag(value)
+
+def test_hello_options_accept_every_spelling(server):
+    async def scenario():
+        client = await Client.connect(server)
+        try:
+            await client.send("hello|timings=1|incremental=yes")
+            reply = await client.receive_legacy()
+            await client.send("hello|timings=maybe")
+            rejected = await client.receive_legacy()
+        finally:
+            await client.close()
+        return reply, rejected
+    reply, rejected = asyncio.run(scenario())
+    assert reply["timings"] is True and reply["incremental"] is True
+    assert rejected["status"] == "error"
+
+def test_request_options_accept_every_spelling(server, fake_engine_factory):
+    engine = fake_engine_factory()
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        client = await Client.connect(server)
+        try:
+            await client.send("read_image|en|rapidocr|no|0|timings=1|cache=off")
+            response = await client.receive_legacy()
+            await client.send("read_image|en|rapidocr|False|False|progressive=perhaps")
+            rejected = await client.receive_legacy()
+        finally:
+            await client.close()
+        return response, rejected
+    response, rejected = asyncio.run(scenario())
+    assert response["status"] == "success" and "timings" in response
+    assert response["char_level"] == "False"
+    assert engine.calls[0]["preprocess_images"] is False
+    assert rejected["status"] == "error"
@@ -0,0 +1,77 @@
+"""Preprocessing mode decisions: hysteresis and per-scene caching."""
+import numpy as np
+import pytest
+
+import image_pipeline
+from image_pipeline import HDR_HYSTERESIS, HDR_MEAN_ABOVE, HDR_STD_BELOW, PreprocessController, choose_mode
+
+class NoteTimer:
+    """Records the notes a decision leaves on the request timer."""
+
+    def __init__(self):
+        self.notes = {}
+
+    def lap(self, name):
+        pass
+
+    def note(self, key, value):
+        self.notes[key] = value
+
+def screen(level, contrast=60):
+    """Grey frame of noise around level with a standard deviation of about contrast."""
+    frame = np.random.default_rng(level).normal(level, contrast, (240, 320))
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+def decide(controller, frame):
+    timer = NoteTimer()
+    mode = controller.decide(frame, timer)
+    return mode, timer.notes["preprocess_decision"]
+
+@pytest.mark.parametrize("mean, std, mode", [
+    (128, 60, 'basic'),
+    (128, HDR_STD_BELOW - 1, 'enhanced'),
+    (HDR_MEAN_ABOVE + 1, 60, 'enhanced'),
+    (30, 60, 'enhanced')
+])
+def test_thresholds(mean, std, mode):
+    assert choose_mode(mean, std) == mode
+
+def test_enhanced_is_kept_near_the_threshold():
+    std = HDR_STD_BELOW + HDR_HYSTERESIS / 2
+    assert choose_mode(128, std) == 'basic'
+    assert choose_mode(128, std, current='basic') == 'basic'
+    assert choose_mode(128, std, current='enhanced') == 'enhanced'
+    assert choose_mode(128, HDR_STD_BELOW + HDR_HYSTERESIS + 1, current='enhanced') == 'basic'
+
+def test_decision_is_kept_within_a_scene():
+    controller = PreprocessController()
+    frame = screen(128)
+    assert decide(controller, frame) == ('basic', 'first')
+    nudged = frame.copy()
+    nudged[:16] = 0  # A caption appearing in a strip of the frame is not a new scene
+    assert decide(controller, nudged) == ('basic', 'cached')
+    assert controller.decisions == 1
+
+def test_scene_change_decides_again():
+    controller = PreprocessController()
+    decide(controller, screen(128))
+    assert decide(controller, screen(230, contrast=10)) == ('enhanced', 'scene')
+    assert decide(controller, screen(128)[:200]) == ('basic', 'scene')
+    assert controller.decisions == 3
+
+def test_old_decision_is_renewed(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(image_pipeline.time, "monotonic", lambda: clock[0])
+    controller = PreprocessController()
+    decide(controller, screen(128))
+    clock[0] += image_pipeline.DECISION_SECONDS + 1
+    assert decide(controller, screen(128)) == ('basic', 'timer')
+
+def test_sessions_have_their_own_controller(monkeypatch):
+    monkeypatch.setattr(image_pipeline, "_controllers", type(image_pipeline._controllers)())
+    monkeypatch.setattr(image_pipeline, "MAX_PREPROCESS_SESSIONS", 2)
+    first = image_pipeline.preprocess_controller("a/")
+    assert image_pipeline.preprocess_controller("a/") is first
+    assert image_pipeline.preprocess_controller("b/") is not first
+    image_pipeline.preprocess_controller("c/")
+    assert image_pipeline.preprocess_controller("a/") is not first
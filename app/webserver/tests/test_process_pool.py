@@ -0,0 +1,77 @@
+"""Engines in worker processes, with a stub engine module the workers import."""
+import os
+import time
+import numpy as np
+import pytest
+
+from engine_cache import EngineWarming
+from metrics import StageTimer
+from ocr_process_pool import ProcessWorkerPool, worker_settings
+from tests.conftest import WEBSERVER_DIR
+from tests.helpers import wait_for
+
+ENGINES = {"stub": (os.path.join("tests", "engines"), "stub_engine")}
+
+@pytest.fixture
+def pool():
+    settings = worker_settings(ENGINES, WEBSERVER_DIR, {"stub": ["ja"]}, max_engines=1, memory_budget_mb=0)
+    pool = ProcessWorkerPool(2, settings)
+    pool.start()
+    yield pool
+    pool.stop()
+
+def run(pool, source, timer=None, engine="stub", timeout=30.0, **options):
+    """process_image on the pool, asking again while the workers are still loading the engine."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            result = pool.process_image(engine, source, timer or StageTimer(), **options)
+        except EngineWarming:
+            result = {"status": "warming"}
+        if result["status"] != "warming" or time.monotonic() > deadline:
+            return result
+        time.sleep(0.05)
+
+def test_frame_reaches_the_worker(pool):
+    frame = np.arange(6 * 8 * 3, dtype=np.uint8).reshape(6, 8, 3)
+    timer = StageTimer()
+    result = run(pool, frame, timer, lang="ja")
+    assert result["status"] == "success"
+    assert result["pid"] != os.getpid()
+    assert result["shape"] == [6, 8, 3] and result["sum"] == int(frame.sum())
+    assert result["lang"] == "ja" and result["preloaded"] == [("ja", None)]
+    assert "recognize" in timer.stages and "dispatch" in timer.stages
+
+def test_strided_frame_is_copied_whole(pool):
+    padded = np.arange(4 * 16, dtype=np.uint8).reshape(4, 16)
+    frame = padded[:, :12].reshape(4, 4, 3)
+    result = run(pool, frame)
+    assert result["shape"] == [4, 4, 3] and result["sum"] == int(frame.sum())
+
+def test_image_path_is_passed_on(pool):
+    assert run(pool, "frame.png")["path"] == "frame.png"
+
+def test_refine_adds_characters(pool):
+    result = run(pool, "frame.png", refine=True)
+    assert [char["text"] for char in result["characters"]] == list("Quest")
+
+def test_lines_stream_from_the_worker(pool):
+    batches = []
+    result = run(pool, "frame.png", on_lines=batches.append)
+    assert batches == [result["results"]]
+    run(pool, "frame.png")
+    assert len(batches) == 1
+
+def test_engine_that_cannot_load_is_an_error(pool):
+    result = run(pool, "frame.png", engine="missing")
+    assert result["status"] == "error" and "cannot be loaded" in result["message"]
+
+def test_exited_worker_is_restarted(pool):
+    run(pool, "frame.png")
+    worker = pool.status()["workers"][0]
+    os.kill(worker["pid"], 9)
+    wait_for(lambda: pool.status()["workers"][0]["pid"] != worker["pid"], timeout=30)
+    status = pool.status()
+    assert status["processes"] == 2 and status["workers"][0]["restarts"] == 1
+    pids = {run(pool, "frame.png")["pid"] for _ in range(4)}
+    assert worker["pid"] not in pids
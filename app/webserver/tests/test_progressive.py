@@ -0,0 +1,50 @@
+"""Progressive responses: MSG_PARTIAL messages while a frame is recognized, then MSG_END."""
+import json
+
+from metrics import StageTimer
+
+class BatchingEngine:
+    """Engine module stand-in that reports its lines in two recognition batches."""
+
+    PROGRESSIVE_LINES = True
+
+    def __init__(self):
+        self.events = []
+
+    def process_image(self, image, timer=None, on_lines=None, **options):
+        lines = [{"text": text, "confidence": 0.9, "rect": [[0, 0], [10, 0], [10, 5], [0, 5]]} for text in ("a", "b", "c")]
+        for batch in (lines[:2], lines[2:]):
+            self.events.append("recognized")
+            if on_lines is not None:
+                on_lines(batch)
+        return {"status": "success", "results": lines, "processing_time_seconds": 0.0, "char_level": "False"}
+
+    def release_gpu_resources(self):
+        pass
+
+def run(server, engine):
+    messages = []
+    def emit(msg_type, payload, flags=0):
+        engine.events.append("emit")
+        messages.append((msg_type, json.loads(payload)))
+    for name in server.OCR_ENGINES:
+        server.engine_modules[name] = engine
+    final, _ = server.run_ocr_task("rapidocr", server.IMAGE_PATH, "en", "False", False, {"request_id": 7},
+                                   emit=emit, timer=StageTimer())
+    return messages, json.loads(final)
+
+def test_partial_sent_per_recognition_batch(server):
+    engine = BatchingEngine()
+    messages, final = run(server, engine)
+    assert engine.events == ["recognized", "emit", "recognized", "emit"]
+    assert [msg_type for msg_type, _ in messages] == [server.MSG_PARTIAL, server.MSG_PARTIAL]
+    assert [[line["text"] for line in body["results"]] for _, body in messages] == [["a", "b"], ["c"]]
+    assert all(body["request_id"] == 7 and body["status"] == "partial" for _, body in messages)
+    assert final["lines"] == 3
+
+def test_engines_without_batches_send_one_partial(server):
+    engine = BatchingEngine()
+    engine.PROGRESSIVE_LINES = False
+    messages, final = run(server, engine)
+    assert engine.events == ["recognized", "recognized", "emit"]
+    assert [len(body["results"]) for _, body in messages] == [3]
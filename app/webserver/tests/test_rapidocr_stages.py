@@ -0,0 +1,72 @@
+"""detect_and_recognize_batch against a stand-in for a RapidOCR 3 engine."""
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+process_image_rapidocr = pytest.importorskip("process_image_rapidocr")
+if process_image_rapidocr.TextRecInput is None:
+    pytest.skip("RapidOCR without the stage API", allow_module_level=True)
+
+BOX = np.array([[10, 10], [90, 10], [90, 30], [10, 30]], dtype=np.float32)
+
+class FakeRecognizer:
+    rec_batch_num = 2
+
+    def __init__(self, events):
+        self.events = events
+
+    def __call__(self, rec_input):
+        self.events.append(("rec", len(rec_input.img)))
+        return SimpleNamespace(txts=["Quest"] * len(rec_input.img), scores=[0.9] * len(rec_input.img))
+
+class FakeEngine:
+    """Keeps the stage flags of each call on itself, as RapidOCR.update_params does."""
+
+    def __init__(self, use_cls, lines=1):
+        self.cfg = SimpleNamespace(Global=SimpleNamespace(use_det=True, use_cls=use_cls, use_rec=True))
+        self.use_det, self.use_cls, self.use_rec = True, use_cls, True
+        self.classified = 0
+        self.lines = lines
+        self.events = []
+        self.text_rec = FakeRecognizer(self.events)
+
+    def __call__(self, image, use_det=None, use_cls=None, use_rec=None, **options):
+        self.use_det = self.use_det if use_det is None else use_det
+        self.use_cls = self.use_cls if use_cls is None else use_cls
+        self.use_rec = self.use_rec if use_rec is None else use_rec
+        return SimpleNamespace(boxes=np.array([BOX + [0, 25 * i] for i in range(self.lines)]))
+
+    def text_cls(self, crops):
+        self.classified += len(crops)
+        return SimpleNamespace(img_list=crops)
+
+def frame():
+    return np.full((200, 120, 3), 255, dtype=np.uint8)
+
+@pytest.mark.parametrize("use_cls", [True, False])
+def test_angle_classifier_follows_configuration_on_every_call(use_cls):
+    engine = FakeEngine(use_cls)
+    for _ in range(3):
+        results = process_image_rapidocr.detect_and_recognize_batch(engine, [frame()])
+        assert results[0].txts == ["Quest"]
+    assert engine.classified == (3 if use_cls else 0)
+
+def test_engine_flags_restored_after_split_call():
+    engine = FakeEngine(True)
+    process_image_rapidocr.detect_and_recognize_batch(engine, [frame(), frame()])
+    assert (engine.use_det, engine.use_cls, engine.use_rec) == (True, True, True)
+
+def test_lines_reported_after_each_recognition_batch():
+    engine = FakeEngine(False, lines=5)
+    def on_lines(index, lines):
+        engine.events.append(("lines", index, len(lines.txts)))
+    results = process_image_rapidocr.detect_and_recognize_batch(engine, [frame()], on_lines=on_lines)
+    assert engine.events == [
+        ("rec", 2), ("lines", 0, 2), ("rec", 2), ("lines", 0, 2), ("rec", 1), ("lines", 0, 1)
+    ]
+    assert len(results[0].txts) == 5
+
+def test_one_recognizer_call_without_on_lines():
+    engine = FakeEngine(False, lines=5)
+    process_image_rapidocr.detect_and_recognize_batch(engine, [frame()])
+    assert engine.events == [("rec", 5)]
@@ -0,0 +1,83 @@
+"""Cache of encoded responses for repeated frames."""
+import asyncio
+import json
+import numpy as np
+
+from ocr_server import OcrScheduler
+from result_cache import ENTRY_OVERHEAD, ResultCache, frame_digest
+from tests.helpers import Client
+
+def test_digest_depends_on_pixels_and_shape():
+    frame = np.arange(24, dtype=np.uint8).reshape(2, 4, 3)
+    assert frame_digest(frame) == frame_digest(frame.copy())
+    assert len(frame_digest(frame)) == 16
+    assert frame_digest(frame) != frame_digest(frame.reshape(4, 2, 3))
+    changed = frame.copy()
+    changed[1, 3, 2] += 1
+    assert frame_digest(frame) != frame_digest(changed)
+
+def test_digest_of_a_strided_view():
+    padded = np.arange(2 * 16, dtype=np.uint8).reshape(2, 16)
+    view = padded[:, :12].reshape(2, 4, 3)
+    assert frame_digest(view) == frame_digest(np.ascontiguousarray(view))
+
+def test_digest_of_an_image_file(tmp_path):
+    path = tmp_path / "frame.png"
+    path.write_bytes(b"png bytes")
+    assert frame_digest(str(path)) == frame_digest(str(path))
+
+def test_get_and_put():
+    cache = ResultCache(4096)
+    assert cache.get("a") is None
+    cache.put("a", memoryview(b"payload"), 1)
+    entry = cache.get("a")
+    assert entry.payload == b"payload" and entry.flags == 1
+    assert isinstance(entry.payload, bytes)
+    assert cache.status()["bytes"] == len(b"payload") + ENTRY_OVERHEAD
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(3 * (100 + ENTRY_OVERHEAD))
+    for key in ("a", "b", "c"):
+        cache.put(key, b"x" * 100, 0)
+    cache.get("a")
+    cache.put("d", b"x" * 100, 0)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ("a", "c", "d"))
+    assert cache.status()["entries"] == 3
+
+def test_replacing_an_entry_keeps_the_byte_count():
+    cache = ResultCache(4096)
+    cache.put("a", b"x" * 100, 0)
+    cache.put("a", b"x" * 10, 0)
+    status = cache.status()
+    assert status["entries"] == 1 and status["bytes"] == 10 + ENTRY_OVERHEAD
+
+def test_payload_over_the_budget_is_not_stored():
+    cache = ResultCache(100)
+    cache.put("a", b"x" * 100, 0)
+    assert cache.get("a") is None and cache.status()["bytes"] == 0
+
+def test_repeated_frame_is_answered_from_the_cache(server, fake_engine_factory):
+    engine = fake_engine_factory()
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        server.result_cache = ResultCache(1024 * 1024)
+        client = await Client.connect(server)
+        command = "read_frame|en|rapidocr|False|False|width=4|height=2|format=GRAY"
+        responses = []
+        try:
+            await client.send("hello|protocol=2")
+            await client.receive_legacy()
+            for request_id, body, options in ((1, b"\0" * 8, ""), (2, b"\0" * 8, ""), (3, b"\1" * 8, ""),
+                                              (4, b"\0" * 8, "|cache=false")):
+                await client.send(command + options, body, request_id=request_id)
+                responses.append(json.loads((await client.receive_frame())[3]))
+        finally:
+            await client.close()
+        return responses
+    first, repeated, other, uncached = asyncio.run(scenario())
+    assert len(engine.calls) == 3
+    assert "cached" not in first and first["request_id"] == 1
+    assert repeated["cached"] is True and repeated["request_id"] == 2
+    assert repeated["results"] == first["results"]
+    assert "cached" not in other and "cached" not in uncached
@@ -0,0 +1,85 @@
+"""Columnar binary encoding of OCR results."""
+import json
+import numpy as np
+import pytest
+
+from result_codec import (
+    RESULT_HEADER, add_metadata, append_json_fields, bounding_quad, decode_columns, decode_result, encode_result,
+    is_binary_result
+)
+
+def make_result():
+    return {
+        "status": "success",
+        "char_level": "False",
+        "processing_time_seconds": 0.25,
+        "results": [
+            {"rect": [[0.0, 0.0], [40.0, 0.0], [40.0, 10.0], [0.0, 10.0]], "text": "Quest", "confidence": 0.5,
+             "is_character": False},
+            {"rect": [[1.5, 2.0], [3.0, 2.0], [3.0, 4.0], [1.5, 4.0]], "text": "Größe 任务", "confidence": 0.75,
+             "is_character": True}
+        ]
+    }
+
+def test_round_trip():
+    result = make_result()
+    assert decode_result(encode_result(result)) == result
+
+def test_round_trip_ascii_and_empty():
+    result = make_result()
+    result["results"][1]["text"] = ""
+    assert decode_result(encode_result(result))["results"][1]["text"] == ""
+
+    empty = {"status": "success", "results": []}
+    assert decode_result(encode_result(empty)) == empty
+
+def test_columns_are_views():
+    payload = encode_result(make_result())
+    columns = decode_columns(payload)
+    assert columns["coords"].shape == (2, 4, 2)
+    assert columns["coords"][1, 0].tolist() == [1.5, 2.0]
+    assert columns["offsets"].tolist() == [0, 5, 5 + len("Größe 任务".encode("utf-8"))]
+    assert columns["flags"].tolist() == [0, 1]
+    assert not columns["coords"].flags.owndata
+
+def test_polygon_is_sent_as_its_bounding_box():
+    result = make_result()
+    result["results"][0]["rect"] = [[0, 0], [4, 1], [5, 6], [2, 8], [-1, 3]]
+    decoded = decode_result(encode_result(result))
+    assert decoded["results"][0]["rect"] == [[-1, 0], [5, 0], [5, 8], [-1, 8]]
+    assert bounding_quad([[0, 0], [4, 1], [5, 6]]) == [[0, 0], [5, 0], [5, 6], [0, 6]]
+
+def test_add_metadata_keeps_the_columns():
+    result = make_result()
+    payload = encode_result(result)
+    tagged = add_metadata(payload, {"request_id": 9, "cached": True})
+    metadata_size = RESULT_HEADER.unpack_from(payload)[5]
+    assert tagged[RESULT_HEADER.size:len(tagged) - RESULT_HEADER.unpack_from(tagged)[5]] == \
+        payload[RESULT_HEADER.size:len(payload) - metadata_size]
+    decoded = decode_result(tagged)
+    assert decoded["request_id"] == 9 and decoded["cached"] is True
+    assert decoded["results"] == result["results"]
+
+def test_bad_magic_rejected():
+    payload = b"JUNK" + encode_result(make_result())[4:]
+    with pytest.raises(ValueError, match="magic"):
+        decode_columns(payload)
+    with pytest.raises(ValueError, match="magic"):
+        add_metadata(payload, {})
+
+def test_append_json_fields():
+    payload = json.dumps({"status": "success"}).encode()
+    assert json.loads(append_json_fields(payload, {"request_id": 3})) == {"status": "success", "request_id": 3}
+    assert append_json_fields(payload, {}) is payload
+    assert json.loads(append_json_fields(b"{}", {"a": "ü"})) == {"a": "ü"}
+
+def test_only_results_with_detections_are_binary():
+    assert is_binary_result(make_result())
+    assert not is_binary_result({"status": "error", "results": []})
+    assert not is_binary_result({"status": "success", "message": "no results"})
+
+def test_confidences_are_float32():
+    result = make_result()
+    result["results"][0]["confidence"] = 0.1
+    confidence = decode_result(encode_result(result))["results"][0]["confidence"]
+    assert confidence == float(np.float32(0.1))
@@ -0,0 +1,134 @@
+"""OcrScheduler queueing, coalescing, cancellation and batching, and its use by client connections."""
+import asyncio
+import threading
+import pytest
+
+from ocr_server import JobSuperseded, OcrScheduler, SchedulerBusy
+from tests.helpers import wait_for
+
+class Gate:
+    """Job function that blocks until opened and records what ran."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.ran = []
+
+    def __call__(self, name):
+        self.event.wait(10)
+        self.ran.append(name)
+        return name
+
+async def settle(futures):
+    return await asyncio.gather(*futures, return_exceptions=True)
+
+def test_newer_job_replaces_queued_one_under_same_key():
+    async def scenario():
+        gate = Gate()
+        scheduler = OcrScheduler(1, 10)
+        try:
+            running = scheduler.submit("blocker", gate, "blocker")
+            await asyncio.sleep(0.05)
+            old = scheduler.submit("client", gate, "old")
+            new = scheduler.submit("client", gate, "new")
+            assert scheduler.queue_depth == 1
+            gate.event.set()
+            results = await settle([running, old, new])
+        finally:
+            scheduler.stop()
+        assert results[0] == "blocker"
+        assert isinstance(results[1], JobSuperseded)
+        assert results[2] == "new"
+        assert gate.ran == ["blocker", "new"]
+    asyncio.run(scenario())
+
+def test_queue_full_raises_busy():
+    async def scenario():
+        gate = Gate()
+        scheduler = OcrScheduler(1, 1)
+        try:
+            running = scheduler.submit("a", gate, "a")
+            await asyncio.sleep(0.05)
+            queued = scheduler.submit("b", gate, "b")
+            with pytest.raises(SchedulerBusy):
+                scheduler.submit("c", gate, "c")
+            gate.event.set()
+            await settle([running, queued])
+        finally:
+            scheduler.stop()
+    asyncio.run(scenario())
+
+def test_cancel_drops_every_given_key():
+    async def scenario():
+        gate = Gate()
+        scheduler = OcrScheduler(1, 10)
+        try:
+            running = scheduler.submit("blocker", gate, "blocker")
+            await asyncio.sleep(0.05)
+            queued = [scheduler.submit(key, gate, key) for key in ("a", "b", "c")]
+            scheduler.cancel("a", "c", "missing")
+            assert scheduler.queue_depth == 1
+            gate.event.set()
+            results = await settle([running] + queued)
+        finally:
+            scheduler.stop()
+        assert isinstance(results[1], asyncio.CancelledError)
+        assert results[2] == "b"
+        assert isinstance(results[3], asyncio.CancelledError)
+        assert gate.ran == ["blocker", "b"]
+    asyncio.run(scenario())
+
+def test_disconnect_cancels_queued_frames(server, fake_engine_factory):
+    """Frames a client queued, coalesced or not, never run once it has disconnected."""
+    engine = fake_engine_factory(hold=True)
+
+    async def scenario():
+        server.ocr_scheduler = OcrScheduler(1, 10)
+        listener = await asyncio.start_server(server.handle_client_connection, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        commands = ["read_image|en|rapidocr|False|False|coalesce=false"] * 4
+        commands += ["read_image|en|rapidocr|False|False|stream=a", "read_image|en|rapidocr|False|False|stream=b"]
+        for command in commands:
+            writer.write(command.encode())
+            await writer.drain()
+            await asyncio.sleep(0.05)
+        assert server.ocr_scheduler.queue_depth == 5 and server.ocr_scheduler.running == 1
+        writer.close()
+        await asyncio.get_running_loop().run_in_executor(
+            None, wait_for, lambda: server.ocr_scheduler.queue_depth == 0)
+        engine.release()
+        await asyncio.get_running_loop().run_in_executor(
+            None, wait_for, lambda: server.ocr_scheduler.running == 0)
+        listener.close()
+        await listener.wait_closed()
+    asyncio.run(scenario())
+    assert len(engine.calls) == 1
+
+def batch_runner(batches):
+    def run_batch(args_list):
+        batches.append([args[0] for args in args_list])
+        return [(args[0], None) for args in args_list]
+    return run_batch
+
+@pytest.mark.parametrize("max_batch", [1, 2, 3])
+def test_batches_never_exceed_max_batch(max_batch):
+    async def scenario():
+        gate = Gate()
+        batches = []
+        scheduler = OcrScheduler(1, 10, 0.2, max_batch, batch_runner(batches))
+        try:
+            running = scheduler.submit("blocker", gate, "blocker")
+            await asyncio.sleep(0.05)
+            queued = [scheduler.submit(name, gate, name, batch_key="engine") for name in "abcde"]
+            gate.event.set()
+            results = await settle([running] + queued)
+        finally:
+            scheduler.stop()
+        assert results[1:] == list("abcde")
+        return batches, gate.ran
+    batches, single = asyncio.run(scenario())
+    sizes = [len(batch) for batch in batches] + [1 for name in single if name != "blocker"]
+    assert max(sizes) <= max_batch
+    assert sum(sizes) == 5
+    if max_batch == 1:
+        assert batches == []
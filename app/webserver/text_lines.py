@@ -0,0 +1,175 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+from line_store import LineStore
+from result_cache import frame_digest
+
+# Text lines recognized per batch when the profile does not set rec_batch_size. A GPU wants
+# big batches to fill it; on the CPU larger batches mostly add padding to the widest line.
+REC_BATCH_SIZE_CPU = 8
+REC_BATCH_SIZE_GPU = 32
+
+# Recognized lines remembered per engine module, keyed by their normalized crops. HUD labels,
+# menu items and names keep exactly the same pixels across frames even when the frame changes.
+LINE_CACHE_SIZE = 4096
+LINE_HEIGHT = 32  # Height line crops are scaled to before hashing
+LINE_LEVEL_SHIFT = 3  # Low bits of every grey level dropped before hashing, so resampling noise still hits
+
+def default_rec_batch_size(gpu):
+    return REC_BATCH_SIZE_GPU if gpu else REC_BATCH_SIZE_CPU
+
+def crop_text_line(image, box):
+    """
+    Cut one detected text line out of a frame, straightened to a horizontal strip.
+
+    Same crop as the PaddleOCR family of recognizers expects: the quadrilateral is warped
+    onto a rectangle, and a line much taller than wide is turned to lie horizontally.
+
+    Args:
+        image (np.ndarray): Frame the box was detected in.
+        box: Four (x, y) corners, clockwise from top-left.
+
+    Returns:
+        np.ndarray: The line crop.
+    """
+    points = np.asarray(box, dtype=np.float32).reshape(4, 2)
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    width, height = max(width, 1), max(height, 1)
+    target = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    matrix = cv2.getPerspectiveTransform(points, target)
+    crop = cv2.warpPerspective(image, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if height / width >= 1.5:
+        crop = np.rot90(crop)
+    return crop
+
+def crop_text_lines(image, boxes):
+    """Crops of every detected line of a frame, in box order."""
+    return [crop_text_line(image, box) for box in boxes]
+
+def line_digest(crop):
+    """
+    Digest of a line crop after normalization: grey, LINE_HEIGHT pixels high and coarsely quantized.
+    """
+    crop = np.ascontiguousarray(crop)
+    grey = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+    height, width = grey.shape
+    width = max(1, round(width * LINE_HEIGHT / height))
+    normalized = cv2.resize(grey, (width, LINE_HEIGHT), interpolation=cv2.INTER_AREA)
+    normalized >>= LINE_LEVEL_SHIFT
+    return frame_digest(normalized)
+
+class LineCache:
+    """
+    LRU cache of recognized text and confidence per line crop, bounded by an entry count.
+
+    Keys combine the recognition model with line_digest, so engines for other languages or
+    profiles never share entries. Hits and misses are counted for the hit rate in status().
+    
+    With a LineStore opened, lines missing from memory are looked up on disk as well and
+    every newly recognized line is written there, so the cache starts warm after a restart.
+    """
+
+    def __init__(self, name, max_entries=LINE_CACHE_SIZE):
+        """
+        Args:
+            name (str): Engine and version, part of every key in the on-disk store.
+            max_entries (int): Lines kept in memory, 0 to turn the cache off.
+        """
+        self.name = name
+        self.max_entries = max(0, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0  # Hits that came from the on-disk store
+        self.line_store = None
+        self._entries = OrderedDict()  # key -> (text, score), least recently used first
+        self._lock = threading.Lock()
+
+    def configure(self, max_entries):
+        with self._lock:
+            self.max_entries = max(0, max_entries)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def open_store(self, path, max_mb):
+        """Back the cache with the LineStore at path; on failure the cache stays in memory only."""
+        if self.line_store is not None or not self.max_entries:
+            return
+        try:
+            self.line_store = LineStore(path, max_mb)
+        except (sqlite3.Error, OSError) as e:
+            print(f"Cannot open line store {path}: {e}")
+
+    def store_model(self, model):
+        """Model column of this cache's rows in the store; it changes with the crop normalization."""
+        return f"{self.name}|{LINE_HEIGHT}>>{LINE_LEVEL_SHIFT}|{model!r}"
+
+    def lookup(self, model, crops):
+        """
+        Look up the crops of one recognition call.
+
+        Returns:
+            tuple: (keys, one (text, score) or None per crop); None keys when the cache is off.
+        """
+        if not self.max_entries:
+            return [None] * len(crops), [None] * len(crops)
+        keys = [(model, line_digest(crop)) for crop in crops]
+        with self._lock:
+            found = []
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                found.append(entry)
+        missing = [i for i, entry in enumerate(found) if entry is None]
+        stored = {}
+        if missing and self.line_store is not None:
+            stored = self.line_store.get_many(self.store_model(model), {keys[i][1] for i in missing})
+        with self._lock:
+            for i in missing:
+                entry = stored.get(keys[i][1])
+                if entry is not None:
+                    found[i] = self._entries[keys[i]] = entry
+                    self.store_hits += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            hits = sum(entry is not None for entry in found)
+            self.hits += hits
+            self.misses += len(found) - hits
+        return keys, found
+
+    def store(self, keys, texts, scores):
+        """Remember what the recognizer made of the crops behind keys."""
+        if self.line_store is not None:
+            rows = {}
+            for key, text, score in zip(keys, texts, scores):
+                if key is not None:
+                    rows.setdefault(key[0], []).append((key[1], text, score))
+            for model, entries in rows.items():
+                self.line_store.put_many(self.store_model(model), entries)
+        with self._lock:
+            for key, text, score in zip(keys, texts, scores):
+                if key is None:
+                    continue
+                self._entries[key] = (text, score)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def status(self):
+        """Entries, lookups and hit rate, for the stats command."""
+        store = self.line_store.status() if self.line_store is not None else None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "store_hits": self.store_hits,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "store": store
+            }